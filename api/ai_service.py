@@ -2,28 +2,26 @@
 import os
 import json
 import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from config.firebase import db
 from .rag_service import RAGService
+from .llm_cache import LLMCache
+from .fleet_context import FleetContextService
+from .answer_cache import AnswerCache
+from .intent_router import IntentRouter
+from .prompt_builder import PromptBuilder
+from .node_priority import NodePriorityService
+from .health_monitor import HealthMonitor
 from langsmith import traceable
 
-# Import OpenAI
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    print("Warning: openai not installed. Run: pip install openai")
-    OPENAI_AVAILABLE = False
+# OpenAI goes through the shared gateway (pooled client, rate limits, retries, circuit breaker)
+from .llm_gateway import LLMGateway, LLMUnavailableError, OPENAI_AVAILABLE
 
-# Initialize OpenAI client
-openai_client = None
 def _get_openai_client():
-    """Always reads the key fresh from environment."""
-    global openai_client
-    if openai_client is None:
-        api_key = os.getenv('OPENAI_API_KEY')
-        if api_key:
-            openai_client = OpenAI(api_key=api_key)
-    return openai_client
+    """The gateway's pooled OpenAI client; None until OPENAI_API_KEY is set."""
+    return LLMGateway.client("openai")
 
 def _safe_float(val, default=None):
     try:
@@ -31,6 +29,32 @@ def _safe_float(val, default=None):
     except (TypeError, ValueError):
         return default
 
+class _StreamCleaner:
+    """
+    Incremental version of AIChatService._clean_answer: drops '#', collapses
+    3+ newlines to 2 and trims both ends. Whitespace is held back until the
+    next visible character shows whether it's inside the answer or trailing.
+    """
+
+    def __init__(self):
+        self.text     = ""      # everything emitted so far
+        self._pending = ""      # whitespace not yet emitted
+
+    def feed(self, delta):
+        out = []
+        for ch in delta.replace('#', ''):
+            if ch.isspace():
+                self._pending += ch
+                continue
+            if self._pending and self.text + "".join(out):
+                out.append(re.sub(r'\n{3,}', '\n\n', self._pending))
+            self._pending = ""
+            out.append(ch)
+        emitted = "".join(out)
+        self.text += emitted
+        return emitted
+
+
 class AIChatService:
     OPENAI_MODEL = "gpt-4o-mini"
 
@@ -82,20 +106,7 @@ class AIChatService:
     @staticmethod
     def _is_agricultural_question(question):
         """Pre-filter to check if question is agriculture-related (EN & PH)"""
-        agricultural_keywords = [
-            # English
-            'crop', 'soil', 'plant', 'grow', 'farm', 'agriculture', 'seed',
-            'fertilizer', 'irrigation', 'harvest', 'pest', 'weed', 'compost',
-            'nitrogen', 'phosphorus', 'potassium', 'npk', 'ph', 'moisture',
-            'tomato', 'lettuce', 'rice', 'corn', 'wheat', 'vegetable',
-            'fruit', 'garden', 'cultivation', 'organic', 'yield', 'nutrient',
-            # Filipino/Taglish
-            'lupa', 'halaman', 'palay', 'tanim', 'pananim', 'pataba',
-            'tubig', 'ulan', 'ani', 'sakahan', 'magsasaka', 'halumigmig',
-            'kamatis', 'gulay', 'prutas', 'binhi', 'pesteng', 'damo'
-        ]
-        q_lower = question.lower()
-        return any(k in q_lower for k in agricultural_keywords)
+        return IntentRouter.is_agricultural(question)
 
     @staticmethod
     def _is_agricultural_answer(answer):
@@ -106,59 +117,53 @@ class AIChatService:
                  'node', 'reading', 'level', 'sensor', 'mg/kg']
         return any(t in answer.lower() for t in terms)
 
-    # ─────────────────────── MAIN CHATBOT ───────────────────────
-
     @staticmethod
-    def ask_agronomist(user_question, language="en"):
+    def _route_crops(question, node_crops):
         """
-        RAG-enhanced AI chatbot with STRICT agricultural focus.
-        Uses OpenAI GPT-4o-mini as the LLM backend.
+        Crops whose knowledge partitions the question should search:
+        nodes named in the question → their crops; else crops named in the
+        question; else every crop in the fleet. search_knowledge adds "general".
         """
-        # FIX: renamed from 'client' to 'oai_client' to avoid any shadowing
-        oai_client = _get_openai_client()
-        if not OPENAI_AVAILABLE or oai_client is None:
-            return (
-                "AI service not available. Please install the OpenAI library "
-                "and set your OPENAI_API_KEY in the .env file."
-            )
-
-        # Strict language instruction
-        lang_instruction = "You MUST respond in Tagalog/Filipino." if language == 'fil' else "You MUST respond in English."
-
-        # 2. Build Sensor Context with Comparison
-        nodes_ref = db.collection("nodes").stream()
-        nodes_context = []
-
-        for node_doc in nodes_ref:
-            node = node_doc.to_dict()
-            latest = node.get("latest_readings") or node.get("lastReading") or node
-
-            crop = node.get("crop_type", "default")
-            thresholds, source = AIChatService.get_thresholds(crop)
-
-            def get_target(min_key, max_key, unit=""):
-                if thresholds.get(min_key) is not None and thresholds.get(max_key) is not None:
-                    return f"{thresholds[min_key]}-{thresholds[max_key]}{unit}"
-                return "Not specified in profile"
-
-            def get_status(actual_val, min_key, max_key):
-                if actual_val is None:
-                    return "Unknown"
-                if thresholds.get(min_key) is not None and thresholds.get(max_key) is not None:
-                    return "✓ OK" if float(thresholds[min_key]) <= actual_val <= float(thresholds[max_key]) else "⚠ OUT OF RANGE"
-                return "Target Not Specified"
+        named_nodes = IntentRouter.match_names(question, node_crops)
+        named = {crop for name, crop in node_crops.items() if str(name) in named_nodes}
+        if named:
+            return sorted(named)
+        crops = {crop for crop in node_crops.values() if crop and crop != "default"}
+        spoken = {crop.replace("_", " "): crop for crop in crops}
+        mentioned = [spoken[name] for name in IntentRouter.match_names(question, spoken)]
+        return sorted(mentioned or crops)
 
-            # Grab the actual values safely
-            m_act  = _safe_float(latest.get('moisture'))
-            ph_act = _safe_float(latest.get('pH') or latest.get('ph'))
-            t_act  = _safe_float(latest.get('temperature'))
-
-            # Format numbers safely for display
-            fmt_m  = f"{m_act:.1f}"  if m_act  is not None else "N/A"
-            fmt_ph = f"{ph_act:.1f}" if ph_act is not None else "N/A"
-            fmt_t  = f"{t_act:.1f}"  if t_act  is not None else "N/A"
-
-            node_info = f"""
+    @staticmethod
+    def _format_node_context(node):
+        """One node's CURRENT vs TARGET block for the system prompt (node = FleetContextService entry)."""
+        latest     = node.get("latest") or {}
+        crop       = node.get("crop_type") or "default"
+        thresholds = node.get("thresholds") or {}
+        source     = node.get("threshold_source", "")
+
+        def get_target(min_key, max_key, unit=""):
+            if thresholds.get(min_key) is not None and thresholds.get(max_key) is not None:
+                return f"{thresholds[min_key]}-{thresholds[max_key]}{unit}"
+            return "Not specified in profile"
+
+        def get_status(actual_val, min_key, max_key):
+            if actual_val is None:
+                return "Unknown"
+            if thresholds.get(min_key) is not None and thresholds.get(max_key) is not None:
+                return "✓ OK" if float(thresholds[min_key]) <= actual_val <= float(thresholds[max_key]) else "⚠ OUT OF RANGE"
+            return "Target Not Specified"
+
+        # Grab the actual values safely
+        m_act  = _safe_float(latest.get('moisture'))
+        ph_act = _safe_float(latest.get('pH') or latest.get('ph'))
+        t_act  = _safe_float(latest.get('temperature'))
+
+        # Format numbers safely for display
+        fmt_m  = f"{m_act:.1f}"  if m_act  is not None else "N/A"
+        fmt_ph = f"{ph_act:.1f}" if ph_act is not None else "N/A"
+        fmt_t  = f"{t_act:.1f}"  if t_act  is not None else "N/A"
+
+        return f"""
 ### Node: {node.get('node_name', 'Unknown')} ###
 **Crop:** {crop.title()}
 **Reference Source:** {source}
@@ -170,39 +175,161 @@ class AIChatService:
 - NPK: N={latest.get('nitrogen','N/A')}, P={latest.get('phosphorus','N/A')}, K={latest.get('potassium','N/A')} mg/kg
 - Air: {latest.get('air_temperature','N/A')}°C, Humidity: {latest.get('humidity','N/A')}%
 """
-            nodes_context.append(node_info)
-
-        sensor_context = "\n".join(nodes_context) if nodes_context else "No sensor data available."
-
-        # 3. RAG Context from uploaded documents
-        rag_results = RAGService.search_knowledge(user_question, n_results=4)
-        rag_context = ""
 
-        if rag_results:
-            rag_context = "\n**KNOWLEDGE FROM UPLOADED DOCUMENTS:**\n"
-            for res in rag_results:
-                doc_name   = res['metadata'].get('document_name', 'Unknown')
-                crop_tag   = res['metadata'].get('crop_type', '')
-                crop_label = f" [{crop_tag.upper()}]" if crop_tag else ""
-                rag_context += f"\n📄 Source: {doc_name}{crop_label}\n{res['text']}\n"
-        else:
-            rag_context = (
-                "\n**NOTE:** No documents found in Knowledge Library. "
-                "Upload crop-specific documents in Settings for better advice.\n"
-            )
+    # ─────────────────────── CONTEXT GATHERING ───────────────────────
+
+    # Per-input time budget (seconds); an input that misses it is left out of the prompt
+    CONTEXT_TIMEOUTS = {
+        "fleet":  float(os.getenv("CHAT_FLEET_TIMEOUT", 5)),
+        "rag":    float(os.getenv("CHAT_RAG_TIMEOUT", 4)),
+        "alerts": float(os.getenv("CHAT_ALERTS_TIMEOUT", 3)),
+    }
+
+    CONTEXT_WORKERS = int(os.getenv("CHAT_CONTEXT_WORKERS", 8))
+    # A timed-out task keeps its pool worker until the backend answers. Once
+    # this many of one input are stuck, that input is skipped (None at once)
+    # instead of queueing more work behind them.
+    CONTEXT_MAX_STUCK = int(os.getenv("CHAT_CONTEXT_MAX_STUCK", 2))
+
+    _context_pool  = None
+    _context_lock  = threading.Lock()
+    _context_stats = {}
+    _context_stuck = {}     # input → timed-out tasks still running
+
+    @classmethod
+    def _get_context_pool(cls):
+        with cls._context_lock:
+            if cls._context_pool is None:
+                cls._context_pool = ThreadPoolExecutor(
+                    max_workers=cls.CONTEXT_WORKERS,
+                    thread_name_prefix="chat-context",
+                )
+            return cls._context_pool
 
-        # 4. Active Alerts
+    @staticmethod
+    def _fetch_alerts():
         alerts_ref = (
             db.collection("alerts")
             .where("status", "==", "active")
             .limit(5)
             .stream()
         )
-        alerts_list = [a.to_dict().get('message') for a in alerts_ref]
-        alerts_str  = "\n".join([f"⚠️ {msg}" for msg in alerts_list]) if alerts_list else "No active alerts."
+        return [a.to_dict().get('message') for a in alerts_ref]
 
-        # 5. System Prompt
-        system_prompt = f"""You are a professional Agricultural AI Assistant for farmers.
+    @staticmethod
+    def _search_for_question(user_question):
+        # Routing only needs the node → crop map, read from the snapshot already in
+        # memory so this task doesn't wait on the fleet fetch running beside it.
+        # Before the first snapshot load every partition is searched.
+        node_crops = FleetContextService.cached_node_crops()
+        crop_types = AIChatService._route_crops(user_question, node_crops) if node_crops else None
+        return RAGService.search_knowledge(user_question, n_results=4, crop_types=crop_types)
+
+    @classmethod
+    def _gather_context(cls, user_question):
+        """
+        Run the fleet snapshot, knowledge search and alerts query at once.
+        Returns {fleet, rag, alerts, timings}; an input that failed, ran past
+        its CONTEXT_TIMEOUTS budget (queue wait included) or was skipped
+        because its earlier calls are stuck comes back as None.
+        """
+        tasks = {
+            "fleet":  FleetContextService.get_fleet,
+            "rag":    lambda: cls._search_for_question(user_question),
+            "alerts": cls._fetch_alerts,
+        }
+
+        def _timed(fn):
+            result = fn()
+            return result, time.perf_counter()
+
+        started = time.perf_counter()
+        with cls._context_lock:
+            skipped = {name for name in tasks if cls._context_stuck.get(name, 0) >= cls.CONTEXT_MAX_STUCK}
+        pool = cls._get_context_pool()
+        futures = {name: pool.submit(_timed, fn) for name, fn in tasks.items() if name not in skipped}
+
+        context, timings = {}, {}
+        for name in tasks:
+            if name in skipped:
+                context[name] = None
+                timings[name] = {"status": "skipped", "seconds": 0.0}
+                print(f"⚠️ Chat context '{name}' skipped — earlier calls are still stuck")
+                continue
+            future = futures[name]
+            remaining = cls.CONTEXT_TIMEOUTS[name] - (time.perf_counter() - started)
+            try:
+                context[name], finished = future.result(timeout=max(0.0, remaining))
+                timings[name] = {"status": "ok", "seconds": round(finished - started, 3)}
+            except FutureTimeoutError:
+                context[name] = None
+                timings[name] = {"status": "timeout", "seconds": round(time.perf_counter() - started, 3)}
+                # Still queued: drop it. Already running: it holds a worker until it returns
+                if not future.cancel():
+                    cls._track_stuck(name, future)
+                print(f"⚠️ Chat context '{name}' timed out after {cls.CONTEXT_TIMEOUTS[name]}s — answering without it")
+            except Exception as e:
+                context[name] = None
+                timings[name] = {"status": "error", "seconds": round(time.perf_counter() - started, 3)}
+                print(f"⚠️ Chat context '{name}' failed: {e} — answering without it")
+
+        timings["total"] = {"status": "ok", "seconds": round(time.perf_counter() - started, 3)}
+        cls._record_context_timings(timings)
+        context["timings"] = timings
+        return context
+
+    @classmethod
+    def _track_stuck(cls, name, future):
+        with cls._context_lock:
+            cls._context_stuck[name] = cls._context_stuck.get(name, 0) + 1
+
+        def _done(_):
+            with cls._context_lock:
+                cls._context_stuck[name] -= 1
+
+        future.add_done_callback(_done)
+
+    @classmethod
+    def _record_context_timings(cls, timings):
+        with cls._context_lock:
+            for name, timing in timings.items():
+                stats = cls._context_stats.setdefault(
+                    name, {"calls": 0, "timeouts": 0, "errors": 0, "skipped": 0,
+                           "total_seconds": 0.0, "max_seconds": 0.0},
+                )
+                stats["calls"] += 1
+                stats["total_seconds"] += timing["seconds"]
+                stats["max_seconds"] = max(stats["max_seconds"], timing["seconds"])
+                if timing["status"] == "timeout":
+                    stats["timeouts"] += 1
+                elif timing["status"] == "error":
+                    stats["errors"] += 1
+                elif timing["status"] == "skipped":
+                    stats["skipped"] += 1
+
+    @classmethod
+    def context_stats(cls):
+        """Per-input gather timings since process start."""
+        with cls._context_lock:
+            return {
+                name: {
+                    "calls":       stats["calls"],
+                    "timeouts":    stats["timeouts"],
+                    "errors":      stats["errors"],
+                    "skipped":     stats["skipped"],
+                    "stuck":       cls._context_stuck.get(name, 0),
+                    "avg_seconds": round(stats["total_seconds"] / stats["calls"], 3),
+                    "max_seconds": round(stats["max_seconds"], 3),
+                }
+                for name, stats in cls._context_stats.items()
+            }
+
+    # ─────────────────────── MAIN CHATBOT ───────────────────────
+
+    # Byte-for-byte the same on every turn, and always first, so OpenAI's
+    # prompt cache can reuse it. Anything that varies per request (language,
+    # sensor data, alerts, knowledge) goes in the message after it.
+    CHAT_INSTRUCTIONS = """You are a professional Agricultural AI Assistant for farmers.
 
 **YOUR ROLE:**
 - You help with farming, crops, soil, and agriculture topics ONLY
@@ -231,7 +358,90 @@ class AIChatService:
 3. DO NOT use rigid headers like "Observation:", "Action:", or "Summary:".
 4. Just provide a brief, easy-to-read paragraph explaining the current conditions. If something is out of range, gently suggest what the user might need to do.
 5. Always bold key numbers, metrics, and units (e.g., **27.8%**, **23.0°C**, **5.5 pH**) so they are easy to read.
-6. {lang_instruction}
+
+**REMEMBER:**
+- Match the farmer's language exactly (English = English, Filipino = Filipino)
+- Use professional, clear Filipino (not conversational Taglish)
+- Be direct and practical
+- Cite specific numbers from the sensor data"""
+
+    # Routes every chat turn to the same cache on OpenAI's side
+    PROMPT_CACHE_KEY = "sprout-hub-chat"
+
+    _usage_lock  = threading.Lock()
+    _usage_stats = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    @classmethod
+    def _record_usage(cls, usage):
+        """Add one response's token usage; cached_tokens is the prefix OpenAI served from its prompt cache."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) if details else 0) or 0
+        with cls._usage_lock:
+            cls._usage_stats["calls"]             += 1
+            cls._usage_stats["prompt_tokens"]     += usage.prompt_tokens or 0
+            cls._usage_stats["cached_tokens"]     += cached
+            cls._usage_stats["completion_tokens"] += usage.completion_tokens or 0
+        print(f"🧮 Chat tokens: {usage.prompt_tokens} in ({cached} cached), {usage.completion_tokens} out")
+
+    @classmethod
+    def usage_stats(cls):
+        """Input tokens split into cached / uncached since process start."""
+        with cls._usage_lock:
+            stats = dict(cls._usage_stats)
+        stats["uncached_tokens"] = stats["prompt_tokens"] - stats["cached_tokens"]
+        stats["cached_ratio"] = (
+            round(stats["cached_tokens"] / stats["prompt_tokens"], 4) if stats["prompt_tokens"] else 0.0
+        )
+        return stats
+
+    @staticmethod
+    def _build_chat_messages(user_question, language="en"):
+        """Static instructions, per-request context (sensor data, alerts, knowledge), the user's question."""
+        # Strict language instruction
+        lang_instruction = "You MUST respond in Tagalog/Filipino." if language == 'fil' else "You MUST respond in English."
+
+        # 2-4. Sensor context, RAG context and active alerts, gathered in parallel
+        context = AIChatService._gather_context(user_question)
+
+        # Sections are fitted to PromptBuilder's token budgets, so the prompt doesn't grow with the fleet
+        sensor_context = PromptBuilder.sensor_context(
+            user_question, context["fleet"] or [], AIChatService._format_node_context,
+        )
+
+        rag_results = context["rag"]
+        if rag_results:
+            # A chunk trimmed to nothing would only add an empty Source block
+            rag_results = [res for res in PromptBuilder.rag_chunks(user_question, rag_results)
+                           if res["text"].strip()]
+        rag_context = ""
+
+        if rag_results:
+            rag_context = "\n**KNOWLEDGE FROM UPLOADED DOCUMENTS:**\n"
+            for res in rag_results:
+                doc_name   = res['metadata'].get('document_name', 'Unknown')
+                crop_tag   = res['metadata'].get('crop_type', '')
+                crop_label = f" [{crop_tag.upper()}]" if crop_tag else ""
+                rag_context += f"\n📄 Source: {doc_name}{crop_label}\n{res['text']}\n"
+        elif rag_results is None:
+            rag_context = (
+                "\n**NOTE:** The Knowledge Library could not be searched just now. "
+                "Answer from the sensor data and general agricultural knowledge.\n"
+            )
+        else:
+            rag_context = (
+                "\n**NOTE:** No documents found in Knowledge Library. "
+                "Upload crop-specific documents in Settings for better advice.\n"
+            )
+
+        if context["alerts"] is None:
+            alerts_str = "Active alerts unavailable right now."
+        else:
+            alerts_str = PromptBuilder.alerts_context(context["alerts"]) if context["alerts"] else "No active alerts."
+
+        # 5. Per-request context; goes after the static CHAT_INSTRUCTIONS prefix
+        context_prompt = f"""**LANGUAGE:** {lang_instruction}
 
 **CURRENT SENSOR DATA vs REFERENCE:**
 {sensor_context}
@@ -239,126 +449,268 @@ class AIChatService:
 **ACTIVE ALERTS:**
 {alerts_str}
 
-{rag_context}
+{rag_context}"""
 
-**REMEMBER:**
-- Match the farmer's language exactly (English = English, Filipino = Filipino)
-- Use professional, clear Filipino (not conversational Taglish)
-- Be direct and practical
-- Cite specific numbers from the sensor data"""
+        return [
+            {"role": "system", "content": AIChatService.CHAT_INSTRUCTIONS},
+            {"role": "system", "content": context_prompt},
+            {"role": "user",   "content": user_question},
+        ]
+
+    @staticmethod
+    def _clean_answer(answer):
+        # Clean up markdown formatting
+        answer = answer.replace('###', '').replace('##', '').replace('#', '')
+
+        # Normalize spacing
+        answer = re.sub(r'\n{3,}', '\n\n', answer)
+        return answer.strip()
+
+    @staticmethod
+    def _refusal(user_question):
+        if IntentRouter.is_filipino(user_question):
+            return (
+                "Pasensya na po, tumutulong lang ako sa mga tanong tungkol sa agrikultura. "
+                "Magtanong po tungkol sa mga pananim, lupa, o pagsasaka. 🌱"
+            )
+        return (
+            "I'm sorry, I can only help with agricultural questions. "
+            "Please ask me about crops, soil, or farming practices. 🌾"
+        )
+
+    @staticmethod
+    def _guardrail_reply(answer, user_question):
+        """Safety check on output: the refusal to show instead, or None if the answer is fine."""
+        if AIChatService._is_agricultural_answer(answer):
+            return None
+        return AIChatService._refusal(user_question)
+
+    @staticmethod
+    def _routed_answer(user_question):
+        """
+        Answer without the LLM when the local router can: a refusal for
+        off-topic questions, a snapshot template for plain value lookups.
+        None means the question needs the model.
+        """
+        route = IntentRouter.route(user_question)
+        if route["intent"] == "off_topic":
+            print("🚫 Off-topic question rejected locally")
+            return AIChatService._refusal(user_question)
+        if route["intent"] == "lookup":
+            print("⚡ Answered from the fleet snapshot")
+            return route["answer"]
+        return None
+
+    @staticmethod
+    def _friendly_error(e):
+        if isinstance(e, LLMUnavailableError):
+            return "⚠️ The AI service is busy or unreachable right now. Please try again in a minute."
+        error_msg = str(e).lower()
+        if "api_key" in error_msg or "authentication" in error_msg or "invalid" in error_msg:
+            return "⚠️ Invalid OpenAI API key. Please check your OPENAI_API_KEY in the .env file."
+        elif "rate_limit" in error_msg:
+            return "⚠️ OpenAI rate limit reached. Please wait a moment and try again."
+        elif "insufficient_quota" in error_msg or "quota" in error_msg:
+            return "⚠️ OpenAI quota exceeded. Please check your billing at platform.openai.com."
+        return f"AI Error: {str(e)}"
+
+    AI_UNAVAILABLE_MESSAGE = (
+        "AI service not available. Please install the OpenAI library "
+        "and set your OPENAI_API_KEY in the .env file."
+    )
+
+    @staticmethod
+    def _lookup_answer(user_question, language):
+        """
+        Check the answer cache. Returns (answer | None, store) where
+        store(answer) keeps a freshly generated answer for the next ask.
+        The cache failing never stops a chat turn.
+        """
+        if not AnswerCache.ENABLED:
+            return None, lambda answer: None
+        try:
+            # One fleet read, so the fingerprint and the entities describe the same state
+            fleet = FleetContextService.get_fleet()
+            fingerprint = AnswerCache.fingerprint(fleet)
+            entities = AnswerCache.entities(user_question, fleet)
+            cached, vector = AnswerCache.lookup(user_question, language, fingerprint, entities)
+        except Exception as e:
+            print(f"⚠️ Answer cache unavailable: {e}")
+            return None, lambda answer: None
+        if cached is not None:
+            print("⚡ Answer cache hit")
+            return cached, lambda answer: None
+        return None, lambda answer: AnswerCache.store(user_question, language, fingerprint, answer, vector, entities)
+
+    @staticmethod
+    def ask_agronomist(user_question, language="en"):
+        """
+        RAG-enhanced AI chatbot with STRICT agricultural focus.
+        Uses OpenAI GPT-4o-mini as the LLM backend.
+        """
+        routed = AIChatService._routed_answer(user_question)
+        if routed:
+            return routed
+
+        # FIX: renamed from 'client' to 'oai_client' to avoid any shadowing
+        oai_client = _get_openai_client()
+        if not OPENAI_AVAILABLE or oai_client is None:
+            return AIChatService.AI_UNAVAILABLE_MESSAGE
+
+        cached, store = AIChatService._lookup_answer(user_question, language)
+        if cached is not None:
+            return cached
+
+        messages = AIChatService._build_chat_messages(user_question, language)
 
         try:
-            # FIX: using oai_client instead of client
-            response = oai_client.chat.completions.create(
+            response = LLMGateway.chat(
                 model=AIChatService.OPENAI_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user",   "content": user_question},
-                ],
+                messages=messages,
                 max_tokens=300,
                 temperature=0.3,
+                prompt_cache_key=AIChatService.PROMPT_CACHE_KEY,
             )
+            AIChatService._record_usage(getattr(response, "usage", None))
+
+            answer = AIChatService._clean_answer(response.choices[0].message.content)
+            replacement = AIChatService._guardrail_reply(answer, user_question)
+            if replacement:
+                return replacement
+            if answer:
+                store(answer)
+            return answer
 
-            answer = response.choices[0].message.content
-
-            # Clean up markdown formatting
-            answer = answer.replace('###', '').replace('##', '').replace('#', '')
-
-            # Normalize spacing
-            answer = re.sub(r'\n{3,}', '\n\n', answer)
-            answer = answer.strip()
-
-            # Safety check on output
-            if not AIChatService._is_agricultural_answer(answer):
-                filipino_indicators = ['ano', 'paano', 'yung', 'mga', 'ba', 'po']
-                is_filipino = any(ind in user_question.lower() for ind in filipino_indicators)
-                if is_filipino:
-                    return (
-                        "Pasensya na po, tumutulong lang ako sa mga tanong tungkol sa agrikultura. "
-                        "Magtanong po tungkol sa mga pananim, lupa, o pagsasaka. 🌱"
-                    )
-                return (
-                    "I'm sorry, I can only help with agricultural questions. "
-                    "Please ask me about crops, soil, or farming practices. 🌾"
-                )
+        except Exception as e:
+            return AIChatService._friendly_error(e)
 
-            return answer
+    @staticmethod
+    def stream_agronomist(user_question, language="en"):
+        """
+        Streaming variant of ask_agronomist (same answer cache). Yields events:
+            {"type": "token", "text": ...}   cleaned text as it arrives
+            {"type": "done",  "answer": ..., "guardrail": {"passed": bool, "replacement": str | None}}
+            {"type": "error", "message": ...}
+        The guardrail needs the whole answer, so its verdict comes last; if
+        it fails the client replaces the streamed text with `replacement`.
+        """
+        routed = AIChatService._routed_answer(user_question)
+        if routed:
+            yield {"type": "token", "text": routed}
+            yield {"type": "done", "answer": routed, "guardrail": {"passed": True, "replacement": None}}
+            return
+
+        oai_client = _get_openai_client()
+        if not OPENAI_AVAILABLE or oai_client is None:
+            yield {"type": "error", "message": AIChatService.AI_UNAVAILABLE_MESSAGE}
+            return
+
+        cached, store = AIChatService._lookup_answer(user_question, language)
+        if cached is not None:
+            yield {"type": "token", "text": cached}
+            yield {"type": "done", "answer": cached, "guardrail": {"passed": True, "replacement": None}}
+            return
 
+        messages = AIChatService._build_chat_messages(user_question, language)
+        cleaner = _StreamCleaner()
+        try:
+            stream = LLMGateway.chat_stream(
+                model=AIChatService.OPENAI_MODEL,
+                messages=messages,
+                max_tokens=300,
+                temperature=0.3,
+                stream_options={"include_usage": True},
+                prompt_cache_key=AIChatService.PROMPT_CACHE_KEY,
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    # The closing chunk carries usage only
+                    AIChatService._record_usage(getattr(chunk, "usage", None))
+                    continue
+                text = cleaner.feed(chunk.choices[0].delta.content or "")
+                if text:
+                    yield {"type": "token", "text": text}
         except Exception as e:
-            error_msg = str(e).lower()
-            if "api_key" in error_msg or "authentication" in error_msg or "invalid" in error_msg:
-                return "⚠️ Invalid OpenAI API key. Please check your OPENAI_API_KEY in the .env file."
-            elif "rate_limit" in error_msg:
-                return "⚠️ OpenAI rate limit reached. Please wait a moment and try again."
-            elif "insufficient_quota" in error_msg or "quota" in error_msg:
-                return "⚠️ OpenAI quota exceeded. Please check your billing at platform.openai.com."
-            return f"AI Error: {str(e)}"
+            yield {"type": "error", "message": AIChatService._friendly_error(e)}
+            return
+
+        answer = cleaner.text
+        replacement = AIChatService._guardrail_reply(answer, user_question)
+        if replacement is None and answer:
+            store(answer)
+        yield {
+            "type":      "done",
+            "answer":    replacement or answer,
+            "guardrail": {"passed": replacement is None, "replacement": replacement},
+        }
 
     # ─────────────────────── NODE COMPARISON ───────────────────────
 
+    # Readings are part of the prompt, so a cached phrasing is only reused
+    # while nothing changed; the TTL bounds it anyway
+    COMPARISON_CACHE_TTL = int(os.getenv("COMPARISON_CACHE_TTL", 600))
+
+    # The ranking is computed locally; having GPT reword it is opt-in
+    COMPARISON_LLM_PHRASING = os.getenv("COMPARISON_LLM_PHRASING", "false").lower() == "true"
+
     @staticmethod
-    def get_node_comparison():
-        """Generate AI comparison between multiple nodes using GPT-4o-mini"""
+    def get_node_comparison(use_cache=True, phrase=None, ranking=None):
+        """
+        Which node needs attention first. The order comes from
+        NodePriorityService; with `phrase` GPT-4o-mini rewords the top of the
+        ranking, cached per ranking (i.e. per fleet state).
+        """
+        ranking = NodePriorityService.rank() if ranking is None else ranking
+        summary = NodePriorityService.summarize(ranking)
+        phrase = AIChatService.COMPARISON_LLM_PHRASING if phrase is None else phrase
+        if not phrase or len(ranking) < 2:
+            return summary
+
         oai_client = _get_openai_client()
         if not OPENAI_AVAILABLE or oai_client is None:
-            return "AI comparison not available (OpenAI not configured)."
-
-        nodes_ref  = db.collection("nodes").stream()
-        nodes_data = []
-
-        for node_doc in nodes_ref:
-            node   = node_doc.to_dict()
-            latest = node.get("latest_readings", {}) or node.get("lastReading", {}) or node
-            crop   = node.get("crop_type", "default")
-            thresholds, source = AIChatService.get_thresholds(crop)
-
-            def get_target(min_key, max_key, unit=""):
-                if thresholds.get(min_key) is not None and thresholds.get(max_key) is not None:
-                    return f"{thresholds[min_key]}-{thresholds[max_key]}{unit}"
-                return "Not specified in profile"
-
-            nodes_data.append({
-                "name":            node.get('node_name', node.get('node_id')),
-                "crop":            crop,
-                "moisture":        latest.get('moisture'),
-                "ph":              latest.get('pH') or latest.get('ph'),
-                "temp":            latest.get('temperature'),
-                "moisture_target": get_target('moisture_min', 'moisture_max', '%'),
-                "ph_target":       get_target('ph_min', 'ph_max'),
-                "source":          source,
-            })
-
-        if len(nodes_data) < 2:
-            return "Need at least 2 nodes to compare. / Kailangan ng at least 2 nodes para i-compare."
+            return summary
 
-        try:
-            response = oai_client.chat.completions.create(
+        top = [
+            {k: r[k] for k in ("node_name", "crop_type", "status", "score", "reasons")}
+            for r in ranking[:3]
+        ]
+        messages = [{
+            "role": "user",
+            "content": (
+                f"These soil sensor nodes are already ranked by how far their readings are outside "
+                f"their crop's target ranges (highest score first). Tell the farmer which one needs "
+                f"attention first and why, keeping this order. "
+                f"Be concise and direct. 1-2 sentences ONLY. Use plain text, no markdown.\n\n"
+                f"{json.dumps(top, indent=2)}"
+            ),
+        }]
+
+        def _call():
+            response = LLMGateway.chat(
                 model=AIChatService.OPENAI_MODEL,
-                messages=[{
-                    "role": "user",
-                    "content": (
-                        f"Compare these soil sensor nodes. Which one needs attention first? "
-                        f"If a target is 'Not specified in profile', use your general agricultural knowledge for that crop to assess it. "
-                        f"Be concise and direct. 1-2 sentences ONLY. Use plain text, no markdown.\n\n"
-                        f"{json.dumps(nodes_data, indent=2)}"
-                    ),
-                }],
+                messages=messages,
                 max_tokens=100,
                 temperature=0.4,
             )
+            return response.choices[0].message.content
 
-            answer = response.choices[0].message.content
+        try:
+            answer = LLMCache.shared().cached_call(
+                AIChatService.OPENAI_MODEL, messages, {"max_tokens": 100, "temperature": 0.4},
+                _call, ttl=AIChatService.COMPARISON_CACHE_TTL, bypass=not use_cache,
+            )
             answer = answer.replace('**', '').replace('###', '').replace('---', '').strip()
-            return answer
+            return answer or summary
 
         except Exception as e:
-            return f"Comparison unavailable: {str(e)}"
+            print(f"⚠️ Comparison phrasing failed ({e}) — using the computed summary")
+            return summary
 
     # ─────────────────────── STATUS CHECK ───────────────────────
 
     @staticmethod
     def check_openai_status():
-        """Check if OpenAI API key is valid and reachable"""
+        """OpenAI availability from HealthMonitor's last probe (no API call here), plus all service stats."""
         if not OPENAI_AVAILABLE:
             return {
                 "available": False,
@@ -372,24 +724,20 @@ class AIChatService:
                 "message": "OPENAI_API_KEY not set. Add it to your .env file.",
             }
 
-        try:
-            oai_client.chat.completions.create(
-                model=AIChatService.OPENAI_MODEL,
-                messages=[{"role": "user", "content": "ping"}],
-                max_tokens=5,
-            )
-            return {
-                "available": True,
-                "running":   True,
-                "model":     AIChatService.OPENAI_MODEL,
-                "provider":  "OpenAI",
-            }
-        except Exception as e:
-            return {
-                "available": True,
-                "running":   False,
-                "message":   f"OpenAI API error: {str(e)}",
-            }
+        services = HealthMonitor.status()
+        openai = services["openai"]
+        status = {
+            "available": True,
+            "running":   openai["status"] == "ok" if openai["status"] != "pending" else None,
+            "model":     AIChatService.OPENAI_MODEL,
+            "provider":  "OpenAI",
+            "services":  services,
+        }
+        if openai["status"] == "pending":
+            status["message"] = "Health check in progress. Try again in a few seconds."
+        elif openai["status"] == "down":
+            status["message"] = f"OpenAI API error: {openai['last_error']}"
+        return status
 
     # Backward-compatible alias
     @staticmethod
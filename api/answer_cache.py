@@ -0,0 +1,189 @@
+# api/answer_cache.py
+import os
+import re
+import json
+import math
+import time
+import hashlib
+import threading
+from .lru_cache import LRUCache
+
+
+class AnswerCache:
+    """
+    In-process cache of chatbot answers for repeated questions about an
+    unchanged farm.
+
+    An entry is keyed by the question's embedding, the answer language and
+    a fingerprint of what the answer was based on: every node's latest
+    readings, last_seen, status, crop and thresholds, plus the active
+    alerts. A lookup hits when the fingerprint is the one the answer was
+    stored under, the question names the same entities (nodes, crops,
+    metrics, numbers, negation and direction words — see entities()) and
+    it is a near-duplicate (cosine similarity ≥ SIMILARITY) of a stored
+    one. So "how is my soil?" and "How's my soil" share an answer, but
+    "is moisture too high on Node A" and "… too low on Node B" don't.
+
+    Any new reading changes last_seen, which changes the fingerprint and
+    drops every stored answer. Callers fetch the fleet once and pass it to
+    both fingerprint() and entities(), so the two describe the same state.
+
+    Knowledge Library uploads aren't part of the fingerprint; TTL bounds
+    how long an answer can outlive one.
+    """
+
+    ENABLED     = os.getenv("CHAT_ANSWER_CACHE", "true").lower() == "true"
+    SIMILARITY  = float(os.getenv("CHAT_ANSWER_CACHE_SIMILARITY", 0.92))
+    TTL         = float(os.getenv("CHAT_ANSWER_CACHE_TTL", 300))
+    MAX_ENTRIES = int(os.getenv("CHAT_ANSWER_CACHE_MAX_ENTRIES", 200))
+
+    # The alerts query is the only part of the fingerprint not already in
+    # memory; a few seconds of reuse keeps hits fast
+    ALERTS_TTL = float(os.getenv("CHAT_ANSWER_CACHE_ALERTS_TTL", 5))
+
+    # Words that flip an answer while barely moving the embedding
+    DIRECTION_WORDS = (
+        r"not|no|never|without|too|very|high|higher|low|lower|above|below|over|under|more|less|"
+        r"increase|decrease|raise|reduce|dry|wet|hot|cold|"
+        r"hindi|wala|mataas|mababa|sobra|kulang"
+    )
+
+    _entries     = []       # [{vector, language, entities, question, answer, stored_at}]
+    _fingerprint = None
+    _lock        = threading.Lock()
+    _alerts      = LRUCache(maxsize=1, ttl=ALERTS_TTL, name="answer_cache_alerts")
+    _direction   = re.compile(r"\b(?:" + DIRECTION_WORDS + r")\b|n't\b", re.IGNORECASE)
+    hits         = 0
+    misses       = 0
+
+    # ─────────────────────── FINGERPRINT ───────────────────────
+
+    @classmethod
+    def fingerprint(cls, fleet=None):
+        """Hash of the fleet snapshot (readings, status, crops, thresholds) and active alerts."""
+        from .ai_service import AIChatService
+        from .fleet_context import FleetContextService
+
+        fleet = FleetContextService.get_fleet() if fleet is None else fleet
+        state = [
+            {
+                "node_id":    node["node_id"],
+                "crop_type":  node.get("crop_type"),
+                "status":     node.get("status"),
+                "last_seen":  node.get("last_seen"),
+                "latest":     node.get("latest"),
+                "thresholds": node.get("thresholds"),
+            }
+            for node in fleet
+        ]
+
+        alerts = cls._alerts.get("active")
+        if alerts is None:
+            alerts = sorted(str(a) for a in AIChatService._fetch_alerts())
+            cls._alerts.set("active", alerts)
+
+        payload = json.dumps([state, alerts], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ─────────────────────── ENTITIES ───────────────────────
+
+    @classmethod
+    def entities(cls, question, fleet=None):
+        """
+        The exact part of the key: nodes and crops named in the question,
+        requested metrics, numbers, and negation/direction words. Two
+        questions only share an answer when these match.
+        """
+        from .intent_router import IntentRouter
+        from .fleet_context import FleetContextService
+
+        fleet = FleetContextService.get_fleet() if fleet is None else fleet
+        crops = {node.get("crop_type") for node in fleet if node.get("crop_type") not in (None, "default")}
+        return json.dumps({
+            "nodes":     sorted(node["node_id"] for node in IntentRouter._named_nodes(question, fleet)),
+            "crops":     sorted(IntentRouter.match_names(question, [c.replace("_", " ") for c in crops])),
+            "metrics":   sorted(IntentRouter._requested_metrics(question)),
+            "numbers":   sorted(re.findall(r"\d+(?:\.\d+)?", question)),
+            "direction": sorted({
+                "not" if w.lower() == "n't" else w.lower() for w in cls._direction.findall(question)
+            }),
+        }, sort_keys=True)
+
+    # ─────────────────────── LOOKUP / STORE ───────────────────────
+
+    @staticmethod
+    def _similarity(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    @classmethod
+    def _sync(cls, fingerprint):
+        """Drop everything stored under an older fingerprint, and expired entries. Call under _lock."""
+        if fingerprint != cls._fingerprint:
+            cls._entries     = []
+            cls._fingerprint = fingerprint
+        now = time.monotonic()
+        cls._entries = [e for e in cls._entries if now - e["stored_at"] < cls.TTL]
+
+    @classmethod
+    def lookup(cls, question, language, fingerprint, entities=None):
+        """
+        Return (answer | None, vector). The question's vector is handed back
+        so a miss can store its answer without embedding again. Only entries
+        stored with the same `entities` (see entities()) are compared.
+        """
+        from .rag_service import RAGService
+
+        vector = RAGService.embed_query(question)
+        with cls._lock:
+            cls._sync(fingerprint)
+            best, best_score = None, cls.SIMILARITY
+            for entry in cls._entries:
+                if entry["language"] != language or entry["entities"] != entities:
+                    continue
+                score = cls._similarity(vector, entry["vector"])
+                if score >= best_score:
+                    best, best_score = entry, score
+            if best is None:
+                cls.misses += 1
+                return None, vector
+            cls.hits += 1
+            return best["answer"], vector
+
+    @classmethod
+    def store(cls, question, language, fingerprint, answer, vector, entities=None):
+        with cls._lock:
+            if cls._fingerprint is not None and fingerprint != cls._fingerprint:
+                return      # the farm changed while this answer was being written
+            cls._sync(fingerprint)
+            cls._entries.append({
+                "vector":    vector,
+                "language":  language,
+                "entities":  entities,
+                "question":  question,
+                "answer":    answer,
+                "stored_at": time.monotonic(),
+            })
+            if len(cls._entries) > cls.MAX_ENTRIES:
+                cls._entries = cls._entries[-cls.MAX_ENTRIES:]
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._entries     = []
+            cls._fingerprint = None
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            lookups = cls.hits + cls.misses
+            return {
+                "enabled":    cls.ENABLED,
+                "entries":    len(cls._entries),
+                "similarity": cls.SIMILARITY,
+                "ttl":        cls.TTL,
+                "hits":       cls.hits,
+                "misses":     cls.misses,
+                "hit_rate":   round(cls.hits / lookups, 4) if lookups else 0.0,
+            }
@@ -1,5 +1,7 @@
 from django.apps import AppConfig
 import os
+import sys
+import threading
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -11,3 +13,23 @@ class ApiConfig(AppConfig):
             from .scheduler import start_watchdog
             start_watchdog()
             print("🟢 IoT Star Topology Watchdog Started!")
+
+        # Optional: load ChromaDB + the embedding model now instead of on the first request.
+        # Skip the runserver auto-reloader's parent process, which never serves requests.
+        is_reloader_parent = 'runserver' in sys.argv and os.environ.get('RUN_MAIN') != 'true'
+        # Jobs left queued/running by the previous server will never finish. Only a
+        # serving process cleans them up: a one-off command (migrate, shell, …) could
+        # otherwise fail jobs that a live server is still running.
+        is_server = (
+            ('runserver' in sys.argv and not is_reloader_parent)
+            or ('runserver' in sys.argv and '--noreload' in sys.argv)
+            or os.path.basename(sys.argv[0]) in ('gunicorn', 'uwsgi', 'daphne', 'uvicorn')
+            or os.environ.get('INGESTION_RECOVER_ON_START', 'false').lower() == 'true'
+        )
+        if is_server:
+            from .ingestion_jobs import IngestionJobService
+            threading.Thread(target=IngestionJobService.recover_stale_jobs, daemon=True).start()
+
+        if os.environ.get('RAG_WARM_START', 'false').lower() == 'true' and not is_reloader_parent:
+            from .rag_service import RAGService
+            RAGService.start_warm_up()
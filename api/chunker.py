@@ -0,0 +1,182 @@
+# api/chunker.py
+import os
+import re
+from pathlib import Path
+
+try:
+    from tokenizers import Tokenizer
+    TOKENIZERS_AVAILABLE = True
+except ImportError:
+    TOKENIZERS_AVAILABLE = False
+
+
+class TextChunker:
+    """
+    Sentence- and table-row-aware chunker sized in embedding-model tokens.
+
+    all-MiniLM-L6-v2 reads at most 256 word pieces (including [CLS]/[SEP])
+    and silently truncates the rest, so chunks are packed from whole
+    sentences / table rows up to MAX_TOKENS and never cut mid-sentence
+    unless a single sentence is itself over budget.
+
+    Works as a generator over (page_number, text) pairs. Character offsets
+    refer to the document text as RAGService.extract_text builds it:
+    non-empty pages joined with a single newline.
+    """
+
+    MAX_TOKENS     = int(os.getenv("CHUNK_MAX_TOKENS", 240))
+    OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+
+    # Same files chromadb's DefaultEmbeddingFunction downloads on first use
+    TOKENIZER_PATH = Path.home() / ".cache" / "chroma" / "onnx_models" / "all-MiniLM-L6-v2" / "onnx" / "tokenizer.json"
+
+    _SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])|\n\s*\n")
+    _WORD_PIECES  = re.compile(r"\w+|[^\w\s]")
+    _WORDS        = re.compile(r"\S+")
+
+    _tokenizer = None
+    _tokenizer_loaded = False
+
+    # ─────────────────────── TOKEN COUNTING ───────────────────────
+
+    @classmethod
+    def _get_tokenizer(cls):
+        if not cls._tokenizer_loaded:
+            cls._tokenizer_loaded = True
+            if TOKENIZERS_AVAILABLE and cls.TOKENIZER_PATH.exists():
+                try:
+                    cls._tokenizer = Tokenizer.from_file(str(cls.TOKENIZER_PATH))
+                except Exception as e:
+                    print(f"Could not load MiniLM tokenizer, estimating tokens: {e}")
+        return cls._tokenizer
+
+    @classmethod
+    def count_tokens(cls, text):
+        tokenizer = cls._get_tokenizer()
+        if tokenizer is not None:
+            return len(tokenizer.encode(text, add_special_tokens=False).ids)
+        # WordPiece estimate: punctuation is its own piece, long words split
+        return sum(1 + max(0, len(w) - 4) // 4 for w in cls._WORD_PIECES.findall(text))
+
+    # ─────────────────────── UNITS ───────────────────────
+
+    @classmethod
+    def _iter_units(cls, page_text, page_number, base_offset):
+        """
+        Split one page into atomic units: table rows (lines holding " | ",
+        as produced by the PDF table extractor) and sentences.
+        Yields (text, char_start, char_end, page_number, is_table_row, raw_text).
+        """
+        block_start = None
+        position = 0
+        for line in page_text.split("\n"):
+            line_end = position + len(line)
+            if " | " in line:
+                if block_start is not None:
+                    yield from cls._iter_sentences(page_text, block_start, position, page_number, base_offset)
+                    block_start = None
+                if line.strip():
+                    row = line.strip()
+                    s = base_offset + position + len(line) - len(line.lstrip())
+                    yield (row, s, s + len(row), page_number, True, row)
+            elif block_start is None:
+                block_start = position
+            position = line_end + 1
+        if block_start is not None:
+            yield from cls._iter_sentences(page_text, block_start, len(page_text), page_number, base_offset)
+
+    @classmethod
+    def _iter_sentences(cls, page_text, start, end, page_number, base_offset):
+        cursor = start
+        block  = page_text[start:end]
+        bounds = [m.start() + start for m in cls._SENTENCE_END.finditer(block)] + [end]
+        for boundary in bounds:
+            raw = page_text[cursor:boundary]
+            stripped = raw.strip()
+            if stripped:
+                lead = len(raw) - len(raw.lstrip())
+                s = base_offset + cursor + lead
+                yield (" ".join(stripped.split()), s, s + len(stripped), page_number, False, stripped)
+            cursor = boundary
+
+    @classmethod
+    def _split_oversize(cls, unit, max_tokens):
+        """Word-window split for a single sentence/row that is over budget on its own."""
+        _, char_start, _, page_number, is_row, raw = unit
+        piece_start, piece_end, words, tokens = None, None, [], 0
+        for match in cls._WORDS.finditer(raw):
+            # WordPiece never crosses whitespace, so per-word counts add up exactly
+            word_tokens = cls.count_tokens(match.group())
+            if words and tokens + word_tokens > max_tokens:
+                text = " ".join(words)
+                yield (text, char_start + piece_start, char_start + piece_end, page_number, is_row, text)
+                words, piece_start, tokens = [], None, 0
+            if piece_start is None:
+                piece_start = match.start()
+            words.append(match.group())
+            tokens += word_tokens
+            piece_end = match.end()
+        if words:
+            text = " ".join(words)
+            yield (text, char_start + piece_start, char_start + piece_end, page_number, is_row, text)
+
+    # ─────────────────────── CHUNKS ───────────────────────
+
+    @staticmethod
+    def _make_chunk(units, tokens):
+        parts = []
+        for i, (text, _, _, _, is_row, _) in enumerate(units):
+            if i:
+                parts.append("\n" if is_row or units[i - 1][4] else " ")
+            parts.append(text)
+        return {
+            "text":       "".join(parts),
+            "char_start": units[0][1],
+            "char_end":   units[-1][2],
+            "page_start": units[0][3],
+            "page_end":   units[-1][3],
+            "tokens":     tokens,
+        }
+
+    @classmethod
+    def iter_chunks(cls, pages, max_tokens=None, overlap_tokens=None):
+        """
+        Yield chunk dicts {text, char_start, char_end, page_start, page_end, tokens}
+        from an iterable of (page_number, text). Consecutive chunks share up to
+        `overlap_tokens` worth of trailing sentences for context continuity.
+        """
+        max_tokens     = max_tokens or cls.MAX_TOKENS
+        overlap_tokens = cls.OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+
+        current, current_tokens = [], []
+        offset = 0
+        for page_number, page_text in pages:
+            if not page_text:
+                continue
+            for unit in cls._iter_units(page_text, page_number, offset):
+                unit_tokens = cls.count_tokens(unit[0])
+                pieces = [(unit, unit_tokens)]
+                if unit_tokens > max_tokens:
+                    pieces = [(p, cls.count_tokens(p[0])) for p in cls._split_oversize(unit, max_tokens)]
+
+                for piece, piece_tokens in pieces:
+                    if current and sum(current_tokens) + piece_tokens > max_tokens:
+                        yield cls._make_chunk(current, sum(current_tokens))
+
+                        # Carry trailing units forward as overlap, within budget
+                        keep = 0
+                        carried = 0
+                        for t in reversed(current_tokens[1:]):
+                            if carried + t > overlap_tokens or carried + t + piece_tokens > max_tokens:
+                                break
+                            carried += t
+                            keep += 1
+                        current = current[len(current) - keep:] if keep else []
+                        current_tokens = current_tokens[len(current_tokens) - keep:] if keep else []
+
+                    current.append(piece)
+                    current_tokens.append(piece_tokens)
+            offset += len(page_text) + 1
+
+        if current:
+            yield cls._make_chunk(current, sum(current_tokens))
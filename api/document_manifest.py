@@ -0,0 +1,95 @@
+# api/document_manifest.py
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+class DocumentManifest:
+    """
+    One row per document stored in ChromaDB:
+        name → crop_type, chunk_ids, chunk_hashes, content_hash, size, created_at, updated_at
+
+    Lets list/delete work per document instead of pulling every chunk's
+    text and metadata out of the collection.
+    """
+
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documents (
+                   name         TEXT PRIMARY KEY,
+                   crop_type    TEXT,
+                   chunk_ids    TEXT NOT NULL,
+                   chunk_hashes TEXT,
+                   content_hash TEXT,
+                   size         INTEGER,
+                   created_at   TEXT NOT NULL,
+                   updated_at   TEXT NOT NULL
+               )"""
+        )
+        self._conn.commit()
+
+    _COLUMNS = "name, crop_type, chunk_ids, chunk_hashes, content_hash, size, created_at, updated_at"
+
+    @staticmethod
+    def _row_to_dict(row):
+        name, crop_type, chunk_ids, chunk_hashes, content_hash, size, created_at, updated_at = row
+        return {
+            "name":         name,
+            "crop_type":    crop_type,
+            "chunk_ids":    json.loads(chunk_ids),
+            "chunk_hashes": json.loads(chunk_hashes) if chunk_hashes else None,
+            "content_hash": content_hash,
+            "size":         size,
+            "created_at":   created_at,
+            "updated_at":   updated_at,
+        }
+
+    def upsert(self, name, crop_type, chunk_ids, chunk_hashes=None, content_hash=None, size=None):
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            existing = self._conn.execute(
+                "SELECT created_at, content_hash, size FROM documents WHERE name = ?", (name,)
+            ).fetchone()
+            created_at = existing[0] if existing else now
+            if existing:
+                # Keep what a caller without the upload at hand doesn't know
+                content_hash = content_hash or existing[1]
+                size = size if size is not None else existing[2]
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO documents ({self._COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, crop_type, json.dumps(list(chunk_ids)),
+                 json.dumps(list(chunk_hashes)) if chunk_hashes is not None else None,
+                 content_hash, size, created_at, now),
+            )
+            self._conn.commit()
+
+    def get(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM documents WHERE name = ?", (name,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list(self):
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM documents ORDER BY name"
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def remove(self, name):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE name = ?", (name,))
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
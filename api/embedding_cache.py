@@ -0,0 +1,82 @@
+# api/embedding_cache.py
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+
+class EmbeddingCache:
+    """
+    Persistent chunk-embedding cache stored next to chroma_db.
+
+    Keyed by (embedding model, SHA-256 of the chunk text) so a re-uploaded
+    document reuses the vectors computed the first time instead of running
+    the ONNX model over every chunk again.
+
+    Vectors are stored as float32 blobs in a single SQLite table.
+    """
+
+    def __init__(self, path, model_name="default"):
+        self.path       = path
+        self.model_name = model_name
+        self._lock      = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   model     TEXT NOT NULL,
+                   text_hash TEXT NOT NULL,
+                   dim       INTEGER NOT NULL,
+                   vector    BLOB NOT NULL,
+                   PRIMARY KEY (model, text_hash)
+               )"""
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, text_hashes):
+        """Return {text_hash: [float, ...]} for every hash already cached."""
+        found = {}
+        unique = list(dict.fromkeys(text_hashes))
+        with self._lock:
+            # SQLite caps bound parameters, so look up in slices
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items):
+        """Store an iterable of (text_hash, vector) pairs."""
+        rows = []
+        for text_hash, vector in items:
+            packed = array("f", (float(x) for x in vector))
+            rows.append((self.model_name, text_hash, len(packed), packed.tobytes()))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)
+            ).fetchone()
+        return row[0] if row else 0
@@ -14,7 +14,6 @@ Run with:
 import os
 import sys
 import django
-import time
 import pandas as pd
 import json
 from pathlib import Path
@@ -41,6 +40,12 @@ from langsmith import traceable
 
 # ── Your existing services ─────────────────────────────────────────────────
 from api.rag_service import RAGService
+from api.llm_cache import LLMCache
+from api.llm_gateway import LLMGateway
+
+# Reruns of the same question/context/model reuse the stored answer.
+# `python manage.py run_ragas_eval --no-cache` turns this off.
+USE_LLM_CACHE = True
 
 # ══════════════════════════════════════════════════════════════════════════
 # STEP 1 — TEST QUESTIONS
@@ -125,45 +130,28 @@ Context:
  
 Question: {question}"""
  
+    provider, model, params = _model_settings(model_name)
+    # Every sampling parameter sent is part of the cache key
+    return LLMCache.shared().cached_call(
+        model, full_prompt, {"provider": provider, **params},
+        lambda: LLMGateway.complete(provider, model, full_prompt, **params),
+        bypass=not USE_LLM_CACHE,
+    )
+
+
+def _model_settings(model_name: str):
+    """(provider, model, sampling params) for an evaluated model; calls go through the gateway."""
     # ── GPT-4o-mini ───────────────────────────────────────────────────
     if "gpt" in model_name:
-        from openai import OpenAI
-        client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": full_prompt}],
-            max_tokens=300,
-            temperature=0.3,
-        )
-        return response.choices[0].message.content
+        return "openai", "gpt-4o-mini", {"max_tokens": 300, "temperature": 0.3}
  
     # ── Claude Sonnet 4.6 ─────────────────────────────────────────────
     elif "claude" in model_name:
-        from anthropic import Anthropic, InternalServerError
-        client = Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
-        
-        for attempt in range (3):
-            try:
-                response = client.messages.create(
-                    model="claude-sonnet-4-6",
-                    max_tokens=300,
-                    messages=[{"role": "user", "content": full_prompt}],
-                )
-                return response.content[0].text
-            except InternalServerError:
-                if attempt < 2:
-                    print(f"  ⚠️  Claude API error, retrying... (attempt {attempt + 1}/3)")
-                    time.sleep(5)  # wait before retrying
-                else:
-                    raise Exception("Claude API failed after 3 attempts.")
+        return "anthropic", "claude-sonnet-4-6", {"max_tokens": 300}
  
-    # ── Gemini 3 Flash Preview ──────────────────────────────────────────────
+    # ── Gemini 3 Flash Preview (the gateway sends no sampling params) ─────
     elif "gemini" in model_name:
-        import google.generativeai as genai
-        genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
-        model = genai.GenerativeModel("gemini-3-flash-preview")
-        response = model.generate_content(full_prompt)
-        return response.text
+        return "gemini", "gemini-3-flash-preview", {}
  
     else:
         raise ValueError(f"Unknown model: {model_name}")
@@ -0,0 +1,191 @@
+# api/fleet_context.py
+
+import os
+import copy
+import time
+import threading
+from datetime import datetime, timezone
+from config.firebase import db
+
+
+class FleetContextService:
+    """
+    Precomputed per-node context for the chatbot, so a chat turn doesn't
+    stream every node and re-resolve thresholds for each one.
+
+    Firebase Structure:
+    └── fleet_context/
+        └── snapshot/     ← { nodes: {node_id: {node_id, node_name, crop_type, status,
+                                                 last_seen, latest: {...}}},
+                              thresholds: {crop_id: {values, source} | None},
+                              updated_at }
+
+    Kept up to date incrementally: process_reading, crop assignment and
+    connectivity changes update one node; profile changes mark one crop's
+    thresholds stale (None) so the next read resolves them again.
+
+    Each process keeps the snapshot in memory and re-reads the single
+    document when its copy is older than REFRESH_SECONDS; its own writes
+    apply to memory immediately.
+    """
+
+    REFRESH_SECONDS = float(os.getenv("FLEET_CONTEXT_REFRESH_SECONDS", 15))
+
+    # Reading fields the chatbot context uses
+    READING_KEYS = ["moisture", "pH", "ph", "temperature", "nitrogen", "phosphorus",
+                    "potassium", "air_temperature", "humidity"]
+
+    _snapshot  = None
+    _loaded_at = 0.0
+    _lock      = threading.RLock()
+
+    @staticmethod
+    def _doc():
+        return db.collection("fleet_context").document("snapshot")
+
+    @staticmethod
+    def crop_id(crop_type):
+        return (crop_type or "default").lower().strip().replace(" ", "_")
+
+    # ─────────────────────── BUILD / LOAD ───────────────────────
+
+    @classmethod
+    def _entry_from_node(cls, node_id, node):
+        latest = node.get("latest_readings") or node.get("lastReading") or node
+        return {
+            "node_id":   node_id,
+            "node_name": node.get("node_name", "Unknown"),
+            "crop_type": node.get("crop_type", "default"),
+            "status":    node.get("status"),
+            "last_seen": node.get("last_seen"),
+            "latest":    {k: latest[k] for k in cls.READING_KEYS if k in latest},
+        }
+
+    @classmethod
+    def rebuild(cls):
+        """Full rebuild from the nodes collection. Thresholds resolved once per crop, not per node."""
+        from .ai_service import AIChatService
+
+        nodes = {}
+        for node_doc in db.collection("nodes").stream():
+            node = node_doc.to_dict()
+            node_id = node.get("node_id") or node_doc.id
+            nodes[node_id] = cls._entry_from_node(node_id, node)
+
+        thresholds = {}
+        for entry in nodes.values():
+            crop_id = cls.crop_id(entry["crop_type"])
+            if crop_id not in thresholds:
+                values, source = AIChatService.get_thresholds(entry["crop_type"])
+                thresholds[crop_id] = {"values": values, "source": source}
+
+        snapshot = {"nodes": nodes, "thresholds": thresholds, "updated_at": datetime.now(timezone.utc)}
+        cls._doc().set(snapshot)
+        with cls._lock:
+            cls._snapshot  = snapshot
+            cls._loaded_at = time.monotonic()
+        print(f"✓ Rebuilt fleet context: {len(nodes)} nodes, {len(thresholds)} crops")
+        return snapshot
+
+    @classmethod
+    def _load(cls):
+        with cls._lock:
+            fresh = cls._snapshot is not None and time.monotonic() - cls._loaded_at < cls.REFRESH_SECONDS
+            if fresh:
+                return cls._snapshot
+
+            doc = cls._doc().get()
+            if not doc.exists:
+                return cls.rebuild()
+            cls._snapshot  = doc.to_dict()
+            cls._snapshot.setdefault("nodes", {})
+            cls._snapshot.setdefault("thresholds", {})
+            cls._loaded_at = time.monotonic()
+            return cls._snapshot
+
+    # ─────────────────────── READ ───────────────────────
+
+    @classmethod
+    def get_fleet(cls):
+        """
+        [{node_id, node_name, crop_type, status, last_seen, latest, thresholds, threshold_source}]
+        from the snapshot; stale crop thresholds are resolved and written back once.
+        """
+        from .ai_service import AIChatService
+
+        with cls._lock:
+            snapshot = cls._load()
+            fleet = []
+            for entry in snapshot["nodes"].values():
+                crop_id = cls.crop_id(entry.get("crop_type"))
+                resolved = snapshot["thresholds"].get(crop_id)
+                if not resolved:
+                    values, source = AIChatService.get_thresholds(entry.get("crop_type"))
+                    resolved = {"values": values, "source": source}
+                    snapshot["thresholds"][crop_id] = resolved
+                    cls._doc().set({"thresholds": {crop_id: resolved}}, merge=True)
+                fleet.append({
+                    **copy.deepcopy(entry),
+                    "thresholds":       dict(resolved["values"]),
+                    "threshold_source": resolved["source"],
+                })
+            return sorted(fleet, key=lambda n: str(n.get("node_name")))
+
+    @classmethod
+    def cached_node_crops(cls):
+        """
+        {node name: crop_type} from the snapshot already in memory, or None
+        before the first load. Never reads Firestore or waits for a load in
+        progress, so it can run alongside get_fleet(); may be slightly stale.
+        """
+        snapshot = cls._snapshot
+        if snapshot is None:
+            return None
+        return {
+            entry.get("node_name") or entry["node_id"]: entry.get("crop_type", "default")
+            for entry in list(snapshot["nodes"].values())
+        }
+
+    # ─────────────────────── INCREMENTAL UPDATES ───────────────────────
+
+    @classmethod
+    def update_node(cls, node_id, reading=None, **fields):
+        """
+        Patch one node: `reading` replaces its latest values; other keyword
+        fields (node_name, crop_type, status, last_seen) overwrite as given.
+        """
+        try:
+            patch = {k: v for k, v in fields.items() if v is not None}
+            if reading:
+                patch["latest"] = {k: reading[k] for k in cls.READING_KEYS if k in reading}
+            patch["node_id"] = node_id
+
+            with cls._lock:
+                # Make sure the snapshot document exists before patching into it
+                entry = cls._load()["nodes"].setdefault(
+                    node_id, {"node_name": "Unknown", "crop_type": "default", "latest": {}},
+                )
+                patch_copy = copy.deepcopy(patch)
+                # Firestore merges nested maps, so a reading only replaces the keys it carries
+                patch_copy["latest"] = {**entry.get("latest", {}), **patch_copy.get("latest", {})}
+                entry.update(patch_copy)
+            cls._doc().set({
+                "nodes":      {node_id: patch},
+                "updated_at": datetime.now(timezone.utc),
+            }, merge=True)
+        except Exception as e:
+            print(f"Error updating fleet context for {node_id}: {e}")
+
+    @classmethod
+    def invalidate_crop(cls, crop_type):
+        """A crop's profile/config changed: resolve its thresholds again on the next read."""
+        crop_id = cls.crop_id(crop_type)
+        try:
+            with cls._lock:
+                cls._load()["thresholds"][crop_id] = None
+            cls._doc().set({
+                "thresholds": {crop_id: None},
+                "updated_at": datetime.now(timezone.utc),
+            }, merge=True)
+        except Exception as e:
+            print(f"Error invalidating fleet thresholds for {crop_id}: {e}")
@@ -0,0 +1,128 @@
+# api/health_monitor.py
+import os
+import time
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from apscheduler.schedulers.background import BackgroundScheduler
+
+
+class HealthMonitor:
+    """
+    Background probes of the services the AI features depend on, so
+    /ai-status/ answers from memory instead of making an OpenAI call per
+    poll.
+
+    Every INTERVAL_SECONDS one cheap call per service:
+      openai    — retrieve the chat model's metadata (no tokens billed)
+      chromadb  — list the knowledge partitions
+      firestore — read at most one node document
+
+    The last WINDOW results per service give latency and error-rate
+    stats. The scheduler starts with the first status request in each
+    process.
+    """
+
+    INTERVAL_SECONDS = int(os.getenv("AI_HEALTH_INTERVAL_SECONDS", 60))
+    WINDOW           = int(os.getenv("AI_HEALTH_WINDOW", 20))
+    PROBE_TIMEOUT    = float(os.getenv("AI_HEALTH_PROBE_TIMEOUT", 10))
+
+    _results   = {}         # service → deque of {at, ok, seconds, error}
+    _lock      = threading.Lock()
+    _scheduler = None
+
+    # ─────────────────────── PROBES ───────────────────────
+
+    @classmethod
+    def _probe_openai(cls):
+        from .ai_service import AIChatService, OPENAI_AVAILABLE, _get_openai_client
+
+        if not OPENAI_AVAILABLE:
+            raise RuntimeError("OpenAI Python package not installed. Run: pip install openai")
+        oai_client = _get_openai_client()
+        if oai_client is None:
+            raise RuntimeError("OPENAI_API_KEY not set. Add it to your .env file.")
+        oai_client.with_options(timeout=cls.PROBE_TIMEOUT, max_retries=0).models.retrieve(AIChatService.OPENAI_MODEL)
+
+    @staticmethod
+    def _probe_chromadb():
+        from .rag_service import RAGService
+
+        RAGService.list_partitions()
+
+    @classmethod
+    def _probe_firestore(cls):
+        from config.firebase import db
+
+        db.collection("nodes").limit(1).get(timeout=cls.PROBE_TIMEOUT)
+
+    PROBES = {
+        "openai":    "_probe_openai",
+        "chromadb":  "_probe_chromadb",
+        "firestore": "_probe_firestore",
+    }
+
+    @classmethod
+    def probe_all(cls):
+        """Run every probe once and record the results."""
+        for service, probe in cls.PROBES.items():
+            started = time.perf_counter()
+            try:
+                getattr(cls, probe)()
+                ok, error = True, None
+            except Exception as e:
+                ok, error = False, str(e)
+            result = {
+                "at":      datetime.now(timezone.utc).isoformat(),
+                "ok":      ok,
+                "seconds": round(time.perf_counter() - started, 4),
+                "error":   error,
+            }
+            with cls._lock:
+                cls._results.setdefault(service, deque(maxlen=cls.WINDOW)).append(result)
+            if not ok:
+                print(f"⚠️ Health probe '{service}' failed: {error}")
+
+    @classmethod
+    def start(cls):
+        """Probe now and then every INTERVAL_SECONDS, in this process."""
+        with cls._lock:
+            if cls._scheduler is None:
+                cls._scheduler = BackgroundScheduler()
+                cls._scheduler.add_job(
+                    cls.probe_all, 'interval', seconds=cls.INTERVAL_SECONDS,
+                    next_run_time=datetime.now(timezone.utc), max_instances=1, coalesce=True,
+                )
+                cls._scheduler.start()
+                print(f"🩺 AI health monitor started (every {cls.INTERVAL_SECONDS}s)")
+
+    # ─────────────────────── READ ───────────────────────
+
+    @classmethod
+    def status(cls, service=None):
+        """
+        {service: {status, last_checked, last_error, latency_avg, latency_max,
+        error_rate, samples}} from memory; starts the monitor if needed.
+        """
+        cls.start()
+        with cls._lock:
+            results = {name: list(history) for name, history in cls._results.items()}
+
+        summary = {}
+        for name in cls.PROBES:
+            history = results.get(name, [])
+            if not history:
+                summary[name] = {"status": "pending", "samples": 0}
+                continue
+            last = history[-1]
+            latencies = [r["seconds"] for r in history if r["ok"]]
+            summary[name] = {
+                "status":       "ok" if last["ok"] else "down",
+                "last_checked": last["at"],
+                "last_error":   next((r["error"] for r in reversed(history) if not r["ok"]), None),
+                "latency_avg":  round(sum(latencies) / len(latencies), 4) if latencies else None,
+                "latency_max":  max(latencies) if latencies else None,
+                "error_rate":   round(sum(not r["ok"] for r in history) / len(history), 4),
+                "samples":      len(history),
+            }
+        return summary[service] if service else summary
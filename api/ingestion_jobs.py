@@ -0,0 +1,286 @@
+# api/ingestion_jobs.py
+
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from django.core.files.storage import default_storage
+from config.firebase import db
+from .rag_service import RAGService
+from .knowledge_library_service import KnowledgeLibraryService
+from .fleet_context import FleetContextService
+
+
+class IngestionJobService:
+    """
+    Runs document uploads in the background so the HTTP request returns at once.
+
+    Firebase Structure:
+    └── ingestion_jobs/
+        └── {job_id}/     ← { document_name, crop_type, status, stage, progress,
+                              stages: {extract, chunk, embed, extract_thresholds, save_profile},
+                              result, error, created_at, updated_at }
+
+    Stages per job:  extract → chunk → embed → extract_thresholds → save_profile
+    (extract/chunk/embed are streamed together page by page; their times are
+    split out from the shared pipeline).
+    """
+
+    STAGES = ["extract", "chunk", "embed", "extract_thresholds", "save_profile"]
+
+    # Bounded: every worker can run ONNX embedding on the CPU
+    MAX_WORKERS        = int(os.getenv("INGESTION_WORKERS", 2))
+    # Threshold extraction calls to OpenAI allowed at once across all jobs
+    OPENAI_CONCURRENCY = int(os.getenv("INGESTION_OPENAI_CONCURRENCY", 2))
+    # A queued/running job with no update for this long lost its worker
+    # (the executor is in-process, so a restart drops everything in it)
+    STALE_AFTER_SECONDS = int(os.getenv("INGESTION_STALE_AFTER_SECONDS", 900))
+
+    _executor      = None
+    _executor_lock = threading.Lock()
+    _openai_slots  = threading.BoundedSemaphore(OPENAI_CONCURRENCY)
+
+    # ─────────────────────── SUBMIT ───────────────────────
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(
+                    max_workers=cls.MAX_WORKERS,
+                    thread_name_prefix="ingestion",
+                )
+            return cls._executor
+
+    @classmethod
+    def submit(cls, file_path, full_path, file_ext, document_name, crop_type,
+               description="", content_hash=None, file_size=None):
+        """
+        Queue an already-persisted upload for processing.
+        Returns the job record (including job_id) immediately.
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.now()
+        job = {
+            "job_id":        job_id,
+            "document_name": document_name,
+            "crop_type":     crop_type,
+            "crop_id":       crop_type.lower().replace(" ", "_"),
+            "content_hash":  content_hash,
+            "file_size":     file_size,
+            "status":        "queued",
+            "stage":         None,
+            "progress":      0,
+            "stages":        {name: {"status": "pending"} for name in cls.STAGES},
+            "created_at":    now,
+            "updated_at":    now,
+        }
+        db.collection("ingestion_jobs").document(job_id).set(job)
+
+        cls._get_executor().submit(
+            cls._run, job_id, file_path, full_path, file_ext,
+            document_name, crop_type, description, content_hash, file_size,
+        )
+        print(f"📥 Queued ingestion job {job_id} for '{document_name}'")
+        return job
+
+    # ─────────────────────── STATUS ───────────────────────
+
+    @classmethod
+    def get_job(cls, job_id):
+        doc = db.collection("ingestion_jobs").document(job_id).get()
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        if cls._is_stale(job):
+            job.update(cls._mark_stale(job_id))
+        return job
+
+    @classmethod
+    def get_jobs_for_crop(cls, crop_type, limit=10):
+        crop_id = crop_type.lower().replace(" ", "_")
+        jobs = [
+            doc.to_dict()
+            for doc in db.collection("ingestion_jobs").where("crop_id", "==", crop_id).stream()
+        ]
+        for job in jobs:
+            if cls._is_stale(job):
+                job.update(cls._mark_stale(job["job_id"]))
+        jobs.sort(key=lambda j: j.get("created_at") or datetime.min, reverse=True)
+        return jobs[:limit]
+
+    # ─────────────────────── STALE JOBS ───────────────────────
+
+    @classmethod
+    def _is_stale(cls, job):
+        if job.get("status") not in ("queued", "running"):
+            return False
+        updated_at = job.get("updated_at") or job.get("created_at")
+        if updated_at is None:
+            return True
+        # Written as naive local time; Firestore hands it back tagged UTC
+        age = datetime.now() - updated_at.replace(tzinfo=None)
+        return age.total_seconds() > cls.STALE_AFTER_SECONDS
+
+    @classmethod
+    def _mark_stale(cls, job_id):
+        fields = {"status": "failed", "error": "Processing was interrupted (server restarted). Please upload the document again."}
+        cls._update(job_id, **fields)
+        return fields
+
+    @classmethod
+    def recover_stale_jobs(cls):
+        """
+        Fail queued/running jobs whose worker is gone, so their status stops
+        reading "running" forever. Called once at startup.
+        """
+        try:
+            docs = db.collection("ingestion_jobs").where("status", "in", ["queued", "running"]).stream()
+            stale = [doc.id for doc in docs if cls._is_stale(doc.to_dict())]
+        except Exception as e:
+            print(f"Error checking for stale ingestion jobs: {e}")
+            return 0
+        for job_id in stale:
+            cls._mark_stale(job_id)
+        if stale:
+            print(f"🧹 Marked {len(stale)} interrupted ingestion job(s) as failed")
+        return len(stale)
+
+    @classmethod
+    def _update(cls, job_id, **fields):
+        fields["updated_at"] = datetime.now()
+        try:
+            db.collection("ingestion_jobs").document(job_id).set(fields, merge=True)
+        except Exception as e:
+            print(f"Error updating ingestion job {job_id}: {e}")
+
+    @classmethod
+    def _finish_stage(cls, job_id, stage, seconds, **details):
+        done = cls.STAGES.index(stage) + 1
+        cls._update(
+            job_id,
+            stage=stage,
+            progress=round(100 * done / len(cls.STAGES)),
+            stages={stage: {"status": "done", "seconds": round(seconds, 3), **details}},
+        )
+
+    # ─────────────────────── WORKER ───────────────────────
+
+    @classmethod
+    def _run(cls, job_id, file_path, full_path, file_ext, document_name,
+             crop_type, description, content_hash, file_size):
+        cls._update(job_id, status="running", stage="extract",
+                    stages={"extract": {"status": "running"}})
+        try:
+            # Another job may have finished the same bytes while this one was queued
+            if content_hash:
+                existing = RAGService.find_processed_document(content_hash, crop_type)
+                if existing:
+                    cls._update(job_id, status="completed", progress=100, result={
+                        "document_name":     existing.get("document_name", document_name),
+                        "chunks_created":    existing.get("chunks", 0),
+                        "thresholds":        existing.get("thresholds"),
+                        "already_processed": True,
+                    })
+                    return
+
+            # 1-3. extract → chunk → embed (streamed)
+            started = time.perf_counter()
+
+            def _on_batch(result):
+                cls._update(job_id, stages={"embed": {
+                    "status":   "running",
+                    "chunks":   result["chunks"],
+                    "embedded": result["embedded"],
+                }})
+
+            text, store_result = RAGService.ingest_file(
+                full_path, file_ext, document_name, crop_type, on_batch=_on_batch,
+                content_hash=content_hash, size=file_size,
+            )
+            total = time.perf_counter() - started
+            if not text.strip():
+                raise ValueError("No text content found in document")
+
+            extract_s = store_result.get("extract_seconds", 0.0)
+            embed_s   = store_result.get("embed_seconds", 0.0)
+            cls._finish_stage(job_id, "extract", extract_s, pages=store_result.get("pages", 0))
+            cls._finish_stage(job_id, "chunk", max(0.0, total - extract_s - embed_s),
+                              chunks=store_result.get("chunks", 0))
+            cls._finish_stage(job_id, "embed", embed_s,
+                              embedded=store_result.get("embedded", 0),
+                              unchanged=store_result.get("unchanged", 0))
+
+            # 4. extract thresholds (shared OpenAI concurrency limit)
+            cls._update(job_id, stage="extract_thresholds",
+                        stages={"extract_thresholds": {"status": "running"}})
+            started = time.perf_counter()
+            with cls._openai_slots:
+                extraction = RAGService.extract_thresholds_with_sources(text, crop_type)
+            thresholds = extraction["thresholds"]
+            cls._finish_stage(job_id, "extract_thresholds", time.perf_counter() - started,
+                              count=len(thresholds or {}),
+                              sources=extraction["sources"],
+                              llm_called=extraction["llm_called"])
+
+            # 5. save profile
+            cls._update(job_id, stage="save_profile",
+                        stages={"save_profile": {"status": "running"}})
+            started = time.perf_counter()
+            cls._save_profile(crop_type, thresholds, document_name, description,
+                              content_hash, file_size, store_result)
+            cls._finish_stage(job_id, "save_profile", time.perf_counter() - started)
+
+            cls._update(job_id, status="completed", progress=100, result={
+                "document_name":        document_name,
+                "chunks_created":       store_result.get("chunks", 0),
+                "thresholds_extracted": bool(thresholds),
+                "thresholds":           thresholds,
+                "threshold_sources":    extraction["sources"],
+                "already_processed":    False,
+            })
+            print(f"✓ Ingestion job {job_id} finished for '{document_name}'")
+
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {e}")
+            cls._update(job_id, status="failed", error=str(e))
+
+        finally:
+            try:
+                if default_storage.exists(file_path):
+                    default_storage.delete(file_path)
+            except Exception as e:
+                print(f"Error removing temp upload {file_path}: {e}")
+
+    @staticmethod
+    def _save_profile(crop_type, thresholds, document_name, description,
+                      content_hash, file_size, store_result):
+        # Save to Knowledge Library with processing status
+        KnowledgeLibraryService.save_crop_profile(
+            crop_type=crop_type,
+            thresholds=thresholds,
+            document_name=document_name,
+            description=description,
+            content_hash=content_hash,
+        )
+
+        # Also save to crop_config
+        if thresholds:
+            crop_id = crop_type.lower().replace(" ", "_")
+            db.collection("crop_config").document(crop_id).set({
+                **thresholds,
+                "source_document": document_name,
+                "updated_at": datetime.now(),
+                "is_active": True,
+            }, merge=True)
+            FleetContextService.invalidate_crop(crop_id)
+
+        if content_hash:
+            RAGService.record_document_hash(
+                content_hash, crop_type, document_name,
+                chunks=store_result.get("chunks", 0),
+                thresholds=thresholds,
+                size=file_size,
+            )
@@ -0,0 +1,280 @@
+# api/intent_router.py
+import os
+import re
+import math
+import threading
+
+
+class IntentRouter:
+    """
+    Local first pass over a chat question, before any Firestore read or
+    OpenAI call:
+
+    "off_topic" — no farming keyword, and the question sits closer to the
+                  off-topic prototypes than the farming ones
+    "lookup"    — a plain value question ("what is the current moisture for
+                  Node A") answered from the fleet snapshot with a template
+    "llm"       — everything else: the question needs reasoning
+
+    Keywords are matched with one compiled alternation (English and
+    Filipino). Only questions with no keyword hit are embedded and compared
+    with the prototype sentences; if the embedding model isn't available
+    the question goes to the LLM rather than being rejected.
+    """
+
+    # Matched as word prefixes ("plant" → plants, planting); short ones as whole words
+    KEYWORDS = [
+        # English
+        'crop', 'soil', 'plant', 'grow', 'farm', 'agricultur', 'seed',
+        'fertiliz', 'irrigat', 'harvest', 'pest', 'weed', 'compost',
+        'nitrogen', 'phosphorus', 'potassium', 'moisture', 'humidity',
+        'temperature', 'sensor', 'node', 'reading', 'water', 'rain', 'drought',
+        'tomato', 'lettuce', 'rice', 'corn', 'wheat', 'vegetable', 'leaf', 'leaves',
+        'root', 'fruit', 'garden', 'cultivat', 'organic', 'yield', 'nutrient',
+        'disease', 'fungus', 'lime', 'manure', 'mulch', 'greenhouse',
+        # Filipino/Taglish
+        'lupa', 'halaman', 'palay', 'tanim', 'pananim', 'pataba',
+        'tubig', 'ulan', 'sakahan', 'magsasaka', 'halumigmig',
+        'kamatis', 'gulay', 'prutas', 'binhi', 'peste', 'damo', 'dahon', 'ugat',
+    ]
+    SHORT_KEYWORDS = ['ph', 'npk', 'ani', 'temp']
+
+    FILIPINO_INDICATORS = ['ano', 'paano', 'yung', 'mga', 'ba', 'po']
+
+    # Prototype questions for the embedding check; vague questions about
+    # "my conditions" belong to the farm (the chatbot assumes sensor context)
+    AGRICULTURAL_PROTOTYPES = [
+        "how is my soil doing",
+        "what should I do about my crops",
+        "are my conditions okay",
+        "is it okay",
+        "when should I water my plants",
+        "what fertilizer should I use",
+        "why are the leaves turning yellow",
+        "kumusta ang aking tanim",
+        "ano ang dapat kong gawin sa aking sakahan",
+    ]
+    OFF_TOPIC_PROTOTYPES = [
+        "write me a poem",
+        "who won the basketball game",
+        "tell me a joke",
+        "what is the capital of France",
+        "help me with my math homework",
+        "recommend a movie to watch",
+        "how do I fix my computer",
+        "what is the latest celebrity news",
+        "sino ang pinakasikat na artista",
+    ]
+    OFF_TOPIC_MARGIN = float(os.getenv("CHAT_OFF_TOPIC_MARGIN", 0.05))
+
+    # Value lookups: metric name → (question aliases, reading keys, unit, threshold prefix)
+    METRICS = {
+        "moisture":        (["soil moisture", "moisture", "halumigmig"], ["moisture"], "%", "moisture"),
+        "pH":              (["ph level", "ph"], ["pH", "ph"], "", "ph"),
+        "air temperature": (["air temperature", "air temp"], ["air_temperature"], "°C", None),
+        "soil temperature": (["soil temperature", "soil temp", "temperature", "temp"], ["temperature"], "°C", "temp"),
+        "humidity":        (["humidity"], ["humidity"], "%", None),
+        "nitrogen":        (["nitrogen"], ["nitrogen"], " mg/kg", "nitrogen"),
+        "phosphorus":      (["phosphorus"], ["phosphorus"], " mg/kg", "phosphorus"),
+        "potassium":       (["potassium"], ["potassium"], " mg/kg", "potassium"),
+    }
+    LOOKUP_CUES    = r"\b(?:what(?:'s| is| are)|current|currently|latest|show|give me|reading|value|level|ano ang|ano yung|magkano|gaano)\b"
+    # Anything asking for judgement or advice goes to the LLM
+    REASONING_CUES = (
+        r"\b(?:why|should|how to|how do|how can|how is|how are|recommend|advice|suggest|fix|improve|"
+        r"ok|okay|good|bad|enough|normal|low|high|too|compare|vs|versus|trend|"
+        r"bakit|dapat|paano|gagawin|mabuti|maayos|ayos|mababa|mataas)\b"
+    )
+
+    _keyword_pattern = re.compile(
+        r"\b(?:" + "|".join(sorted(KEYWORDS, key=len, reverse=True)) + r")\w*"
+        r"|\b(?:" + "|".join(SHORT_KEYWORDS) + r")\b",
+        re.IGNORECASE,
+    )
+    _filipino_pattern  = re.compile(r"\b(?:" + "|".join(FILIPINO_INDICATORS) + r")\b", re.IGNORECASE)
+    _lookup_pattern    = re.compile(LOOKUP_CUES, re.IGNORECASE)
+    _reasoning_pattern = re.compile(REASONING_CUES, re.IGNORECASE)
+    _aliases = [
+        (re.compile(r"\b" + re.escape(alias) + r"\b", re.IGNORECASE), metric)
+        for alias, metric in sorted(
+            ((alias, metric) for metric, (aliases, _, _, _) in METRICS.items() for alias in aliases),
+            key=lambda pair: -len(pair[0]),
+        )
+    ]
+
+    # Node ids/names shorter than this ("a", "1") would match ordinary words
+    MIN_NAME_LENGTH = 3
+
+    _prototypes = None
+    _lock       = threading.Lock()
+    _counts     = {"off_topic": 0, "lookup": 0, "llm": 0}
+
+    # ─────────────────────── CLASSIFIERS ───────────────────────
+
+    @classmethod
+    def is_agricultural(cls, question):
+        return bool(cls._keyword_pattern.search(question))
+
+    @classmethod
+    def is_filipino(cls, question):
+        return bool(cls._filipino_pattern.search(question))
+
+    @staticmethod
+    def _cosine(a, b):
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    @classmethod
+    def _get_prototypes(cls):
+        from .rag_service import RAGService
+
+        if cls._prototypes is None:
+            with cls._lock:
+                if cls._prototypes is None:
+                    cls._prototypes = {
+                        "agricultural": [RAGService.embed_query(p) for p in cls.AGRICULTURAL_PROTOTYPES],
+                        "off_topic":    [RAGService.embed_query(p) for p in cls.OFF_TOPIC_PROTOTYPES],
+                    }
+        return cls._prototypes
+
+    @classmethod
+    def is_off_topic(cls, question):
+        """Embedding check, only reached when no keyword matched."""
+        from .rag_service import RAGService
+
+        try:
+            prototypes = cls._get_prototypes()
+            vector = RAGService.embed_query(question)
+        except Exception as e:
+            print(f"⚠️ Intent classifier unavailable ({e}) — sending question to the LLM")
+            return False
+        agricultural = max(cls._cosine(vector, p) for p in prototypes["agricultural"])
+        off_topic    = max(cls._cosine(vector, p) for p in prototypes["off_topic"])
+        return off_topic > agricultural + cls.OFF_TOPIC_MARGIN
+
+    # ─────────────────────── LOOKUPS ───────────────────────
+
+    @classmethod
+    def match_names(cls, question, names):
+        """
+        The names that appear in the question as whole words, so "Node 10"
+        isn't read as Node 1 and "rpi_20" as rpi_2. Longest names claim their
+        text first: "Node A North" doesn't also count as "Node A".
+        """
+        text, found = question, set()
+        for name in sorted({str(n) for n in names if n}, key=len, reverse=True):
+            if len(name) < cls.MIN_NAME_LENGTH:
+                continue
+            pattern = re.compile(r"(?<!\w)" + re.escape(name) + r"(?!\w)", re.IGNORECASE)
+            if pattern.search(text):
+                found.add(name)
+                text = pattern.sub(lambda m: " " * len(m.group()), text)
+        return found
+
+    @classmethod
+    def _named_nodes(cls, question, fleet):
+        named = cls.match_names(question, [v for node in fleet for v in (node.get("node_name"), node["node_id"])])
+        return [
+            node for node in fleet
+            if str(node.get("node_name") or "") in named or str(node["node_id"]) in named
+        ]
+
+    @classmethod
+    def _requested_metrics(cls, question):
+        """Metrics named in the question, in the order they're asked for."""
+        found, text = {}, question
+        # Longest aliases first, so "air temperature" isn't also read as soil temperature
+        for alias, metric in cls._aliases:
+            for match in alias.finditer(text):
+                found.setdefault(metric, match.start())
+            text = alias.sub(lambda m: " " * len(m.group()), text)
+        return sorted(found, key=found.get)
+
+    @classmethod
+    def _format_value(cls, node, metric, filipino):
+        _, keys, unit, threshold = cls.METRICS[metric]
+        latest, thresholds = node.get("latest") or {}, node.get("thresholds") or {}
+        name = node.get("node_name") or node["node_id"]
+        value = next((latest[k] for k in keys if latest.get(k) is not None), None)
+
+        if value is None:
+            return (f"Wala pang {metric} reading ang {name}." if filipino
+                    else f"{name} has no {metric} reading yet.")
+
+        try:
+            shown = f"{float(value):.1f}{unit}"
+        except (TypeError, ValueError):
+            shown = f"{value}{unit}"
+
+        target = ""
+        low, high = thresholds.get(f"{threshold}_min"), thresholds.get(f"{threshold}_max")
+        if threshold and low is not None and high is not None:
+            try:
+                in_range = float(low) <= float(value) <= float(high)
+            except (TypeError, ValueError):
+                in_range = None
+            if in_range is not None:
+                if filipino:
+                    target = f" (target {low}-{high}{unit.strip()}, {'pasok' if in_range else 'wala'} sa tamang saklaw)"
+                else:
+                    target = f" (target {low}-{high}{unit.strip()}, {'within' if in_range else 'out of'} range)"
+
+        if filipino:
+            return f"Ang {metric} ng {name} ay **{shown}**{target}."
+        return f"The {metric} for {name} is **{shown}**{target}."
+
+    @classmethod
+    def lookup_answer(cls, question, fleet):
+        """Template answer for a plain value question, or None when it needs the LLM."""
+        if cls._reasoning_pattern.search(question) or not cls._lookup_pattern.search(question):
+            return None
+        metrics = cls._requested_metrics(question)
+        if not metrics:
+            return None
+        nodes = cls._named_nodes(question, fleet)
+        if not nodes and len(fleet) == 1:
+            nodes = fleet
+        if not nodes:
+            return None
+
+        filipino = cls.is_filipino(question)
+        lines = [cls._format_value(node, metric, filipino) for node in nodes for metric in metrics]
+        offline = [node.get("node_name") or node["node_id"] for node in nodes if node.get("status") == "offline"]
+        if offline:
+            lines.append(
+                f"Paalala: offline ang {', '.join(offline)}, kaya ito ang huling natanggap na reading."
+                if filipino else
+                f"Note: {', '.join(offline)} is offline, so this is the last reading received."
+            )
+        return " ".join(lines)
+
+    # ─────────────────────── ROUTE ───────────────────────
+
+    @classmethod
+    def route(cls, question):
+        """
+        {"intent": "off_topic" | "lookup" | "llm", "answer": str | None}.
+        "lookup" carries its template answer; the other two have none.
+        """
+        from .fleet_context import FleetContextService
+
+        intent, answer = "llm", None
+        if not cls.is_agricultural(question) and cls.is_off_topic(question):
+            intent = "off_topic"
+        elif cls._lookup_pattern.search(question) and cls._requested_metrics(question):
+            try:
+                answer = cls.lookup_answer(question, FleetContextService.get_fleet())
+            except Exception as e:
+                print(f"⚠️ Snapshot lookup failed ({e}) — sending question to the LLM")
+            if answer:
+                intent = "lookup"
+
+        with cls._lock:
+            cls._counts[intent] += 1
+        return {"intent": intent, "answer": answer}
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            return dict(cls._counts)
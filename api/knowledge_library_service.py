@@ -2,6 +2,7 @@
 
 from datetime import datetime
 from config.firebase import db
+from .fleet_context import FleetContextService
 
 
 class KnowledgeLibraryService:
@@ -21,7 +22,7 @@ class KnowledgeLibraryService:
     # ─────────────────────── CROP PROFILES ───────────────────────
 
     @staticmethod
-    def save_crop_profile(crop_type, thresholds, document_name, description=""):
+    def save_crop_profile(crop_type, thresholds, document_name, description="", content_hash=None):
         """
         Save or update a crop profile in the library.
         Tracks which documents have been processed for threshold extraction.
@@ -53,6 +54,8 @@ class KnowledgeLibraryService:
                 "thresholds_extracted": thresholds is not None and len(thresholds) > 0,
                 "threshold_count": len([v for v in (thresholds or {}).values() if v is not None])
         }
+        if content_hash:
+            processed_documents[document_name]["content_hash"] = content_hash
 
         profile = {
             "crop_id": crop_id,
@@ -68,6 +71,7 @@ class KnowledgeLibraryService:
         }
 
         db.collection("crop_profiles").document(crop_id).set(profile, merge=True)
+        FleetContextService.invalidate_crop(crop_id)
         print(f"✓ Saved crop profile: {crop_id} (processed docs: {len(processed_documents)})")
         return profile
 
@@ -109,6 +113,7 @@ class KnowledgeLibraryService:
         db.collection("crop_profiles").document(crop_id).delete()
         # Also delete from crop_config (thresholds)
         db.collection("crop_config").document(crop_id).delete()
+        FleetContextService.invalidate_crop(crop_id)
         print(f"✓ Deleted crop profile: {crop_id}")
 
     # ─────────────────────── ACTIVE CROP SELECTION ───────────────────────
@@ -137,6 +142,8 @@ class KnowledgeLibraryService:
                 {**thresholds, "source": "crop_profiles", "crop_type": crop_id},
                 merge=True
             )
+            FleetContextService.invalidate_crop(crop_id)
+        FleetContextService.update_node(node_id, crop_type=crop_id)
 
         print(f"✓ Node {node_id} → active crop: {crop_id}")
         return {"node_id": node_id, "active_crop": crop_id, "thresholds": thresholds}
@@ -0,0 +1,234 @@
+# api/lexical_index.py
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+
+class LexicalIndex:
+    """
+    Local BM25 inverted index over the same chunks stored in ChromaDB.
+
+    MiniLM similarity blurs exact agronomic terms ("Verticillium",
+    "calamansi", "14-14-14"), so search_knowledge fuses these keyword
+    scores with the vector ranking.
+
+    SQLite (next to chroma_db) is the durable copy; postings are held in
+    memory for sub-millisecond lookups. A generation counter in the meta
+    table lets other worker processes notice writes and reload.
+    """
+
+    K1 = 1.5
+    B  = 0.75
+
+    _TOKEN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+    _PARTS = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.RLock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id      TEXT PRIMARY KEY,
+                document_name TEXT,
+                crop_type     TEXT,
+                text          TEXT NOT NULL,
+                metadata      TEXT NOT NULL,
+                length        INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term     TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf       INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            CREATE INDEX IF NOT EXISTS chunks_document ON chunks (document_name);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._conn.commit()
+
+        self._generation = None
+        self._postings   = defaultdict(dict)   # term → {chunk_id: tf}
+        self._lengths    = {}                  # chunk_id → token count
+        self._chunks     = {}                  # chunk_id → (text, metadata)
+        self._total_len  = 0
+
+    # ─────────────────────── TOKENIZING ───────────────────────
+
+    @classmethod
+    def tokenize(cls, text):
+        """Lowercased terms; compounds like 14-14-14, 5.5 or mg/kg are kept whole plus their parts."""
+        terms = []
+        for match in cls._TOKEN.finditer(text.lower()):
+            token = match.group()
+            terms.append(token)
+            if not token.isalnum():
+                terms.extend(p for p in cls._PARTS.findall(token) if not p.isdigit())
+        return terms
+
+    # ─────────────────────── LOADING ───────────────────────
+
+    def _read_generation(self):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_generation(self):
+        generation = self._read_generation() + 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (str(generation),)
+        )
+        return generation
+
+    def _ensure_loaded(self):
+        generation = self._read_generation()
+        if generation == self._generation:
+            return
+
+        postings = defaultdict(dict)
+        for term, chunk_id, tf in self._conn.execute("SELECT term, chunk_id, tf FROM postings"):
+            postings[term][chunk_id] = tf
+
+        lengths, chunks = {}, {}
+        for chunk_id, text, metadata, length in self._conn.execute(
+            "SELECT chunk_id, text, metadata, length FROM chunks"
+        ):
+            lengths[chunk_id] = length
+            chunks[chunk_id]  = (text, json.loads(metadata))
+
+        self._postings, self._lengths, self._chunks = postings, lengths, chunks
+        self._total_len  = sum(lengths.values())
+        self._generation = generation
+
+    # ─────────────────────── WRITES ───────────────────────
+
+    def _delete_ids(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            self._conn.execute("DELETE FROM postings WHERE chunk_id = ?", (chunk_id,))
+            self._conn.execute("DELETE FROM chunks WHERE chunk_id = ?", (chunk_id,))
+
+    def _forget_in_memory(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            entry = self._chunks.pop(chunk_id, None)
+            if entry is None:
+                continue
+            self._total_len -= self._lengths.pop(chunk_id, 0)
+            for term in set(self.tokenize(entry[0])):
+                posting = self._postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self._postings[term]
+
+    def _commit(self, apply_in_memory):
+        """
+        Bump the generation and commit. If this process's in-memory copy was
+        current, patch it in place instead of reloading everything later.
+        """
+        was_current = self._generation == self._read_generation()
+        generation  = self._bump_generation()
+        self._conn.commit()
+        if was_current:
+            apply_in_memory()
+            self._generation = generation
+
+    def add_chunks(self, items):
+        """Insert or replace an iterable of (chunk_id, text, metadata)."""
+        items = list(items)
+        if not items:
+            return
+        with self._lock:
+            ids = [chunk_id for chunk_id, _, _ in items]
+            self._delete_ids(ids)
+            counted = []
+            for chunk_id, text, metadata in items:
+                counts = Counter(self.tokenize(text))
+                length = sum(counts.values())
+                counted.append((chunk_id, text, metadata, counts, length))
+                self._conn.execute(
+                    "INSERT INTO chunks (chunk_id, document_name, crop_type, text, metadata, length) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (chunk_id, metadata.get("document_name"), metadata.get("crop_type"),
+                     text, json.dumps(metadata), length),
+                )
+                self._conn.executemany(
+                    "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in counts.items()],
+                )
+
+            def _apply():
+                self._forget_in_memory(ids)
+                for chunk_id, text, metadata, counts, length in counted:
+                    self._chunks[chunk_id]  = (text, dict(metadata))
+                    self._lengths[chunk_id] = length
+                    self._total_len += length
+                    for term, tf in counts.items():
+                        self._postings[term][chunk_id] = tf
+
+            self._commit(_apply)
+
+    def remove_chunks(self, chunk_ids):
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._delete_ids(chunk_ids)
+            self._commit(lambda: self._forget_in_memory(chunk_ids))
+
+    def remove_document(self, document_name):
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE document_name = ?", (document_name,)
+            )]
+            self.remove_chunks(ids)
+        return ids
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    # ─────────────────────── SEARCH ───────────────────────
+
+    def search(self, query, n_results=4, crop_type=None, accept=None):
+        """
+        Return [(chunk_id, bm25_score, text, metadata)] best first.
+        `accept(metadata)` can restrict results further (e.g. to a set of partitions).
+        """
+        with self._lock:
+            self._ensure_loaded()
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+
+            scores = defaultdict(float)
+            for term in set(self.tokenize(query)):
+                posting = self._postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self._lengths[chunk_id] / avg_len)
+                    scores[chunk_id] += idf * tf * (self.K1 + 1) / norm
+
+            ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+            results = []
+            for chunk_id, score in ranked:
+                text, metadata = self._chunks[chunk_id]
+                if crop_type and metadata.get("crop_type") != crop_type:
+                    continue
+                if accept is not None and not accept(metadata):
+                    continue
+                results.append((chunk_id, score, text, metadata))
+                if len(results) >= n_results:
+                    break
+            return results
@@ -0,0 +1,138 @@
+# api/llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM responses, keyed by (model, prompt, params).
+
+    For calls whose output only depends on their input and where a repeat
+    answer is fine: threshold extraction on re-uploads, RAGAS eval reruns,
+    the node comparison on dashboard refreshes. Call sites opt in through
+    `cached_call`; LLM_CACHE_BYPASS=true (or bypass=True) skips reads but
+    still refreshes the stored answer.
+
+    Entries expire after `ttl` seconds; beyond `max_entries` the least
+    recently used are evicted.
+    """
+
+    DEFAULT_PATH        = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+    DEFAULT_TTL         = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+    DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+    BYPASS              = os.getenv("LLM_CACHE_BYPASS", "false").lower() == "true"
+
+    _shared      = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path        = path
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self.hits        = 0
+        self.misses      = 0
+        self._lock       = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key        TEXT PRIMARY KEY,
+                   model      TEXT NOT NULL,
+                   response   TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_used  REAL NOT NULL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self._conn.commit()
+
+    @classmethod
+    def shared(cls):
+        """Process-wide instance on the default path."""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        """`prompt` may be a string or a messages list; params are e.g. temperature/max_tokens."""
+        payload = json.dumps([model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and now - row[1] < ttl:
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                self.hits += 1
+                return row[0]
+            if row:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key, model, response):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            # LRU eviction beyond the cap
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "  SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def cached_call(self, model, prompt, params, call, ttl=None, bypass=False, validate=None):
+        """
+        Return the cached response for (model, prompt, params), or run
+        `call()` → str, store it and return it. Empty responses, and ones
+        `validate(response)` rejects, aren't stored.
+        """
+        key = self.make_key(model, prompt, params)
+        if not (bypass or self.BYPASS):
+            cached = self.get(key, ttl)
+            if cached is not None:
+                return cached
+
+        response = call()
+        if isinstance(response, str) and response.strip() and (validate is None or validate(response)):
+            self.set(key, model, response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries":     count,
+            "max_entries": self.max_entries,
+            "ttl":         self.ttl,
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "hit_rate":    round(self.hits / lookups, 4) if lookups else 0.0,
+            "bypass":      self.BYPASS,
+        }
@@ -0,0 +1,370 @@
+# api/llm_gateway.py
+import os
+import time
+import random
+import threading
+
+try:
+    from openai import OpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    print("Warning: openai not installed. Run: pip install openai")
+    OPENAI_AVAILABLE = False
+
+
+class LLMUnavailableError(RuntimeError):
+    """The gateway refused the call: circuit open, or no rate/concurrency slot in time."""
+
+
+class _TokenBucket:
+    """`rate` requests per second on average, bursts of up to `capacity`; rate <= 0 means unlimited."""
+
+    def __init__(self, rate, capacity):
+        self.rate     = rate
+        self.capacity = capacity
+        self._tokens  = capacity
+        self._updated = time.monotonic()
+        self._lock    = threading.Lock()
+
+    def acquire(self, timeout):
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens  = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class _CircuitBreaker:
+    """
+    closed    — calls go through; FAILURES consecutive failed calls open it
+    open      — calls fail fast until COOLDOWN seconds have passed
+    half_open — one trial call; success closes it, failure opens it again
+    """
+
+    def __init__(self, failures, cooldown):
+        self.failures  = failures
+        self.cooldown  = cooldown
+        self.state     = "closed"
+        self._count    = 0
+        self._opened   = 0.0
+        self._trial    = False
+        self._lock     = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened >= self.cooldown:
+                self.state, self._trial = "half_open", False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def release(self):
+        """Give back a half-open trial that was allowed but never made (the call was refused later)."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial = False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.state, self._count = "closed", 0
+                return
+            self._count += 1
+            if self.state == "half_open" or self._count >= self.failures:
+                if self.state != "open":
+                    print(f"🔌 LLM circuit opened after {self._count} failures (cooling down {self.cooldown:.0f}s)")
+                self.state, self._opened = "open", time.monotonic()
+
+
+class _Provider:
+    """Limits, breaker and stats for one LLM provider."""
+
+    def __init__(self, name):
+        prefix = f"LLM_{name.upper()}_"
+        self.name        = name
+        self.bucket      = _TokenBucket(
+            rate=float(os.getenv(prefix + "RPS", 5)),
+            capacity=float(os.getenv(prefix + "BURST", 10)),
+        )
+        self.concurrency = int(os.getenv(prefix + "CONCURRENCY", 8))
+        self.slots       = threading.BoundedSemaphore(self.concurrency)
+        self.breaker     = _CircuitBreaker(
+            failures=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+            cooldown=float(os.getenv("LLM_BREAKER_COOLDOWN", 30)),
+        )
+        self.stats_lock  = threading.Lock()
+        self.stats       = {
+            "calls": 0, "errors": 0, "retries": 0, "rejected": 0,
+            "total_seconds": 0.0, "max_seconds": 0.0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+        }
+
+
+class LLMGateway:
+    """
+    The one way this app calls an LLM (chat, threshold extraction, RAGAS
+    answer generation). Per provider:
+
+    - one pooled client per process (keep-alive HTTP connections)
+    - a token-bucket rate limit and a concurrency cap; a call that can't get
+      a slot within QUEUE_TIMEOUT fails with LLMUnavailableError instead of
+      piling up
+    - MAX_RETRIES retries on 429 / 5xx / timeouts, with jittered exponential
+      backoff
+    - a circuit breaker, so while a provider is down calls fail fast
+    - latency and token counts per call, in stats()
+
+    Settings come from the environment: LLM_<PROVIDER>_RPS / _BURST /
+    _CONCURRENCY, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_QUEUE_TIMEOUT,
+    LLM_TIMEOUT, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN. An RPS of 0
+    turns the rate limit off.
+    """
+
+    MAX_RETRIES   = int(os.getenv("LLM_MAX_RETRIES", 3))
+    BACKOFF_BASE  = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+    BACKOFF_MAX   = float(os.getenv("LLM_BACKOFF_MAX", 8))
+    QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", 20))
+    TIMEOUT       = float(os.getenv("LLM_TIMEOUT", 60))
+
+    PROVIDERS = ("openai", "anthropic", "gemini")
+
+    _clients   = {}
+    _providers = {name: _Provider(name) for name in PROVIDERS}
+    _lock      = threading.Lock()
+
+    # ─────────────────────── CLIENTS ───────────────────────
+
+    @classmethod
+    def client(cls, provider="openai", model=None):
+        """
+        The process-wide client for a provider, or None when its package or
+        API key is missing. Gemini clients are per model.
+        """
+        key = (provider, model) if provider == "gemini" else provider
+        if cls._clients.get(key) is None:
+            with cls._lock:
+                # A missing key isn't remembered, so setting it later takes effect
+                if cls._clients.get(key) is None:
+                    cls._clients[key] = cls._create_client(provider, model)
+        return cls._clients[key]
+
+    @classmethod
+    def _create_client(cls, provider, model):
+        # Retries are ours, so the SDKs' own are turned off
+        if provider == "openai":
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not OPENAI_AVAILABLE or not api_key:
+                return None
+            return OpenAI(api_key=api_key, max_retries=0, timeout=cls.TIMEOUT)
+        if provider == "anthropic":
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            try:
+                from anthropic import Anthropic
+            except ImportError:
+                return None
+            return Anthropic(api_key=api_key, max_retries=0, timeout=cls.TIMEOUT) if api_key else None
+        if provider == "gemini":
+            api_key = os.getenv("GOOGLE_API_KEY")
+            try:
+                import google.generativeai as genai
+            except ImportError:
+                return None
+            if not api_key:
+                return None
+            genai.configure(api_key=api_key)
+            return genai.GenerativeModel(model)
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+    @classmethod
+    def reset_client(cls, provider="openai"):
+        """Drop the pooled client (e.g. after the API key changed)."""
+        with cls._lock:
+            for key in [k for k in cls._clients if k == provider or (isinstance(k, tuple) and k[0] == provider)]:
+                del cls._clients[key]
+
+    # ─────────────────────── CALL ───────────────────────
+
+    @staticmethod
+    def _retryable(e):
+        status = getattr(e, "status_code", None) or getattr(e, "code", None)
+        if isinstance(status, int):
+            return status == 429 or status >= 500
+        return any(word in type(e).__name__ for word in ("Timeout", "Connection", "ServiceUnavailable"))
+
+    @staticmethod
+    def _usage(response):
+        """(prompt_tokens, completion_tokens) for OpenAI / Anthropic / Gemini responses."""
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            return (getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0,
+                    getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            return getattr(usage, "prompt_token_count", 0) or 0, getattr(usage, "candidates_token_count", 0) or 0
+        return 0, 0
+
+    @classmethod
+    def _record(cls, state, seconds, ok, retries, response=None):
+        prompt_tokens, completion_tokens = cls._usage(response) if response is not None else (0, 0)
+        with state.stats_lock:
+            stats = state.stats
+            stats["calls"]             += 1
+            stats["errors"]            += 0 if ok else 1
+            stats["retries"]           += retries
+            stats["total_seconds"]     += seconds
+            stats["max_seconds"]        = max(stats["max_seconds"], seconds)
+            stats["prompt_tokens"]     += prompt_tokens
+            stats["completion_tokens"] += completion_tokens
+
+    @classmethod
+    def _admit(cls, state):
+        """Breaker, rate limit, then a concurrency slot. Caller releases state.slots."""
+        def reject(reason):
+            with state.stats_lock:
+                state.stats["rejected"] += 1
+            raise LLMUnavailableError(f"{state.name}: {reason}")
+
+        if not state.breaker.allow():
+            reject("circuit open after repeated failures, try again shortly")
+        # From here on a refusal must hand back a half-open trial, or the breaker never recovers
+        if not state.bucket.acquire(cls.QUEUE_TIMEOUT):
+            state.breaker.release()
+            reject("rate limit queue is full")
+        if not state.slots.acquire(timeout=cls.QUEUE_TIMEOUT):
+            state.breaker.release()
+            reject("too many concurrent requests")
+
+    @classmethod
+    def call(cls, provider, fn):
+        """
+        Run fn(client) under the provider's limits, retries and breaker and
+        return its result. Used directly for anything not covered below.
+        """
+        state = cls._providers[provider]
+        cls._admit(state)
+        started, retries = time.perf_counter(), 0
+        try:
+            while True:
+                try:
+                    response = fn()
+                    break
+                except Exception as e:
+                    if not cls._retryable(e) or retries >= cls.MAX_RETRIES:
+                        state.breaker.record(not cls._retryable(e))
+                        cls._record(state, time.perf_counter() - started, False, retries)
+                        raise
+                    delay = random.uniform(0, min(cls.BACKOFF_MAX, cls.BACKOFF_BASE * 2 ** retries))
+                    retries += 1
+                    print(f"  ⚠️  {provider} error ({type(e).__name__}), retry {retries}/{cls.MAX_RETRIES} in {delay:.1f}s")
+                    time.sleep(delay)
+        finally:
+            state.slots.release()
+
+        state.breaker.record(True)
+        cls._record(state, time.perf_counter() - started, True, retries, response)
+        return response
+
+    @classmethod
+    def chat(cls, **params):
+        """OpenAI chat.completions.create(**params) through the gateway; returns the response."""
+        client = cls.client("openai")
+        if client is None:
+            raise LLMUnavailableError("openai: not configured (package or OPENAI_API_KEY missing)")
+        return cls.call("openai", lambda: client.chat.completions.create(**params))
+
+    @classmethod
+    def chat_stream(cls, **params):
+        """
+        Streaming chat: yields chunks. Retries only happen before the first
+        chunk; the concurrency slot is held until the stream ends.
+        """
+        client = cls.client("openai")
+        if client is None:
+            raise LLMUnavailableError("openai: not configured (package or OPENAI_API_KEY missing)")
+        state = cls._providers["openai"]
+        started, retries = time.perf_counter(), 0
+
+        cls._admit(state)
+        # healthy is what the breaker hears; a consumer that stops reading
+        # (GeneratorExit) says nothing bad about the provider
+        ok, last, healthy = False, None, True
+        try:
+            while True:
+                try:
+                    stream = client.chat.completions.create(stream=True, **params)
+                    break
+                except Exception as e:
+                    if not cls._retryable(e) or retries >= cls.MAX_RETRIES:
+                        raise
+                    delay = random.uniform(0, min(cls.BACKOFF_MAX, cls.BACKOFF_BASE * 2 ** retries))
+                    retries += 1
+                    time.sleep(delay)
+            for chunk in stream:
+                last = chunk
+                yield chunk
+            ok = True
+        except Exception as e:
+            healthy = not cls._retryable(e)
+            raise
+        finally:
+            state.slots.release()
+            # Always recorded, so a half-open trial can't be left hanging
+            state.breaker.record(healthy)
+            # The closing chunk carries usage when stream_options.include_usage is set
+            cls._record(state, time.perf_counter() - started, ok, retries,
+                        last if ok and getattr(last, "usage", None) else None)
+
+    @classmethod
+    def complete(cls, provider, model, prompt, max_tokens=300, temperature=None):
+        """Single-prompt completion → text, for any provider."""
+        if provider == "openai":
+            params = {"model": model, "messages": [{"role": "user", "content": prompt}], "max_tokens": max_tokens}
+            if temperature is not None:
+                params["temperature"] = temperature
+            return cls.chat(**params).choices[0].message.content
+
+        if provider not in cls.PROVIDERS:
+            raise ValueError(f"Unknown LLM provider: {provider}")
+        client = cls.client(provider, model)
+        if client is None:
+            raise LLMUnavailableError(f"{provider}: not configured (package or API key missing)")
+        if provider == "anthropic":
+            params = {"model": model, "max_tokens": max_tokens, "messages": [{"role": "user", "content": prompt}]}
+            if temperature is not None:
+                params["temperature"] = temperature
+            return cls.call(provider, lambda: client.messages.create(**params)).content[0].text
+        if provider == "gemini":
+            return cls.call(provider, lambda: client.generate_content(prompt)).text
+        raise ValueError(f"Unknown LLM provider: {provider}")
+
+    # ─────────────────────── STATS ───────────────────────
+
+    @classmethod
+    def stats(cls):
+        result = {}
+        for name, state in cls._providers.items():
+            with state.stats_lock:
+                stats = dict(state.stats)
+            calls = stats.pop("calls")
+            total = stats.pop("total_seconds")
+            result[name] = {
+                "calls":       calls,
+                **stats,
+                "avg_seconds": round(total / calls, 3) if calls else 0.0,
+                "max_seconds": round(stats["max_seconds"], 3),
+                "circuit":     state.breaker.state,
+            }
+        return result
@@ -0,0 +1,59 @@
+# api/lru_cache.py
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Small thread-safe in-process LRU cache with optional TTL and hit-rate stats.
+    Shared by the RAG query caches; one instance per cached thing.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize=256, ttl=None, name="cache"):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self.name    = name
+        self._data   = OrderedDict()
+        self._lock   = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, self._MISSING)
+            if entry is not self._MISSING:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name":     self.name,
+                "size":     len(self._data),
+                "maxsize":  self.maxsize,
+                "ttl":      self.ttl,
+                "hits":     self.hits,
+                "misses":   self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
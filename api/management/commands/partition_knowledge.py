@@ -0,0 +1,22 @@
+# api/management/commands/partition_knowledge.py
+
+from django.core.management.base import BaseCommand
+from api.rag_service import RAGService
+
+
+class Command(BaseCommand):
+    help = "Move the legacy single knowledge collection into per-crop partitions and list them"
+
+    def handle(self, **options):
+        result = RAGService.migrate_to_partitions()
+        if result.get("migrated"):
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Moved {result['migrated']} chunks into {len(result['partitions'])} partitions"
+            ))
+        else:
+            self.stdout.write("Nothing to migrate — knowledge is already partitioned.")
+
+        self.stdout.write("\nPartitions:")
+        for partition in RAGService.list_partitions():
+            count = RAGService._get_collection(partition).count()
+            self.stdout.write(f"  → {partition}: {count} chunks")
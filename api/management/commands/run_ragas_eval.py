@@ -21,6 +21,11 @@ class Command(BaseCommand):
                 "or 'all' (default)"
             ),
         )
+        parser.add_argument(
+            "--no-cache",
+            action="store_true",
+            help="Call the models again instead of reusing cached answers from earlier runs",
+        )
         parser.add_argument(
             "--dry-run",
             action="store_true",
@@ -122,8 +127,10 @@ class Command(BaseCommand):
             return
 
         # ── FULL EVAL MODE ────────────────────────────────────────────
+        from api.evaluation import ragas_eval
         from api.evaluation.ragas_eval import run_evaluation, evaluate_model
         model_choice = options["model"]
+        ragas_eval.USE_LLM_CACHE = not options["no_cache"]
 
         if model_choice == "all":
             run_evaluation()
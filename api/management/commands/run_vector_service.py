@@ -0,0 +1,40 @@
+# api/management/commands/run_vector_service.py
+
+from django.core.management.base import BaseCommand
+from api.rag_service import RAGService
+from api.vector_service import VectorServiceServer, DEFAULT_SOCKET_PATH
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the shared vector service: one process owns ChromaDB and the embedding model. "
+        "Point Django workers at it with RAG_VECTOR_SOCKET=<socket path>."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            type=str,
+            default=RAGService.VECTOR_SOCKET or DEFAULT_SOCKET_PATH,
+            help="Unix socket path to listen on (default: RAG_VECTOR_SOCKET or api/vector_service.sock)",
+        )
+
+    def handle(self, **options):
+        # This process is the one that talks to Chroma directly
+        RAGService._serve_locally = True
+        readiness = RAGService.warm_up()
+        if not readiness["ready"]:
+            self.stdout.write(self.style.ERROR(f"❌ Warm-up failed: {readiness['error']}"))
+            return
+
+        server = VectorServiceServer(options["socket"], RAGService)
+        self.stdout.write(self.style.SUCCESS(
+            f"🟢 Vector service listening on {options['socket']} "
+            f"(partitions: {', '.join(RAGService.list_partitions()) or 'none'})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write("\nStopping vector service...")
+        finally:
+            server.server_close()
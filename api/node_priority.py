@@ -0,0 +1,125 @@
+# api/node_priority.py
+import numpy as np
+from .fleet_context import FleetContextService
+
+
+class NodePriorityService:
+    """
+    Ranks the fleet by how far each node's readings sit outside its crop's
+    target ranges — the "which node needs attention first" answer, computed
+    locally and reproducibly from the fleet snapshot.
+
+    For every parameter with both a reading and a target range:
+
+        deviation = max(min - value, value - max, 0) / (max - min)
+
+    i.e. 0 inside the range and 1.0 for a reading one range-width outside it.
+    A node's score is the sum of its deviations plus OFFLINE_PENALTY when it
+    has stopped reporting. Ties rank by node name.
+    """
+
+    # (name, reading keys, threshold prefix, unit)
+    PARAMETERS = [
+        ("moisture",   ["moisture"],    "moisture",   "%"),
+        ("pH",         ["pH", "ph"],    "ph",         ""),
+        ("soil temp",  ["temperature"], "temp",       "°C"),
+        ("nitrogen",   ["nitrogen"],    "nitrogen",   " mg/kg"),
+        ("phosphorus", ["phosphorus"],  "phosphorus", " mg/kg"),
+        ("potassium",  ["potassium"],   "potassium",  " mg/kg"),
+    ]
+
+    OFFLINE_PENALTY = 1.0
+
+    @staticmethod
+    def _number(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    @classmethod
+    def _matrices(cls, fleet):
+        """(values, lows, highs) as nodes × parameters arrays; NaN where unknown."""
+        def column(node, keys):
+            latest = node.get("latest") or {}
+            return next((latest[k] for k in keys if latest.get(k) is not None), None)
+
+        values = np.array([[cls._number(column(n, keys)) for _, keys, _, _ in cls.PARAMETERS] for n in fleet], dtype=float)
+        lows   = np.array([[cls._number((n.get("thresholds") or {}).get(f"{p}_min")) for _, _, p, _ in cls.PARAMETERS] for n in fleet], dtype=float)
+        highs  = np.array([[cls._number((n.get("thresholds") or {}).get(f"{p}_max")) for _, _, p, _ in cls.PARAMETERS] for n in fleet], dtype=float)
+        # A profile with min and max swapped still describes the same range
+        swapped = lows > highs
+        return values, np.where(swapped, highs, lows), np.where(swapped, lows, highs)
+
+    @classmethod
+    def score(cls, fleet):
+        """nodes × parameters matrix of normalized distance outside the target range (0 = in range or unknown)."""
+        values, lows, highs = cls._matrices(fleet)
+        # A one-sided or zero-width range still gives a usable scale: the
+        # magnitude of whichever bound is set (fmax skips the NaN side), at least 1
+        bound = np.fmax(np.fmax(np.abs(lows), np.abs(highs)), 1.0)
+        width = np.where(highs - lows > 0, highs - lows, bound)
+        outside = np.fmax(np.fmax(lows - values, values - highs), 0.0) / width
+        return np.nan_to_num(outside, nan=0.0)
+
+    @classmethod
+    def rank(cls, fleet=None):
+        """
+        [{node_id, node_name, crop_type, status, score, out_of_range: [...], reasons: [str]}]
+        most urgent first.
+        """
+        fleet = FleetContextService.get_fleet() if fleet is None else fleet
+        if not fleet:
+            return []
+
+        deviations = cls.score(fleet)
+        values, lows, highs = cls._matrices(fleet)
+        offline = np.array([n.get("status") == "offline" for n in fleet])
+        scores = deviations.sum(axis=1) + offline * cls.OFFLINE_PENALTY
+
+        ranking = []
+        for i, node in enumerate(fleet):
+            reasons, out = [], []
+            # Worst parameter first
+            for j in np.argsort(-deviations[i], kind="stable"):
+                if deviations[i, j] <= 0:
+                    break
+                name, _, _, unit = cls.PARAMETERS[j]
+                low, high = lows[i, j], highs[i, j]
+                if np.isnan(low):
+                    target = f"the {high:g}{unit} maximum"
+                elif np.isnan(high):
+                    target = f"the {low:g}{unit} minimum"
+                else:
+                    target = f"the {low:g}-{high:g}{unit.strip()} target"
+                side = "below" if values[i, j] < low else "above"
+                out.append(name)
+                reasons.append(f"{name} {values[i, j]:g}{unit} is {side} {target}")
+            if offline[i]:
+                reasons.append("node is offline (readings may be stale)")
+            ranking.append({
+                "node_id":      node["node_id"],
+                "node_name":    node.get("node_name") or node["node_id"],
+                "crop_type":    node.get("crop_type", "default"),
+                "status":       node.get("status"),
+                "score":        round(float(scores[i]), 4),
+                "out_of_range": out,
+                "reasons":      reasons,
+            })
+
+        ranking.sort(key=lambda r: (-r["score"], str(r["node_name"])))
+        return ranking
+
+    @staticmethod
+    def summarize(ranking):
+        """Plain-text answer to "which node needs attention first", from the ranking alone."""
+        if len(ranking) < 2:
+            return "Need at least 2 nodes to compare. / Kailangan ng at least 2 nodes para i-compare."
+        top = ranking[0]
+        if top["score"] <= 0:
+            return "All nodes are within their target ranges; none needs attention right now."
+        summary = f"{top['node_name']} ({top['crop_type'].title()}) needs attention first: {'; '.join(top['reasons'])}."
+        others = [r["node_name"] for r in ranking[1:] if r["score"] > 0]
+        if others:
+            summary += f" Also check: {', '.join(others)}."
+        return summary
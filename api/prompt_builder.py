@@ -0,0 +1,237 @@
+# api/prompt_builder.py
+import os
+import re
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    print("Warning: tiktoken not installed. Run: pip install tiktoken (token counts will be estimated)")
+    TIKTOKEN_AVAILABLE = False
+
+from .intent_router import IntentRouter
+
+
+class PromptBuilder:
+    """
+    Fits the chat context (sensor data, alerts, knowledge) into a token
+    budget so the prompt stays about the same size however many nodes the
+    fleet has.
+
+    Sensor data: nodes named in the question, then nodes with a reading
+    out of range, then offline nodes get the full CURRENT vs TARGET block;
+    every other node gets a one-line summary, and whatever still doesn't
+    fit is folded into a "+N more nodes" count.
+
+    Knowledge: each retrieved chunk is cut down to its sentences that
+    share the most words with the question, kept in their original order.
+    """
+
+    MODEL = "gpt-4o-mini"
+
+    # Tokens for the per-request sections of the system prompt
+    BUDGETS = {
+        "sensor": int(os.getenv("CHAT_SENSOR_TOKEN_BUDGET", 900)),
+        "alerts": int(os.getenv("CHAT_ALERTS_TOKEN_BUDGET", 150)),
+        "rag":    int(os.getenv("CHAT_RAG_TOKEN_BUDGET", 700)),
+    }
+
+    # No tokenizer: ~4 characters per token for English prose
+    CHARS_PER_TOKEN = 4
+
+    STOPWORDS = {
+        "the", "a", "an", "is", "are", "was", "my", "our", "your", "of", "for", "to", "in", "on",
+        "and", "or", "what", "how", "why", "when", "which", "do", "does", "i", "it", "this", "that",
+        "with", "be", "can", "should", "me", "ang", "ng", "sa", "ko", "ba", "po", "mga", "ano", "na",
+    }
+
+    _encoding = None
+
+    # ─────────────────────── TOKENS ───────────────────────
+
+    @classmethod
+    def _get_encoding(cls):
+        if cls._encoding is None and TIKTOKEN_AVAILABLE:
+            try:
+                cls._encoding = tiktoken.encoding_for_model(cls.MODEL)
+            except Exception:
+                cls._encoding = tiktoken.get_encoding("o200k_base")
+        return cls._encoding
+
+    @classmethod
+    def count_tokens(cls, text):
+        if not text:
+            return 0
+        try:
+            encoding = cls._get_encoding()
+        except Exception:
+            encoding = None
+        if encoding is None:
+            return len(text) // cls.CHARS_PER_TOKEN + 1
+        return len(encoding.encode(text))
+
+    @classmethod
+    def truncate(cls, text, budget):
+        """The start of `text`, at most `budget` tokens long."""
+        if budget <= 0:
+            return ""
+        try:
+            encoding = cls._get_encoding()
+        except Exception:
+            encoding = None
+        if encoding is None:
+            # Matches count_tokens' estimate of len // CHARS_PER_TOKEN + 1
+            return text[:(budget - 1) * cls.CHARS_PER_TOKEN]
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= budget else encoding.decode(tokens[:budget])
+
+    # ─────────────────────── SENSOR DATA ───────────────────────
+
+    # (label, reading keys, threshold prefix, unit) compared against the crop's range
+    RANGED = [
+        ("moisture", ["moisture"],    "moisture", "%"),
+        ("pH",       ["pH", "ph"],    "ph",       ""),
+        ("temp",     ["temperature"], "temp",     "°C"),
+    ]
+
+    @classmethod
+    def _readings(cls, node):
+        """[(label, value, unit, in_range | None)] for the ranged readings the node has."""
+        latest, thresholds = node.get("latest") or {}, node.get("thresholds") or {}
+        readings = []
+        for label, keys, prefix, unit in cls.RANGED:
+            raw = next((latest[k] for k in keys if latest.get(k) is not None), None)
+            try:
+                value = float(raw)
+            except (TypeError, ValueError):
+                continue
+            low, high = thresholds.get(f"{prefix}_min"), thresholds.get(f"{prefix}_max")
+            in_range = None
+            if low is not None and high is not None:
+                in_range = float(low) <= value <= float(high)
+            readings.append((label, value, unit, in_range))
+        return readings
+
+    @classmethod
+    def out_of_range(cls, node):
+        return [label for label, _, _, in_range in cls._readings(node) if in_range is False]
+
+    @classmethod
+    def _summary_line(cls, node):
+        name = node.get("node_name") or node["node_id"]
+        crop = (node.get("crop_type") or "default").title()
+        readings = cls._readings(node)
+        values = ", ".join(f"{label} {value:.1f}{unit}" for label, value, unit, _ in readings)
+        out = cls.out_of_range(node)
+        if out:
+            status = "OUT OF RANGE: " + ", ".join(out)
+        elif any(in_range for _, _, _, in_range in readings):
+            status = "in range"
+        else:
+            status = "no targets"
+        if node.get("status") == "offline":
+            status += ", offline"
+        return f"- {name} ({crop}): {values or 'no readings'} | {status}"
+
+    @classmethod
+    def sensor_context(cls, question, fleet, format_block, budget=None):
+        """
+        Sensor section within `budget` tokens. `format_block(node)` renders a
+        node's full block (AIChatService._format_node_context).
+        """
+        budget = cls.BUDGETS["sensor"] if budget is None else budget
+        if not fleet:
+            return "No sensor data available."
+
+        named = {node["node_id"] for node in IntentRouter._named_nodes(question, fleet)}
+
+        def priority(node):
+            if node["node_id"] in named:
+                return 0
+            if cls.out_of_range(node):
+                return 1
+            if node.get("status") == "offline":
+                return 2
+            return 3
+
+        ranked = sorted(fleet, key=priority)
+        blocks, summaries, used, left_out = [], [], 0, 0
+        for node in ranked:
+            if priority(node) < 3:
+                block = format_block(node)
+                cost = cls.count_tokens(block)
+                if used + cost <= budget:
+                    blocks.append(block)
+                    used += cost
+                    continue
+            line = cls._summary_line(node)
+            cost = cls.count_tokens(line)
+            if used + cost <= budget:
+                summaries.append(line)
+                used += cost
+            else:
+                left_out += 1
+
+        parts = blocks
+        if summaries:
+            parts.append("\nOther nodes (one line each):\n" + "\n".join(summaries))
+        if left_out:
+            parts.append(f"\n+{left_out} more nodes not shown.")
+        return "\n".join(parts)
+
+    # ─────────────────────── ALERTS ───────────────────────
+
+    @classmethod
+    def alerts_context(cls, alerts, budget=None):
+        budget = cls.BUDGETS["alerts"] if budget is None else budget
+        lines, used = [], 0
+        for message in alerts:
+            line = f"⚠️ {message}"
+            cost = cls.count_tokens(line)
+            if used + cost > budget:
+                lines.append(f"(+{len(alerts) - len(lines)} more alerts)")
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(lines)
+
+    # ─────────────────────── KNOWLEDGE ───────────────────────
+
+    @classmethod
+    def _terms(cls, text):
+        return {w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in cls.STOPWORDS and len(w) > 1}
+
+    @classmethod
+    def trim_chunk(cls, text, question, budget):
+        """
+        The chunk's sentences most relevant to the question, in original order,
+        within `budget` tokens. When no sentence fits on its own (tables, bullet
+        lists without full stops), the most relevant one is cut to the budget.
+        """
+        if cls.count_tokens(text) <= budget:
+            return text
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+        terms = cls._terms(question)
+        scored = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(terms & cls._terms(sentences[i])), i),
+        )
+        keep, used = set(), 0
+        for i in scored:
+            cost = cls.count_tokens(sentences[i])
+            if used + cost > budget:
+                continue
+            keep.add(i)
+            used += cost
+        if not keep:
+            return cls.truncate(sentences[scored[0]], budget) if sentences else ""
+        return " … ".join(sentences[i] for i in sorted(keep))
+
+    @classmethod
+    def rag_chunks(cls, question, results, budget=None):
+        """search_knowledge results with each text trimmed to an equal share of the budget."""
+        budget = cls.BUDGETS["rag"] if budget is None else budget
+        if not results:
+            return results
+        share = budget // len(results)
+        return [{**res, "text": cls.trim_chunk(res["text"], question, share)} for res in results]
@@ -2,24 +2,21 @@
 import os
 import json
 import re
+import copy
+import time
 import datetime
+import threading
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
-# ── OpenAI ──────────────────────────────────────────────────────────────────
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    print("Warning: openai not installed. Run: pip install openai")
-    OPENAI_AVAILABLE = False
+# ── OpenAI (through the shared gateway) ─────────────────────────────────────
+from .llm_gateway import LLMGateway
 
-openai_client = None
-if OPENAI_AVAILABLE:
-    api_key = os.getenv('OPENAI_API_KEY')
-    if api_key:
-        openai_client = OpenAI(api_key=api_key)
-    else:
-        print("Warning: OPENAI_API_KEY not found in environment variables")
+if not os.getenv('OPENAI_API_KEY'):
+    print("Warning: OPENAI_API_KEY not found in environment variables")
 
 # ── ChromaDB ────────────────────────────────────────────────────────────────
 try:
@@ -43,58 +40,477 @@ try:
 except ImportError:
     DOCX_AVAILABLE = False
 
+from .embedding_cache import EmbeddingCache
+from .chunker import TextChunker
+from .lru_cache import LRUCache
+from .lexical_index import LexicalIndex
+from .document_manifest import DocumentManifest
+from .threshold_extractor import ThresholdExtractor
+from .llm_cache import LLMCache
+from .vector_service import VectorServiceClient, RemoteCollection, RemoteEmbeddingFunction
+
+RAG_DATA_DIR         = os.path.dirname(__file__)
+CHROMA_PATH          = os.path.join(RAG_DATA_DIR, "chroma_db")
+EMBEDDING_CACHE_PATH = os.path.join(RAG_DATA_DIR, "embedding_cache.sqlite3")
+LEXICAL_INDEX_PATH   = os.path.join(RAG_DATA_DIR, "lexical_index.sqlite3")
+MANIFEST_PATH        = os.path.join(RAG_DATA_DIR, "document_manifest.sqlite3")
+
+# One ChromaDB collection per crop ("agricultural_knowledge_tomato", ...) plus a
+# shared "general" partition; the old single collection is migrated on first use.
+LEGACY_COLLECTION = "agricultural_knowledge"
+COLLECTION_PREFIX = "agricultural_knowledge_"
+GENERAL_PARTITION = "general"
+
+
+def _extract_pdf_page_range(file_path, start, end):
+    """
+    Process-pool worker: extract pages [start, end) of a PDF.
+    Returns a list of (page_number, text) with 1-based page numbers.
+    """
+    pages = []
+    with pdfplumber.open(file_path) as pdf:
+        for index in range(start, end):
+            page  = pdf.pages[index]
+            parts = []
+            # Extract regular text
+            extracted = page.extract_text()
+            if extracted:
+                parts.append(extracted)
+            # Extract tables separately — important for NPK tables.
+            # The table finder is driven by ruling lines, so pages without
+            # any line/rect edges cannot yield tables and are skipped.
+            if page.edges:
+                for table in page.extract_tables():
+                    for row in table:
+                        # Filter empty cells and join row as readable text
+                        row_text = " | ".join(
+                            str(cell).strip() for cell in row if cell
+                        )
+                        if row_text.strip():
+                            parts.append(row_text)
+            pages.append((index + 1, "\n".join(parts)))
+            page.flush_cache()
+    return pages
+
 
 class RAGService:
     OPENAI_MODEL = "gpt-4o-mini"
-    _chroma_client = None
-    _collection    = None
+    EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+    _chroma_client      = None
+    _collections        = {}      # partition → collection
+    _embedding_function = None
+    _embedding_cache    = None
+    _lexical_index      = None
+    _manifest           = None
+
+    # Reentrant: the getters below build on each other (client → migration → collection)
+    _init_lock          = threading.RLock()
+    _warm_thread        = None
+    # A failed warm-up is retried by the next health probe after this long
+    WARM_RETRY_SECONDS  = float(os.getenv("RAG_WARM_RETRY_SECONDS", 30))
+    _warm_failed_at     = None
+
+    # With RAG_VECTOR_SOCKET set, Chroma and the ONNX model live in one
+    # `manage.py run_vector_service` process and this class is a thin client
+    VECTOR_SOCKET       = os.getenv("RAG_VECTOR_SOCKET") or None
+    _vector_client      = None
+    _serve_locally      = False   # set inside the vector service process itself
+    _readiness          = {"status": "cold", "steps": {}, "seconds": None, "error": None}
+
+    # "hybrid" (BM25 + vector, reciprocal rank fusion), "vector" or "lexical"
+    SEARCH_MODES       = ("hybrid", "vector", "lexical")
+    SEARCH_MODE        = os.getenv("RAG_SEARCH_MODE", "hybrid")
+    RRF_K              = 60
+
+    EMBED_BATCH_SIZE   = 64
+    PDF_WORKERS        = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+    PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+    _pdf_pool          = None
+    _pdf_pool_lock     = threading.Lock()
+
+    # Farmers repeat the same few questions; both caches are per process
+    SEARCH_CACHE_TTL        = float(os.getenv("SEARCH_CACHE_TTL", 60))
+    _query_embedding_cache  = LRUCache(maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 1024)),
+                                       name="query_embeddings")
+    _search_cache           = LRUCache(maxsize=int(os.getenv("SEARCH_CACHE_SIZE", 256)),
+                                       ttl=SEARCH_CACHE_TTL, name="search_results")
 
     # ─────────────────────── CHROMA INIT ────────────────────────────────────
 
     @classmethod
-    def _get_collection(cls):
-        if cls._collection is not None:
-            return cls._collection
+    def _get_vector_client(cls):
+        """The vector service client, or None when Chroma runs in this process."""
+        if not cls.VECTOR_SOCKET or cls._serve_locally:
+            return None
+        if cls._vector_client is None:
+            with cls._init_lock:
+                if cls._vector_client is None:
+                    cls._vector_client = VectorServiceClient(cls.VECTOR_SOCKET)
+        return cls._vector_client
 
+    @classmethod
+    def _get_client(cls):
         if not CHROMA_AVAILABLE:
             raise RuntimeError("ChromaDB not installed.")
 
         if cls._chroma_client is None:
-            chroma_path = os.path.join(os.path.dirname(__file__), "chroma_db")
-            os.makedirs(chroma_path, exist_ok=True)
-            cls._chroma_client = chromadb.PersistentClient(path=chroma_path)
-
-        ef = embedding_functions.DefaultEmbeddingFunction()
-        cls._collection = cls._chroma_client.get_or_create_collection(
-            name="agricultural_knowledge",
-            embedding_function=ef,
+            with cls._init_lock:
+                if cls._chroma_client is None:
+                    os.makedirs(CHROMA_PATH, exist_ok=True)
+                    cls._chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+                    try:
+                        cls.migrate_to_partitions()
+                    except Exception as e:
+                        print(f"Could not migrate legacy knowledge collection: {e}")
+        return cls._chroma_client
+
+    @staticmethod
+    def partition_for(crop_type):
+        """Partition key for a crop: normalized crop id, or 'general' for untagged documents."""
+        crop_id = (crop_type or "").strip().lower().replace(" ", "_")
+        if crop_id in ("", "general", "default"):
+            return GENERAL_PARTITION
+        return re.sub(r"[^a-z0-9_-]", "_", crop_id)[:40].strip("_-") or GENERAL_PARTITION
+
+    @staticmethod
+    def _collection_names(client):
+        # chromadb < 0.6 returns Collection objects, newer versions return names
+        return {c if isinstance(c, str) else c.name for c in client.list_collections()}
+
+    @classmethod
+    def _get_collection(cls, partition=GENERAL_PARTITION):
+        collection = cls._collections.get(partition)
+        if collection is not None:
+            return collection
+
+        with cls._init_lock:
+            collection = cls._collections.get(partition)
+            if collection is None:
+                if cls._get_vector_client():
+                    collection = RemoteCollection(cls._get_vector_client(), partition)
+                else:
+                    collection = cls._get_client().get_or_create_collection(
+                        name=f"{COLLECTION_PREFIX}{partition}",
+                        embedding_function=cls._get_embedding_function(),
+                    )
+                cls._collections[partition] = collection
+        return collection
+
+    @classmethod
+    def list_partitions(cls):
+        # Listed from ChromaDB each time: another worker process may have added a crop
+        if cls._get_vector_client():
+            return cls._get_vector_client().call("list_partitions")
+        return sorted(
+            name[len(COLLECTION_PREFIX):]
+            for name in cls._collection_names(cls._get_client())
+            if name.startswith(COLLECTION_PREFIX)
         )
-        return cls._collection
+
+    @classmethod
+    def route_partitions(cls, crop_types=None, include_general=True):
+        """
+        Partitions a query should touch: the given crops (that exist) plus the
+        shared general partition. No crops → every partition.
+        """
+        existing = set(cls.list_partitions())
+        if not crop_types:
+            return sorted(existing)
+        wanted = {cls.partition_for(c) for c in crop_types if c}
+        if include_general:
+            wanted.add(GENERAL_PARTITION)
+        return sorted(wanted & existing)
+
+    @classmethod
+    def migrate_to_partitions(cls):
+        """
+        One-time move from the single legacy 'agricultural_knowledge' collection
+        into per-crop collections. Embeddings are copied, not recomputed.
+        """
+        if cls._get_vector_client():
+            # The vector service migrates when it opens the store
+            return {"migrated": 0}
+        client = cls._get_client()
+        if LEGACY_COLLECTION not in cls._collection_names(client):
+            return {"migrated": 0}
+
+        legacy = client.get_collection(LEGACY_COLLECTION, embedding_function=cls._get_embedding_function())
+        data = legacy.get(include=["documents", "metadatas", "embeddings"])
+        by_partition = {}
+        for row in zip(data.get("ids", []), data.get("documents", []),
+                       data.get("metadatas", []), data.get("embeddings", [])):
+            by_partition.setdefault(cls.partition_for(row[2].get("crop_type")), []).append(row)
+
+        for partition, rows in by_partition.items():
+            collection = cls._get_collection(partition)
+            for start in range(0, len(rows), 500):
+                ids, docs, metas, embs = zip(*rows[start:start + 500])
+                collection.upsert(ids=list(ids), documents=list(docs), metadatas=list(metas),
+                                  embeddings=[list(map(float, e)) for e in embs])
+
+        client.delete_collection(LEGACY_COLLECTION)
+        moved = sum(len(rows) for rows in by_partition.values())
+        print(f"✓ Moved {moved} chunks into {len(by_partition)} crop partitions")
+        return {"migrated": moved, "partitions": sorted(by_partition)}
+
+    @classmethod
+    def _iter_all_chunks(cls, include):
+        for partition in cls.list_partitions():
+            data = cls._get_collection(partition).get(include=include)
+            yield from zip(data.get("ids", []), *(data.get(key, []) for key in include))
+
+    @classmethod
+    def _get_embedding_function(cls):
+        if cls._embedding_function is None:
+            if not CHROMA_AVAILABLE and not cls._get_vector_client():
+                raise RuntimeError("ChromaDB not installed.")
+            with cls._init_lock:
+                if cls._embedding_function is None:
+                    if cls._get_vector_client():
+                        ef = RemoteEmbeddingFunction(cls._get_vector_client())
+                    else:
+                        ef = embedding_functions.DefaultEmbeddingFunction()
+                    # The ONNX session is built on first call; do it here, under the
+                    # lock, so concurrent first requests don't each load the model
+                    ef(["warm up"])
+                    cls._embedding_function = ef
+        return cls._embedding_function
+
+    @classmethod
+    def _get_embedding_cache(cls):
+        if cls._embedding_cache is None:
+            with cls._init_lock:
+                if cls._embedding_cache is None:
+                    cls._embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, cls.EMBEDDING_MODEL)
+        return cls._embedding_cache
+
+    @classmethod
+    def _get_lexical_index(cls):
+        if cls._lexical_index is None:
+            with cls._init_lock:
+                if cls._lexical_index is None:
+                    cls._lexical_index = cls._open_lexical_index()
+        return cls._lexical_index
+
+    @classmethod
+    def _open_lexical_index(cls):
+        index = LexicalIndex(LEXICAL_INDEX_PATH)
+        # One-time backfill for chunks stored before the index existed
+        if index.count() == 0:
+            existing = list(cls._iter_all_chunks(["documents", "metadatas"]))
+            if existing:
+                print("Building lexical index from existing ChromaDB chunks...")
+                index.add_chunks(existing)
+        return index
+
+    @classmethod
+    def _get_manifest(cls):
+        if cls._manifest is None:
+            with cls._init_lock:
+                if cls._manifest is None:
+                    cls._manifest = cls._open_manifest()
+        return cls._manifest
+
+    @classmethod
+    def _open_manifest(cls):
+        manifest = DocumentManifest(MANIFEST_PATH)
+        # One-time backfill for documents stored before the manifest existed
+        if manifest.count() == 0:
+            existing = list(cls._iter_all_chunks(["metadatas"]))
+            if existing:
+                print("Building document manifest from existing ChromaDB chunks...")
+                by_name = {}
+                for chunk_id, meta in existing:
+                    name = meta.get("document_name")
+                    if not name:
+                        continue
+                    entry = by_name.setdefault(name, {"crop_type": meta.get("crop_type", "general"), "chunks": []})
+                    entry["chunks"].append((meta.get("chunk_index", 0), chunk_id, meta.get("chunk_hash")))
+                for name, entry in by_name.items():
+                    entry["chunks"].sort(key=lambda c: c[0])
+                    hashes = [h for _, _, h in entry["chunks"]]
+                    manifest.upsert(
+                        name, entry["crop_type"],
+                        [chunk_id for _, chunk_id, _ in entry["chunks"]],
+                        hashes if all(hashes) else None,
+                    )
+        return manifest
+
+    # ─────────────────────── WARM START ─────────────────────────────────────
+
+    @classmethod
+    def warm_up(cls):
+        """
+        Load everything the first chat/search would otherwise load lazily:
+        the ONNX model (with a dummy embedding), the Chroma client and
+        partitions, the BM25 postings, the manifest and the chunk tokenizer.
+        Safe to call from several threads.
+        """
+        steps = {}
+
+        def _step(name, fn):
+            started = time.perf_counter()
+            fn()
+            with cls._init_lock:
+                steps[name] = round(time.perf_counter() - started, 3)
+
+        def _set(status, seconds=None, error=None):
+            with cls._init_lock:
+                cls._readiness = {"status": status, "steps": steps, "seconds": seconds, "error": error}
+                cls._warm_failed_at = time.monotonic() if status == "failed" else None
+
+        _set("warming")
+        started = time.perf_counter()
+        try:
+            _step("embedding_model", cls._get_embedding_function)
+            _step("chroma", lambda: [cls._get_collection(p).count()
+                                     for p in cls.list_partitions() or [GENERAL_PARTITION]])
+            _step("embedding_cache", cls._get_embedding_cache)
+            _step("lexical_index", lambda: cls._get_lexical_index().search("warm up", 1))
+            _step("manifest", cls._get_manifest)
+            _step("tokenizer", TextChunker._get_tokenizer)
+        except Exception as e:
+            _set("failed", round(time.perf_counter() - started, 3), str(e))
+            print(f"RAG warm-up failed: {e}")
+            return cls.readiness()
+
+        _set("ready", round(time.perf_counter() - started, 3))
+        print(f"✓ RAG warm-up finished in {round(time.perf_counter() - started, 3)}s")
+        return cls.readiness()
+
+    @classmethod
+    def start_warm_up(cls):
+        """
+        Run warm_up in a background thread so boot isn't blocked. Runs once,
+        unless it failed: then a later call retries after WARM_RETRY_SECONDS.
+        """
+        with cls._init_lock:
+            retry = (
+                cls._warm_thread is not None
+                and not cls._warm_thread.is_alive()
+                and cls._warm_failed_at is not None
+                and time.monotonic() - cls._warm_failed_at >= cls.WARM_RETRY_SECONDS
+            )
+            if cls._warm_thread is None or retry:
+                cls._warm_thread = threading.Thread(target=cls.warm_up, name="rag-warm-up", daemon=True)
+                cls._warm_thread.start()
+        return cls._warm_thread
+
+    @classmethod
+    def readiness(cls):
+        with cls._init_lock:
+            state = copy.deepcopy(cls._readiness)
+            loaded = cls._embedding_function is not None and bool(cls._collections)
+        if state["status"] in ("cold", "failed") and loaded:
+            state["status"] = "ready"   # loaded lazily by a request instead
+        state["ready"] = state["status"] == "ready"
+        return state
+
+    # ─────────────────────── EMBEDDINGS ─────────────────────────────────────
+
+    @classmethod
+    def embed_texts(cls, texts, hashes=None):
+        """
+        Embed texts through the on-disk cache.
+        Only texts whose SHA-256 is not cached yet go through the ONNX model.
+        """
+        if not texts:
+            return []
+
+        hashes = hashes or [EmbeddingCache.hash_text(t) for t in texts]
+        try:
+            cache  = cls._get_embedding_cache()
+            cached = cache.get_many(hashes)
+        except Exception as e:
+            print(f"Embedding cache unavailable: {e}")
+            cache, cached = None, {}
+
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+
+        if missing:
+            ef = cls._get_embedding_function()
+            vectors = ef(list(missing.values()))
+            fresh = {h: [float(x) for x in v] for h, v in zip(missing.keys(), vectors)}
+            cached.update(fresh)
+            if cache is not None:
+                try:
+                    cache.put_many(fresh.items())
+                except Exception as e:
+                    print(f"Embedding cache write error: {e}")
+
+        return [cached[h] for h in hashes]
 
     # ─────────────────────── TEXT EXTRACTION ────────────────────────────────
 
-    @staticmethod
-    def extract_text_from_pdf(file_path):
+    @classmethod
+    def extract_text_from_pdf(cls, file_path):
+        return "\n".join(text for _, text in cls.iter_pdf_pages(file_path) if text)
+
+    @classmethod
+    def _get_pdf_pool(cls):
+        with cls._pdf_pool_lock:
+            if cls._pdf_pool is None:
+                # spawn: forking a threaded Django worker is not safe
+                cls._pdf_pool = ProcessPoolExecutor(
+                    max_workers=cls.PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return cls._pdf_pool
+
+    @classmethod
+    def _reset_pdf_pool(cls, pool):
+        """Drop a broken pool so the next PDF gets a fresh one."""
+        with cls._pdf_pool_lock:
+            if cls._pdf_pool is pool:
+                cls._pdf_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def iter_pdf_pages(cls, file_path):
+        """
+        Yield (page_number, text) for every page, in order.
+
+        Page ranges are parsed in parallel on a shared process pool and
+        yielded as soon as each range is done, so chunking and embedding
+        can start before the whole PDF has been read.
+        """
         if not PDF_AVAILABLE:
             raise RuntimeError("pdfplumber not installed. Run: pip install pdfplumber")
-        text = []
+
         with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                # Extract regular text
-                extracted = page.extract_text()
-                if extracted:
-                    text.append(extracted)
-                # Extract tables separately — important for NPK tables
-                tables = page.extract_tables()
-                for table in tables:
-                    for row in table:
-                        # Filter empty cells and join row as readable text
-                        row_text = " | ".join(
-                            str(cell).strip() for cell in row if cell
-                        )
-                        if row_text.strip():
-                            text.append(row_text)
-        return "\n".join(text)
+            page_count = len(pdf.pages)
+
+        step   = max(1, cls.PDF_PAGES_PER_TASK)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+        # Small documents are not worth the process start-up and pickling
+        if len(ranges) <= 1 or cls.PDF_WORKERS <= 1:
+            for start, end in ranges:
+                yield from _extract_pdf_page_range(file_path, start, end)
+            return
+
+        pool, futures, done = cls._get_pdf_pool(), [], 0
+        try:
+            for start, end in ranges:
+                futures.append(pool.submit(_extract_pdf_page_range, file_path, start, end))
+            for future in futures:
+                pages = future.result()
+                done += 1
+                yield from pages
+        except BrokenProcessPool:
+            # A worker died (OOM, segfault in the PDF parser); the pool is
+            # unusable from here on, so replace it and finish in-process
+            print("⚠️ PDF worker pool broke — finishing extraction in-process")
+            cls._reset_pdf_pool(pool)
+            for start, end in ranges[done:]:
+                yield from _extract_pdf_page_range(file_path, start, end)
+        finally:
+            # Consumer stopped early or failed — don't keep parsing
+            for future in futures:
+                future.cancel()
 
     @staticmethod
     def extract_text_from_docx(file_path):
@@ -108,85 +524,386 @@ class RAGService:
         with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
             return f.read()
 
+    @classmethod
+    def iter_document_pages(cls, file_path, file_ext):
+        """Yield (page_number, text) pairs; DOCX and TXT come out as a single page."""
+        file_ext = file_ext.lower()
+        if file_ext == "pdf":
+            yield from cls.iter_pdf_pages(file_path)
+        elif file_ext == "docx":
+            yield 1, cls.extract_text_from_docx(file_path)
+        elif file_ext == "txt":
+            yield 1, cls.extract_text_from_txt(file_path)
+        else:
+            raise ValueError(f"Unsupported file type: {file_ext}")
+
+    @classmethod
+    def extract_text(cls, file_path, file_ext):
+        return "\n".join(text for _, text in cls.iter_document_pages(file_path, file_ext) if text)
+
     # ─────────────────────── CHUNKING ───────────────────────────────────────
 
     @staticmethod
-    def chunk_text(text, chunk_size=500, overlap=50):
-        words  = text.split()
-        chunks = []
-        start  = 0
-        while start < len(words):
-            end = min(start + chunk_size, len(words))
-            chunks.append(" ".join(words[start:end]))
-            start += chunk_size - overlap
-        return chunks
+    def iter_chunks(pages, max_tokens=None, overlap_tokens=None):
+        """
+        Stream sentence/table-row aligned chunks sized for MiniLM's 256-token
+        window out of an iterable of (page_number, text). See TextChunker.
+        """
+        return TextChunker.iter_chunks(pages, max_tokens, overlap_tokens)
+
+    @classmethod
+    def chunk_text(cls, text, max_tokens=None, overlap_tokens=None):
+        return [c["text"] for c in cls.iter_chunks([(1, text)], max_tokens, overlap_tokens)]
 
     # ─────────────────────── STORE DOCUMENT ─────────────────────────────────
 
     @classmethod
     def store_document(cls, text, document_name, crop_type="general"):
-        collection = cls._get_collection()
-        chunks     = cls.chunk_text(text)
-
-        ids, docs, metas = [], [], []
-        for i, chunk in enumerate(chunks):
-            chunk_id = f"{document_name}_{i}"
-            ids.append(chunk_id)
-            docs.append(chunk)
+        return cls.store_pages([(1, text)], document_name, crop_type)
+
+    @classmethod
+    def store_pages(cls, pages, document_name, crop_type="general", on_batch=None,
+                    content_hash=None, size=None):
+        """
+        Chunk, embed and upsert a document given as (page_number, text) pairs.
+        `pages` may be a generator that is still parsing — chunks are embedded
+        and written in batches as they become available.
+        `on_batch(result)` is called after every batch written.
+
+        Re-indexing is a diff against the manifest: chunk ids are derived from
+        the chunk text, so unchanged chunks keep their id and are skipped (or
+        get a metadata-only update if they moved), new or edited chunks are
+        embedded, and ids the new version no longer produces are deleted in
+        one call at the end.
+
+        Chunks go to the crop's own partition (see partition_for). Before each
+        batch is written, its ids are added to the document's manifest entry,
+        so an ingest that fails partway still leaves a record of every chunk
+        it may have stored and the next re-index removes them as orphans.
+        """
+        partition  = cls.partition_for(crop_type)
+        collection = cls._get_collection(partition)
+        manifest   = cls._get_manifest()
+        lexical    = cls._get_lexical_index()   # before writing, so its backfill sees the old state
+        result = {"status": "stored", "chunks": 0, "document": document_name,
+                  "embedded": 0, "unchanged": 0, "removed": 0, "embed_seconds": 0.0}
+
+        previous = manifest.get(document_name)
+        if previous and cls.partition_for(previous["crop_type"]) != partition:
+            # Re-tagged to another crop: drop the old partition's copy; the
+            # re-embed below is served from the embedding cache
+            cls._get_collection(cls.partition_for(previous["crop_type"])).delete(ids=previous["chunk_ids"])
+            lexical.remove_chunks(previous["chunk_ids"])
+            result["removed"] = len(previous["chunk_ids"])
+            old_ids = set()
+        elif previous:
+            old_ids = set(previous["chunk_ids"])
+        else:
+            old_ids = set(collection.get(where={"document_name": document_name}, include=[]).get("ids", []))
+
+        chunk_ids, chunk_hashes = [], []
+        seen_hashes = {}
+
+        def _record_pending(ids):
+            # Write-ahead: everything that may be stored for this document right now
+            pending = list(old_ids) + [i for i in chunk_ids + ids if i not in old_ids]
+            manifest.upsert(document_name, crop_type, pending)
+
+        def _flush(batch):
+            ids, hashes = cls._store_chunk_batch(
+                collection, batch, document_name, crop_type, result, old_ids, seen_hashes,
+                before_write=_record_pending,
+            )
+            chunk_ids.extend(ids)
+            chunk_hashes.extend(hashes)
+            if on_batch:
+                on_batch(result)
+
+        batch = []
+        for chunk in cls.iter_chunks(pages):
+            batch.append(chunk)
+            if len(batch) >= cls.EMBED_BATCH_SIZE:
+                _flush(batch)
+                batch = []
+        if batch:
+            _flush(batch)
+
+        # Chunks the previous version had and this one doesn't
+        orphans = list(old_ids.difference(chunk_ids))
+        if orphans:
+            collection.delete(ids=orphans)
+            lexical.remove_chunks(orphans)
+            result["removed"] += len(orphans)
+
+        if result["chunks"] > result["unchanged"] or result["removed"]:
+            cls.invalidate_search_cache()
+
+        manifest.upsert(
+            document_name, crop_type, chunk_ids, chunk_hashes,
+            content_hash=content_hash, size=size,
+        )
+        return result
+
+    @classmethod
+    def ingest_file(cls, file_path, file_ext, document_name, crop_type="general", on_batch=None,
+                    content_hash=None, size=None):
+        """
+        Stream a file from parser to vector store.
+        Returns (full_text, store_result); the text is still needed for threshold extraction.
+        store_result also carries pages / extract_seconds / embed_seconds for stage timing.
+        """
+        page_texts = []
+        extract_seconds = 0.0
+
+        def _pages():
+            nonlocal extract_seconds
+            pages = cls.iter_document_pages(file_path, file_ext)
+            while True:
+                started = time.perf_counter()
+                try:
+                    page_number, page_text = next(pages)
+                except StopIteration:
+                    return
+                finally:
+                    extract_seconds += time.perf_counter() - started
+                page_texts.append(page_text or "")
+                yield page_number, page_text
+
+        store_result = cls.store_pages(_pages(), document_name, crop_type, on_batch=on_batch,
+                                       content_hash=content_hash, size=size)
+        store_result["pages"] = len(page_texts)
+        store_result["extract_seconds"] = round(extract_seconds, 3)
+        store_result["embed_seconds"] = round(store_result["embed_seconds"], 3)
+        return "\n".join(t for t in page_texts if t), store_result
+
+    @classmethod
+    def _store_chunk_batch(cls, collection, chunks, document_name, crop_type, result,
+                           old_ids, seen_hashes, before_write=None):
+        started = time.perf_counter()
+        first_index = result["chunks"]
+        ids, metas, hashes = [], [], []
+        for offset, chunk in enumerate(chunks):
+            chunk_hash = EmbeddingCache.hash_text(chunk["text"])
+            # Content-addressed id; repeated identical chunks get an occurrence suffix
+            occurrence = seen_hashes.get(chunk_hash, 0)
+            seen_hashes[chunk_hash] = occurrence + 1
+            chunk_id = f"{document_name}_{chunk_hash[:16]}"
+            ids.append(chunk_id if occurrence == 0 else f"{chunk_id}_{occurrence}")
+            hashes.append(chunk_hash)
             metas.append({
                 "document_name": document_name,
                 "crop_type":     crop_type,
-                "chunk_index":   i,
-                "total_chunks":  len(chunks),
+                "chunk_index":   first_index + offset,
+                "chunk_hash":    chunk_hash,
+                "char_start":    chunk["char_start"],
+                "char_end":      chunk["char_end"],
+                "page_start":    chunk["page_start"],
+                "page_end":      chunk["page_end"],
+                "token_count":   chunk["tokens"],
             })
+        texts = [chunk["text"] for chunk in chunks]
+        result["chunks"] += len(chunks)
+        if before_write:
+            before_write(ids)
+
+        # Only ids the previous version had can already be stored; the rest are new
+        known  = [chunk_id for chunk_id in ids if chunk_id in old_ids]
+        stored = {}
+        if known:
+            existing = collection.get(ids=known, include=["metadatas"])
+            stored   = dict(zip(existing.get("ids", []), existing.get("metadatas", [])))
 
-        if ids:
-            collection.upsert(ids=ids, documents=docs, metadatas=metas)
+        upsert_idx, update_idx = [], []
+        for i, chunk_id in enumerate(ids):
+            old_meta = stored.get(chunk_id)
+            if not old_meta or old_meta.get("chunk_hash") != hashes[i]:
+                upsert_idx.append(i)
+            elif any(old_meta.get(k) != v for k, v in metas[i].items()):
+                update_idx.append(i)
+            else:
+                result["unchanged"] += 1
 
-        return {"status": "stored", "chunks": len(chunks), "document": document_name}
+        if upsert_idx:
+            embeddings = cls.embed_texts(
+                [texts[i] for i in upsert_idx],
+                hashes=[hashes[i] for i in upsert_idx],
+            )
+            collection.upsert(
+                ids=[ids[i] for i in upsert_idx],
+                documents=[texts[i] for i in upsert_idx],
+                metadatas=[metas[i] for i in upsert_idx],
+                embeddings=embeddings,
+            )
+            result["embedded"] += len(upsert_idx)
+
+        # Keep the BM25 index on the same chunks (text or metadata changed)
+        if upsert_idx or update_idx:
+            cls._get_lexical_index().add_chunks(
+                (ids[i], texts[i], metas[i]) for i in upsert_idx + update_idx
+            )
+
+        # Same text, only metadata moved — no re-embedding
+        if update_idx:
+            collection.update(
+                ids=[ids[i] for i in update_idx],
+                metadatas=[metas[i] for i in update_idx],
+            )
+            result["unchanged"] += len(update_idx)
+
+        result["embed_seconds"] += time.perf_counter() - started
+        return ids, hashes
 
     # ─────────────────────── SEARCH ─────────────────────────────────────────
 
+    @staticmethod
+    def _normalize_query(query):
+        # MiniLM is uncased and whitespace-insensitive, so this doesn't change the embedding
+        return " ".join(query.lower().split())
+
     @classmethod
-    def search_knowledge(cls, query, n_results=4, crop_type=None):
+    def embed_query(cls, query):
+        key = cls._normalize_query(query)
+        vector = cls._query_embedding_cache.get(key)
+        if vector is None:
+            vector = [float(x) for x in cls._get_embedding_function()([key])[0]]
+            cls._query_embedding_cache.set(key, vector)
+        return vector
+
+    @classmethod
+    def search_knowledge(cls, query, n_results=4, crop_type=None, mode=None, crop_types=None):
+        """
+        Retrieve chunks for a query.
+
+        mode="vector"  — MiniLM similarity (ChromaDB)
+        mode="lexical" — BM25 over the local inverted index
+        mode="hybrid"  — both, fused with reciprocal rank fusion (default)
+
+        Scope:
+        crop_type="Tomato"          — only the tomato partition
+        crop_types=["Tomato", ...]  — those crops' partitions plus "general"
+        neither                     — every partition
+        """
+        mode = mode if mode in cls.SEARCH_MODES else cls.SEARCH_MODE
+        scope = (crop_type, tuple(sorted({c for c in crop_types or [] if c})))
+        cache_key = (cls._normalize_query(query), n_results, scope, mode)
+        cached = cls._search_cache.get(cache_key)
+        if cached is not None:
+            return copy.deepcopy(cached)
+
         try:
-            collection = cls._get_collection()
-            kwargs = {"query_texts": [query], "n_results": n_results}
             if crop_type:
-                kwargs["where"] = {"crop_type": crop_type}
-            results = collection.query(**kwargs)
+                partitions = cls.route_partitions([crop_type], include_general=False)
+            else:
+                partitions = cls.route_partitions(crop_types)
+
+            if not partitions:
+                items = []
+            elif mode == "vector":
+                items = cls._vector_search(query, n_results, partitions)
+            elif mode == "lexical":
+                items = cls._lexical_search(query, n_results, partitions)
+            else:
+                items = cls._hybrid_search(query, n_results, partitions)
 
-            items = []
+            cls._search_cache.set(cache_key, copy.deepcopy(items))
+            return items
+
+        except Exception as e:
+            print(f"RAG search error: {e}")
+            return []
+
+    @classmethod
+    def _vector_search(cls, query, n_results, partitions):
+        # Same embedding, same space in every partition — distances compare directly
+        query_embedding = cls.embed_query(query)
+        items = []
+        for partition in partitions:
+            collection = cls._get_collection(partition)
+            size = collection.count()
+            if not size:
+                continue
+            results = collection.query(
+                query_embeddings=[query_embedding], n_results=min(n_results, size),
+            )
             if results and results.get("documents"):
-                for doc, meta, dist in zip(
+                for chunk_id, doc, meta, dist in zip(
+                    results["ids"][0],
                     results["documents"][0],
                     results["metadatas"][0],
                     results["distances"][0],
                 ):
-                    items.append({"text": doc, "metadata": meta, "distance": dist})
-            return items
+                    items.append({"id": chunk_id, "text": doc, "metadata": meta, "distance": dist})
+        items.sort(key=lambda item: item["distance"])
+        return items[:n_results]
+
+    @classmethod
+    def _lexical_search(cls, query, n_results, partitions):
+        partitions = set(partitions)
+        return [
+            {"id": chunk_id, "text": text, "metadata": meta, "distance": None, "bm25": round(score, 4)}
+            for chunk_id, score, text, meta in cls._get_lexical_index().search(
+                query, n_results,
+                accept=lambda meta: cls.partition_for(meta.get("crop_type")) in partitions,
+            )
+        ]
 
+    @classmethod
+    def _hybrid_search(cls, query, n_results, partitions):
+        # Over-fetch from both rankers so fusion has something to reorder
+        depth   = max(n_results * 3, 10)
+        lexical = cls._lexical_search(query, depth, partitions)
+        try:
+            vector = cls._vector_search(query, depth, partitions)
         except Exception as e:
-            print(f"RAG search error: {e}")
-            return []
+            print(f"Vector search failed, using lexical only: {e}")
+            vector = []
+
+        fused = {}
+        for ranking in (vector, lexical):
+            for rank, item in enumerate(ranking):
+                entry = fused.setdefault(item["id"], {**item, "rrf_score": 0.0})
+                entry["rrf_score"] += 1.0 / (cls.RRF_K + rank + 1)
+                if item.get("distance") is not None:
+                    entry["distance"] = item["distance"]
+                if "bm25" in item:
+                    entry["bm25"] = item["bm25"]
+
+        ranked = sorted(fused.values(), key=lambda i: i["rrf_score"], reverse=True)[:n_results]
+        for item in ranked:
+            item["rrf_score"] = round(item["rrf_score"], 6)
+        return ranked
+
+    @classmethod
+    def invalidate_search_cache(cls):
+        """
+        Drop cached search results after the collection changed.
+        Query embeddings stay valid — they depend only on the query text and model.
+        Other worker processes keep theirs until SEARCH_CACHE_TTL runs out.
+        """
+        cls._search_cache.clear()
+
+    @classmethod
+    def cache_stats(cls):
+        return {
+            "query_embeddings": cls._query_embedding_cache.stats(),
+            "search_results":   cls._search_cache.stats(),
+        }
 
     # ─────────────────────── LIST DOCUMENTS ─────────────────────────────────
 
     @classmethod
     def list_documents(cls):
         try:
-            collection = cls._get_collection()
-            all_items  = collection.get()
-            seen, docs = set(), []
-            for meta in all_items.get("metadatas", []):
-                name = meta.get("document_name")
-                if name and name not in seen:
-                    seen.add(name)
-                    docs.append({
-                        "name":      name,
-                        "crop_type": meta.get("crop_type", "general"),
-                    })
-            return docs
+            return [
+                {
+                    "name":       entry["name"],
+                    "crop_type":  entry["crop_type"] or "general",
+                    "chunks":     len(entry["chunk_ids"]),
+                    "size":       entry["size"],
+                    "created_at": entry["created_at"],
+                }
+                for entry in cls._get_manifest().list()
+            ]
         except Exception as e:
             print(f"List documents error: {e}")
             return []
@@ -201,23 +918,33 @@ class RAGService:
         from config.firebase import db
 
         try:
-            collection = cls._get_collection()
-            all_items  = collection.get()
-            ids_to_del = []
-            crop_type_found = None
-            
-            for doc_id, meta in zip(
-                all_items.get("ids", []),
-                all_items.get("metadatas", []),
-            ):
-                if meta.get("document_name") == document_name:
-                    ids_to_del.append(doc_id)
-                    if not crop_type_found:
-                        crop_type_found = meta.get("crop_type", "general")       
+            manifest   = cls._get_manifest()
+            entry      = manifest.get(document_name)
+            collection = None
+
+            if entry:
+                ids_to_del      = entry["chunk_ids"]
+                crop_type_found = entry["crop_type"] or "general"
+                collection      = cls._get_collection(cls.partition_for(crop_type_found))
+            else:
+                # Not in the manifest — look the chunks up by metadata, not a full scan
+                ids_to_del, crop_type_found = [], None
+                for partition in cls.list_partitions():
+                    found = cls._get_collection(partition).get(
+                        where={"document_name": document_name}, include=["metadatas"],
+                    )
+                    if found.get("ids"):
+                        collection      = cls._get_collection(partition)
+                        ids_to_del      = found["ids"]
+                        crop_type_found = found["metadatas"][0].get("crop_type", "general")
+                        break
                         
             #Delete from ChromaDB
             if ids_to_del:
                 collection.delete(ids=ids_to_del)
+                cls.invalidate_search_cache()
+            cls._get_lexical_index().remove_document(document_name)
+            manifest.remove(document_name)
                 
             # Remove from processed_documents in Firebase
             if crop_type_found:
@@ -245,6 +972,8 @@ class RAGService:
                         "document_count": len(documents),
                         "updated_at": datetime.now()
                     })
+
+                cls.forget_document_hash(document_name, crop_type_found)
                 
                 print(f" Removed '{document_name}' from processing records")
                 
@@ -262,39 +991,181 @@ class RAGService:
 
     # ─────────────────────── THRESHOLD EXTRACTION (GPT-4o-mini) ─────────────
 
+    THRESHOLD_FIELDS = [
+        "moisture_min", "moisture_max", "ph_min", "ph_max", "temp_min", "temp_max",
+        "nitrogen_min", "nitrogen_max", "phosphorus_min", "phosphorus_max",
+        "potassium_min", "potassium_max", "humidity_min", "humidity_max",
+    ]
+
+    # Documents up to this many words still go out in one call
+    THRESHOLD_SINGLE_CALL_WORDS = 3000
+    # Map-reduce: words per map call, max map calls per document, calls in flight
+    THRESHOLD_MAP_WORDS         = int(os.getenv("THRESHOLD_MAP_WORDS", 1500))
+    THRESHOLD_MAP_MAX_CALLS     = int(os.getenv("THRESHOLD_MAP_MAX_CALLS", 8))
+    THRESHOLD_MAP_CONCURRENCY   = int(os.getenv("THRESHOLD_MAP_CONCURRENCY", 4))
+    _threshold_slots            = threading.BoundedSemaphore(THRESHOLD_MAP_CONCURRENCY)
+
+    # Chunks worth sending: numbers next to a unit the thresholds are expressed in
+    _UNIT_PATTERN = re.compile(
+        r"\d\s*(?:%|°\s*[CF]\b|degrees|mg\s*/\s*kg|ppm|kg\s*/\s*ha)|\bpH\b|\bNPK\b|\b[NPK]\s*[:=]\s*\d",
+        re.IGNORECASE,
+    )
+
     @classmethod
-    def extract_thresholds_from_text(cls, text, crop_type):
+    def extract_thresholds_from_text(cls, text, crop_type, use_cache=True):
         """
-        Use GPT-4o-mini to extract numeric growing thresholds from a document.
+        Extract numeric growing thresholds from a document.
         Returns a dict of threshold values, or an empty dict on failure.
         """
-        if not OPENAI_AVAILABLE or openai_client is None:
-            print("OpenAI not available for threshold extraction.")
+        return cls.extract_thresholds_with_sources(text, crop_type, use_cache)["thresholds"]
+
+    @classmethod
+    def extract_thresholds_with_sources(cls, text, crop_type, use_cache=True):
+        """
+        Rules first, LLM for the rest.
+
+        ThresholdExtractor reads plainly stated ranges locally. GPT-4o-mini is
+        asked for fields the rules left empty AND that the document mentions
+        at all — a manual that never talks about humidity doesn't cost a call
+        for it — plus the rule values ThresholdExtractor marks as uncertain,
+        which the LLM's answer replaces. LLM answers go through the LLMCache
+        unless use_cache=False, so reprocessing the same text is free.
+
+        Returns {thresholds, sources: {field: "rules" | "llm"}, llm_fields, llm_called}.
+        """
+        thresholds, uncertain = ThresholdExtractor.extract_with_confidence(text)
+        sources    = {key: "rules" for key in thresholds}
+
+        missing    = [key for key in cls.THRESHOLD_FIELDS if key not in thresholds]
+        mentioned  = set(ThresholdExtractor.mentions(text, missing)) | uncertain
+        llm_fields = [key for key in cls.THRESHOLD_FIELDS if key in mentioned]
+        llm_called = False
+        if llm_fields and LLMGateway.client("openai") is not None:
+            llm_called = True
+            for key, value in cls._extract_thresholds_llm(text, crop_type, llm_fields, use_cache).items():
+                if key in llm_fields:
+                    thresholds[key] = value
+                    sources[key] = "llm"
+        elif llm_fields:
+            print("OpenAI not available for threshold extraction; using rule-based values only.")
+
+        # Rules and LLM may have filled opposite ends of a pair
+        for key in cls.THRESHOLD_FIELDS[::2]:
+            pair = key[:-len("_min")] + "_max"
+            if key in thresholds and pair in thresholds and thresholds[key] > thresholds[pair]:
+                thresholds[key], thresholds[pair] = thresholds[pair], thresholds[key]
+                sources[key], sources[pair] = sources[pair], sources[key]
+
+        ordered = {key: thresholds[key] for key in cls.THRESHOLD_FIELDS if key in thresholds}
+        print(f"✓ Thresholds for '{crop_type}': "
+              f"{sum(1 for v in sources.values() if v == 'rules')} from rules, "
+              f"{sum(1 for v in sources.values() if v == 'llm')} from LLM")
+        return {
+            "thresholds": ordered,
+            "sources":    {key: sources[key] for key in ordered},
+            "llm_fields": llm_fields,
+            "llm_called": llm_called,
+        }
+
+    @classmethod
+    def _extract_thresholds_llm(cls, text, crop_type, fields=None, use_cache=True):
+        """
+        Ask GPT-4o-mini for `fields` (default: all). Short documents go out in
+        one call. Longer ones are map-reduced: chunks that carry numeric units
+        are packed into a few map calls (run in parallel, bounded by
+        THRESHOLD_MAP_CONCURRENCY) and the partial results are merged with
+        merge_threshold_results.
+        """
+        if len(text.split()) <= cls.THRESHOLD_SINGLE_CALL_WORDS:
+            return cls._extract_thresholds_call(text, crop_type, fields, use_cache)
+
+        batches = cls._threshold_candidate_batches(text)
+        if not batches:
+            print("No unit-bearing passages found for threshold extraction.")
             return {}
 
-        # Truncate to keep within token limits (~3000 words ≈ 4000 tokens)
-        words = text.split()
-        if len(words) > 3000:
-            text = " ".join(words[:3000]) + "...[truncated]"
+        def _map(batch):
+            with cls._threshold_slots:
+                return cls._extract_thresholds_call(batch, crop_type, fields, use_cache)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(len(batches), cls.THRESHOLD_MAP_CONCURRENCY),
+                                thread_name_prefix="threshold-map") as pool:
+            partials = list(pool.map(_map, batches))
 
+        merged = cls.merge_threshold_results(partials)
+        print(f"✓ Threshold map-reduce: {len(batches)} calls, "
+              f"{sum(1 for p in partials if p)} with values, {time.perf_counter() - started:.1f}s")
+        return merged
+
+    @classmethod
+    def _threshold_candidate_batches(cls, text):
+        """
+        Pick chunks that mention numeric units and pack them, in document
+        order, into at most THRESHOLD_MAP_MAX_CALLS batches of THRESHOLD_MAP_WORDS.
+        When there are more candidates than fit, the densest chunks win.
+        """
+        candidates = []
+        for position, chunk in enumerate(cls.chunk_text(text)):
+            hits = len(cls._UNIT_PATTERN.findall(chunk))
+            if hits:
+                candidates.append((position, hits, chunk))
+
+        budget = cls.THRESHOLD_MAP_WORDS * cls.THRESHOLD_MAP_MAX_CALLS
+        chosen, used = [], 0
+        for position, hits, chunk in sorted(candidates, key=lambda c: c[1], reverse=True):
+            words = len(chunk.split())
+            if used + words > budget:
+                continue
+            chosen.append((position, chunk))
+            used += words
+        chosen.sort()
+
+        batches, current, current_words = [], [], 0
+        for _, chunk in chosen:
+            words = len(chunk.split())
+            if current and current_words + words > cls.THRESHOLD_MAP_WORDS:
+                batches.append("\n...\n".join(current))
+                current, current_words = [], 0
+            current.append(chunk)
+            current_words += words
+        if current:
+            batches.append("\n...\n".join(current))
+        return batches[:cls.THRESHOLD_MAP_MAX_CALLS]
+
+    @classmethod
+    def merge_threshold_results(cls, partials):
+        """
+        Reduce step. A field found in several passages takes the median of
+        the reported values (one outlier table can't win); a min that ends
+        up above its max is swapped.
+        """
+        values = {}
+        for partial in partials:
+            for key, value in (partial or {}).items():
+                if key not in cls.THRESHOLD_FIELDS:
+                    continue
+                try:
+                    values.setdefault(key, []).append(float(value))
+                except (TypeError, ValueError):
+                    continue
+
+        merged = {key: round(statistics.median(found), 2) for key, found in values.items()}
+        for key in cls.THRESHOLD_FIELDS[::2]:
+            pair = key[:-len("_min")] + "_max"
+            if key in merged and pair in merged and merged[key] > merged[pair]:
+                merged[key], merged[pair] = merged[pair], merged[key]
+        return {key: merged[key] for key in cls.THRESHOLD_FIELDS if key in merged}
+
+    @classmethod
+    def _extract_thresholds_call(cls, text, crop_type, fields=None, use_cache=True):
+        """One extraction prompt → {field: number} with nulls dropped, {} on failure."""
+        structure = ",\n".join(f'    "{key}": <number or null>' for key in fields or cls.THRESHOLD_FIELDS)
         prompt = f"""You are an agricultural expert. Extract growing thresholds from the text below for crop: {crop_type}
 
 Return ONLY a valid JSON object (no markdown, no explanation) with this exact structure:
 {{
-    "moisture_min": <number or null>,
-    "moisture_max": <number or null>,
-    "ph_min": <number or null>,
-    "ph_max": <number or null>,
-    "temp_min": <number or null>,
-    "temp_max": <number or null>,
-    "nitrogen_min": <number or null>,
-    "nitrogen_max": <number or null>,
-    "phosphorus_min": <number or null>,
-    "phosphorus_max": <number or null>,
-    "potassium_min": <number or null>,
-    "potassium_max": <number or null>,
-    "humidity_min": <number or null>,
-    "humidity_max": <number or null>
+{structure}
 }}
 
 Rules:
@@ -305,18 +1176,33 @@ Rules:
 TEXT:
 {text}"""
 
-        try:
-            response = openai_client.chat.completions.create(
+        def _strip_fences(raw):
+            return re.sub(r"```(?:json)?", "", raw).strip().rstrip("```").strip()
+
+        def _parses(raw):
+            try:
+                json.loads(_strip_fences(raw))
+                return True
+            except ValueError:
+                return False
+
+        def _call():
+            response = LLMGateway.chat(
                 model=cls.OPENAI_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=400,
                 temperature=0.1,    # Low temp for structured extraction
             )
+            return response.choices[0].message.content.strip()
 
-            raw = response.choices[0].message.content.strip()
+        try:
+            raw = LLMCache.shared().cached_call(
+                cls.OPENAI_MODEL, prompt, {"max_tokens": 400, "temperature": 0.1},
+                _call, bypass=not use_cache, validate=_parses,
+            )
 
             # Strip markdown fences if present
-            raw = re.sub(r"```(?:json)?", "", raw).strip().rstrip("```").strip()
+            raw = _strip_fences(raw)
 
             thresholds = json.loads(raw)
 
@@ -330,6 +1216,83 @@ TEXT:
             print(f"Threshold extraction error: {e}")
             return {}
 
+# ─────────────────────── CONTENT-ADDRESSED DEDUPLICATION ────────────────
+
+    @classmethod
+    def find_processed_document(cls, content_hash, crop_type):
+        """
+        Look up an uploaded file by the SHA-256 of its bytes.
+
+        document_hashes/{sha256} = {
+            size, crops: {crop_id: {document_name, chunks, thresholds, processed_at}}
+        }
+
+        Returns the record for this crop, or None if these exact bytes
+        have never been processed for it. Thresholds are extracted per crop,
+        so the same file uploaded for another crop is still processed.
+        """
+        from config.firebase import db
+
+        try:
+            crop_id = crop_type.lower().replace(" ", "_")
+            doc = db.collection("document_hashes").document(content_hash).get()
+            if doc.exists:
+                record = doc.to_dict().get("crops", {}).get(crop_id)
+                if record:
+                    print(f"✓ Content {content_hash[:12]} already processed for '{crop_type}' "
+                          f"as '{record.get('document_name')}'")
+                    return record
+            return None
+
+        except Exception as e:
+            print(f"Error checking document hash: {e}")
+            return None
+
+    @classmethod
+    def record_document_hash(cls, content_hash, crop_type, document_name,
+                             chunks, thresholds, size=None):
+        """Remember that these bytes have been chunked and extracted for a crop."""
+        from config.firebase import db
+
+        try:
+            crop_id = crop_type.lower().replace(" ", "_")
+            db.collection("document_hashes").document(content_hash).set({
+                "content_hash": content_hash,
+                "size":         size,
+                "crops": {
+                    crop_id: {
+                        "document_name": document_name,
+                        "chunks":        chunks,
+                        "thresholds":    thresholds or {},
+                        "processed_at":  datetime.now(),
+                    }
+                },
+            }, merge=True)
+        except Exception as e:
+            print(f"Error recording document hash: {e}")
+
+    @classmethod
+    def forget_document_hash(cls, document_name, crop_type):
+        """Drop the hash record of a deleted document so a re-upload is processed again."""
+        from config.firebase import db
+
+        try:
+            crop_id = crop_type.lower().replace(" ", "_")
+            matches = (
+                db.collection("document_hashes")
+                .where(f"crops.{crop_id}.document_name", "==", document_name)
+                .get()
+            )
+            for doc in matches:
+                crops = doc.to_dict().get("crops", {})
+                crops.pop(crop_id, None)
+                if crops:
+                    doc.reference.update({"crops": crops})
+                else:
+                    doc.reference.delete()
+        except Exception as e:
+            print(f"Error removing document hash: {e}")
+
 # ─────────────────────── CHECK IF DOCUMENT PROCESSED ────────────────────
 
     @classmethod
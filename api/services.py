@@ -1,6 +1,7 @@
 # api/services.py
 from datetime import datetime, timezone, timedelta
 from config.firebase import db
+from .fleet_context import FleetContextService
 
 class IoTService:
 
@@ -48,6 +49,11 @@ class IoTService:
         }
         # Use merge=True so we don't accidentally delete crop_type
         node_ref.set(node_data, merge=True)
+        FleetContextService.update_node(
+            node_id, reading=payload,
+            node_name=node_name, status="online", last_seen=payload["timestamp"],
+            crop_type=node_doc.to_dict().get("crop_type") if node_doc.exists else None,
+        )
 
         # 👇 ADD THIS LINE TO FIX THE STUCK ALERT 👇
         cls.resolve_alert(node_id, "disconnected")
@@ -225,5 +231,7 @@ class IoTService:
 
                 if time_diff > timeout and node.get("status") != "offline":
                     node_doc.reference.update({"status": "offline"})
+                    FleetContextService.update_node(safe_node_id, status="offline")
                 elif time_diff <= timeout and node.get("status") == "offline":
-                    node_doc.reference.update({"status": "online"})
\ No newline at end of file
+                    node_doc.reference.update({"status": "online"})
+                    FleetContextService.update_node(safe_node_id, status="online")
\ No newline at end of file
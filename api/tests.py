@@ -1,3 +1,369 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .ai_service import AIChatService, _StreamCleaner
+from .answer_cache import AnswerCache
+from .chunker import TextChunker
+from .document_manifest import DocumentManifest
+from .intent_router import IntentRouter
+from .lexical_index import LexicalIndex
+from .llm_cache import LLMCache
+from .llm_gateway import LLMGateway, LLMUnavailableError, _CircuitBreaker, _Provider, _TokenBucket
+from .node_priority import NodePriorityService
+from .prompt_builder import PromptBuilder
+from .rag_service import RAGService
+from .threshold_extractor import ThresholdExtractor
+
+
+class ThresholdExtractorTests(SimpleTestCase):
+    def test_reads_plain_ranges(self):
+        text = "pH ranging from 5.5 to 6.5. Soil temperature of 65–75°F. Nitrogen 20-40 mg/kg."
+        self.assertEqual(ThresholdExtractor.extract(text), {
+            "ph_min": 5.5, "ph_max": 6.5,
+            "temp_min": 18.3, "temp_max": 23.9,
+            "nitrogen_min": 20.0, "nitrogen_max": 40.0,
+        })
+
+    def test_ignores_durations_and_counts(self):
+        for text in (
+            "Moisture stress at 7 to 14 days.",
+            "The pH 6.0 soil had 3 to 4 weeks.",
+            "In 2019 to 2020 soil moisture trials, 5 to 10 plots were used.",
+            "Apply nitrogen 100 to 120 kg/ha.",
+            "Soil moisture 20-30%DM.",
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(ThresholdExtractor.extract(text), {})
+
+    def test_requires_units_for_temperature_and_moisture(self):
+        self.assertEqual(ThresholdExtractor.extract("Soil moisture 40 to 60 in the trial."), {})
+        self.assertEqual(ThresholdExtractor.extract("Temperature 20 to 25 was recorded."), {})
+
+    def test_one_sided_bounds_need_a_target(self):
+        self.assertEqual(ThresholdExtractor.extract("Temperatures above 35°C reduce fruit set."), {})
+        values, uncertain = ThresholdExtractor.extract_with_confidence("Keep soil temperature below 30°C.")
+        self.assertEqual(values, {"temp_max": 30.0})
+        self.assertEqual(uncertain, {"temp_max"})
+
+    def test_disagreeing_statements_are_uncertain(self):
+        _, uncertain = ThresholdExtractor.extract_with_confidence(
+            "Soil moisture 40-60%. Later: soil moisture 70-90%."
+        )
+        self.assertEqual(uncertain, {"moisture_min", "moisture_max"})
+
+
+class NamedNodeTests(SimpleTestCase):
+    FLEET = [
+        {"node_id": "a",      "node_name": "Node 1"},
+        {"node_id": "rpi_2",  "node_name": "Node 10"},
+        {"node_id": "rpi_20", "node_name": "Node A North"},
+        {"node_id": "x",      "node_name": "Node A"},
+    ]
+
+    def named(self, question):
+        return [node["node_id"] for node in IntentRouter._named_nodes(question, self.FLEET)]
+
+    def test_whole_words_only(self):
+        self.assertEqual(self.named("what is a moisture reading on Node 10"), ["rpi_2"])
+        self.assertEqual(self.named("rpi_20 moisture"), ["rpi_20"])
+
+    def test_longest_name_wins(self):
+        self.assertEqual(self.named("How is Node A North?"), ["rpi_20"])
+        self.assertEqual(self.named("compare node a and node 1"), ["a", "x"])
+
+
+class NodePriorityTests(SimpleTestCase):
+    @staticmethod
+    def node(moisture, **thresholds):
+        return {"node_id": "n1", "latest": {"moisture": moisture}, "thresholds": thresholds}
+
+    def moisture_score(self, node):
+        return NodePriorityService.score([node])[0, 0]
+
+    def test_both_bounds(self):
+        self.assertAlmostEqual(self.moisture_score(self.node(80, moisture_min=40, moisture_max=60)), 1.0)
+        self.assertEqual(self.moisture_score(self.node(50, moisture_min=40, moisture_max=60)), 0.0)
+
+    def test_min_only(self):
+        self.assertAlmostEqual(self.moisture_score(self.node(30, moisture_min=40)), 0.25)
+        self.assertEqual(self.moisture_score(self.node(50, moisture_min=40)), 0.0)
+
+    def test_max_only(self):
+        self.assertAlmostEqual(self.moisture_score(self.node(75, moisture_max=60)), 0.25)
+        self.assertEqual(self.moisture_score(self.node(50, moisture_max=60)), 0.0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def half_open_provider(self):
+        state = _Provider("test")
+        state.breaker = _CircuitBreaker(failures=1, cooldown=0)
+        state.breaker.record(False)
+        self.assertEqual(state.breaker.state, "open")
+        return state
+
+    def test_refused_trial_is_released(self):
+        state = self.half_open_provider()
+        with mock.patch.object(state.bucket, "acquire", return_value=False):
+            with self.assertRaises(LLMUnavailableError):
+                LLMGateway._admit(state)
+        self.assertEqual(state.breaker.state, "half_open")
+
+        # The trial is available again, and a success closes the breaker
+        LLMGateway._admit(state)
+        state.slots.release()
+        state.breaker.record(True)
+        self.assertEqual(state.breaker.state, "closed")
+
+    def test_abandoned_stream_records_the_trial(self):
+        state = self.half_open_provider()
+        client = mock.Mock()
+        client.chat.completions.create.return_value = iter(["a", "b"])
+        with mock.patch.object(LLMGateway, "client", return_value=client), \
+                mock.patch.dict(LLMGateway._providers, {"openai": state}):
+            stream = LLMGateway.chat_stream(model="test", messages=[])
+            self.assertEqual(next(stream), "a")
+            stream.close()
+        self.assertEqual(state.breaker.state, "closed")
+
+
+class LLMGatewayConfigTests(SimpleTestCase):
+    def test_zero_rate_means_unlimited(self):
+        bucket = _TokenBucket(rate=0, capacity=1)
+        self.assertTrue(all(bucket.acquire(timeout=0) for _ in range(5)))
+
+    def test_missing_key_gives_no_client(self):
+        with mock.patch.dict("os.environ", {"ANTHROPIC_API_KEY": "", "GOOGLE_API_KEY": ""}), \
+                mock.patch.dict(LLMGateway._clients, clear=True):
+            self.assertIsNone(LLMGateway.client("anthropic"))
+            self.assertIsNone(LLMGateway.client("gemini", "test-model"))
+            with self.assertRaises(LLMUnavailableError):
+                LLMGateway.complete("anthropic", "test-model", "hi")
+
+
+class TrimChunkTests(SimpleTestCase):
+    def test_chunk_without_sentence_breaks_is_cut_not_dropped(self):
+        table = "Nitrogen | 20 | 40 | mg/kg " * 200
+        results = PromptBuilder.rag_chunks("nitrogen", [{"text": table, "metadata": {}}] * 4, budget=400)
+        for res in results:
+            self.assertTrue(res["text"])
+            self.assertTrue(table.startswith(res["text"]))
+            self.assertLessEqual(PromptBuilder.count_tokens(res["text"]), 100)
+
+    def test_most_relevant_sentences_kept_in_order(self):
+        text = "Tomatoes like warm soil. Lettuce bolts in heat. Water tomatoes deeply at the roots."
+        trimmed = PromptBuilder.trim_chunk(text, "how should I water tomatoes", budget=16)
+        self.assertEqual(trimmed, "Tomatoes like warm soil. … Water tomatoes deeply at the roots.")
+
+
+class TempDirTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+
+@mock.patch.object(TextChunker, "_tokenizer_loaded", True)
+@mock.patch.object(TextChunker, "_tokenizer", None)
+class TextChunkerTests(SimpleTestCase):
+    TEXT = ("Tomatoes need warm soil. Keep the soil moist but not wet. "
+            "Feed every two weeks. Stake the plants early.")
+
+    def test_chunks_respect_the_token_budget_and_sentences(self):
+        chunks = list(TextChunker.iter_chunks([(1, self.TEXT)], max_tokens=12, overlap_tokens=0))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(chunk["tokens"], 12)
+            self.assertTrue(chunk["text"].endswith("."))
+            self.assertEqual(self.TEXT[chunk["char_start"]:chunk["char_end"]], chunk["text"])
+
+    def test_overlap_carries_trailing_sentences(self):
+        chunks = list(TextChunker.iter_chunks([(1, self.TEXT)], max_tokens=20, overlap_tokens=8))
+        self.assertTrue(chunks[1]["text"].startswith(chunks[0]["text"].split(". ")[-1]))
+
+    def test_table_rows_stay_whole_and_keep_their_page(self):
+        pages = [(1, "Soil targets."), (2, "Nitrogen | 20 | 40 | mg/kg\nPotassium | 150 | 250 | mg/kg")]
+        chunks = list(TextChunker.iter_chunks(pages, max_tokens=240))
+        self.assertEqual(len(chunks), 1)
+        self.assertIn("Nitrogen | 20 | 40 | mg/kg\nPotassium | 150 | 250 | mg/kg", chunks[0]["text"])
+        self.assertEqual((chunks[0]["page_start"], chunks[0]["page_end"]), (1, 2))
+
+
+class LexicalSearchTests(TempDirTestCase):
+    def test_bm25_ranks_matching_chunks_first(self):
+        index = LexicalIndex(os.path.join(self.tmp, "bm25.sqlite3"))
+        index.add_chunks([
+            ("a", "Nitrogen deficiency yellows older leaves.", {"crop_type": "tomato"}),
+            ("b", "Water tomatoes deeply twice a week.", {"crop_type": "tomato"}),
+            ("c", "Rice paddies need standing water.", {"crop_type": "rice"}),
+        ])
+        self.assertEqual([hit[0] for hit in index.search("nitrogen leaves", 3)], ["a"])
+        self.assertEqual([hit[0] for hit in index.search("water", 3, crop_type="rice")], ["c"])
+        index.remove_chunks(["a"])
+        self.assertEqual(index.search("nitrogen", 3), [])
+
+    def test_rrf_favours_chunks_both_rankers_found(self):
+        def hit(chunk_id, **extra):
+            return {"id": chunk_id, "text": chunk_id, "metadata": {}, "distance": None, **extra}
+
+        vector  = [hit("v1", distance=0.1), hit("both", distance=0.2)]
+        lexical = [hit("l1", bm25=3.0), hit("both", bm25=2.0)]
+        with mock.patch.object(RAGService, "_vector_search", return_value=vector), \
+                mock.patch.object(RAGService, "_lexical_search", return_value=lexical):
+            ranked = RAGService._hybrid_search("query", 3, ["general"])
+        self.assertEqual(ranked[0]["id"], "both")
+        self.assertEqual((ranked[0]["distance"], ranked[0]["bm25"]), (0.2, 2.0))
+        self.assertEqual({item["id"] for item in ranked[1:]}, {"v1", "l1"})
+
+
+class _FakeCollection:
+    """The slice of a Chroma collection store_pages uses."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, ids=None, where=None, include=None):
+        if ids is not None:
+            found = [i for i in ids if i in self.rows]
+        else:
+            found = [i for i, (_, meta) in self.rows.items()
+                     if all(meta.get(k) == v for k, v in (where or {}).items())]
+        return {"ids": found, "metadatas": [self.rows[i][1] for i in found]}
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        self.rows.update({i: (d, m) for i, d, m in zip(ids, documents, metadatas)})
+
+    def update(self, ids, metadatas):
+        self.rows.update({i: (self.rows[i][0], m) for i, m in zip(ids, metadatas)})
+
+    def delete(self, ids):
+        for i in ids:
+            self.rows.pop(i, None)
+
+
+@mock.patch.object(TextChunker, "_tokenizer_loaded", True)
+@mock.patch.object(TextChunker, "_tokenizer", None)
+class ReindexDiffTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.collection = _FakeCollection()
+        self.embedded = []
+        manifest = DocumentManifest(os.path.join(self.tmp, "manifest.sqlite3"))
+        lexical  = LexicalIndex(os.path.join(self.tmp, "bm25.sqlite3"))
+        for patcher in (
+            mock.patch.object(RAGService, "_get_collection", return_value=self.collection),
+            mock.patch.object(RAGService, "_get_manifest", return_value=manifest),
+            mock.patch.object(RAGService, "_get_lexical_index", return_value=lexical),
+            mock.patch.object(RAGService, "embed_texts", side_effect=self.embed),
+            mock.patch.object(RAGService, "invalidate_search_cache"),
+            mock.patch.object(RAGService, "EMBED_BATCH_SIZE", 1),
+            mock.patch.object(TextChunker, "MAX_TOKENS", 7),
+            mock.patch.object(TextChunker, "OVERLAP_TOKENS", 0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def embed(self, texts, hashes=None):
+        if any("FAIL" in text for text in texts):
+            raise RuntimeError("embedding backend down")
+        self.embedded.extend(texts)
+        return [[0.0] for _ in texts]
+
+    def store(self, *sentences):
+        return RAGService.store_pages([(1, " ".join(sentences))], "guide.pdf", "tomato")
+
+    def stored_texts(self):
+        return sorted(doc for doc, _ in self.collection.rows.values())
+
+    def test_only_changed_chunks_are_embedded_and_removed(self):
+        self.store("Tomatoes need warm soil.", "Keep soil moist.", "Stake plants early.")
+        self.embedded.clear()
+        result = self.store("Tomatoes need warm soil.", "Keep soil moist.", "Prune side shoots.")
+        self.assertEqual(self.embedded, ["Prune side shoots."])
+        self.assertEqual((result["unchanged"], result["removed"]), (2, 1))
+        self.assertEqual(self.stored_texts(), ["Keep soil moist.", "Prune side shoots.", "Tomatoes need warm soil."])
+
+    def test_chunks_from_a_failed_ingest_are_cleaned_up_next_time(self):
+        self.store("Tomatoes need warm soil.", "Keep soil moist.")
+        with self.assertRaises(RuntimeError):
+            self.store("Tomatoes need warm soil.", "Prune side shoots.", "FAIL here now.")
+        self.assertIn("Prune side shoots.", self.stored_texts())
+
+        self.store("Tomatoes need warm soil.")
+        self.assertEqual(self.stored_texts(), ["Tomatoes need warm soil."])
+
+
+class LLMCacheTests(TempDirTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = LLMCache(path=os.path.join(self.tmp, "llm.sqlite3"))
+        self.calls = 0
+
+    def call(self, response="answer"):
+        def _call():
+            self.calls += 1
+            return response
+        return _call
+
+    def test_hit_skips_the_call(self):
+        for _ in range(2):
+            self.assertEqual(self.cache.cached_call("m", "prompt", {"temperature": 0}, self.call()), "answer")
+        self.assertEqual(self.calls, 1)
+
+    def test_params_are_part_of_the_key(self):
+        self.cache.cached_call("m", "prompt", {"temperature": 0}, self.call())
+        self.cache.cached_call("m", "prompt", {"temperature": 0.7}, self.call())
+        self.assertEqual(self.calls, 2)
+
+    def test_bypass_always_calls(self):
+        self.cache.cached_call("m", "prompt", {}, self.call())
+        self.cache.cached_call("m", "prompt", {}, self.call(), bypass=True)
+        self.assertEqual(self.calls, 2)
+
+    def test_rejected_responses_are_not_stored(self):
+        self.cache.cached_call("m", "prompt", {}, self.call("not json"), validate=lambda r: r.startswith("{"))
+        self.cache.cached_call("m", "prompt", {}, self.call("{}"), validate=lambda r: r.startswith("{"))
+        self.assertEqual(self.calls, 2)
+
+
+class AnswerCacheTests(SimpleTestCase):
+    def setUp(self):
+        AnswerCache.clear()
+        self.addCleanup(AnswerCache.clear)
+        patcher = mock.patch.object(RAGService, "embed_query", return_value=[1.0, 0.0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, fingerprint="f1", entities="e1"):
+        _, vector = AnswerCache.lookup("how is my soil", "en", fingerprint, entities)
+        AnswerCache.store("how is my soil", "en", fingerprint, "Fine.", vector, entities)
+
+    def test_hit_for_same_farm_state_and_entities(self):
+        self.store()
+        self.assertEqual(AnswerCache.lookup("how's my soil", "en", "f1", "e1")[0], "Fine.")
+
+    def test_new_fingerprint_drops_stored_answers(self):
+        self.store()
+        self.assertIsNone(AnswerCache.lookup("how is my soil", "en", "f2", "e1")[0])
+        self.assertIsNone(AnswerCache.lookup("how is my soil", "en", "f1", "e1")[0])
+
+    def test_different_entities_or_language_miss(self):
+        self.store()
+        self.assertIsNone(AnswerCache.lookup("how is my soil", "en", "f1", "e2")[0])
+        self.assertIsNone(AnswerCache.lookup("how is my soil", "fil", "f1", "e1")[0])
+
+    def test_expired_answers_miss(self):
+        self.store()
+        with mock.patch.object(AnswerCache, "TTL", 0):
+            self.assertIsNone(AnswerCache.lookup("how is my soil", "en", "f1", "e1")[0])
+
+
+class StreamCleanerTests(SimpleTestCase):
+    def test_matches_batch_cleanup(self):
+        deltas = ["\n\n## Wat", "er ", "deeply.\n\n\n", "\n- Check ", "#moisture", " daily.\n\n"]
+        cleaner = _StreamCleaner()
+        streamed = "".join(cleaner.feed(delta) for delta in deltas)
+        self.assertEqual(streamed, AIChatService._clean_answer("".join(deltas)))
+        self.assertEqual(streamed, cleaner.text)
@@ -0,0 +1,205 @@
+# api/threshold_extractor.py
+import re
+import statistics
+
+
+class ThresholdExtractor:
+    """
+    Local, rule-based pass over a document for the threshold fields.
+
+    Most manuals state ranges plainly ("pH ranging from 5.5 to 6.5",
+    "soil temperature of 65–75°F", "nitrogen 20-40 mg/kg"), so a field
+    keyword followed directly by a unit-aware range is enough. Values have
+    to sit next to the keyword (only filler words like "of", "should be",
+    "optimum" in between) and may not be followed by a non-threshold unit
+    ("7 to 14 days", "5 to 10 plots"). One-sided statements ("above 35°C")
+    only count in a sentence that states a target ("keep", "optimum",
+    "should"), so "temperatures above 35°C reduce fruit set" isn't read as
+    a minimum.
+
+    Values backed only by one-sided statements, or by statements that
+    disagree, are reported as uncertain; RAGService lets the LLM check
+    those along with the fields left empty here.
+    """
+
+    # field → keyword pattern
+    KEYWORDS = {
+        "moisture":   r"(?:soil\s+)?moisture(?:\s+content)?|water\s+content|field\s+capacity",
+        "ph":         r"\bpH\b",
+        "temp":       r"(?:soil\s+|root[- ]zone\s+|growing\s+)?temperatures?",
+        "humidity":   r"(?:relative\s+)?humidity|\bRH\b",
+        "nitrogen":   r"nitrogen|\(N\)",
+        "phosphorus": r"phosphorus|phosphate|\(P\)",
+        "potassium":  r"potassium|potash|\(K\)",
+    }
+
+    # Units accepted per field (None = unitless); only pH is read without a unit
+    UNITS = {
+        "moisture":   {"%"},
+        "ph":         {None},
+        "temp":       {"C", "F"},
+        "humidity":   {"%"},
+        "nitrogen":   {"mg/kg", "ppm"},
+        "phosphorus": {"mg/kg", "ppm"},
+        "potassium":  {"mg/kg", "ppm"},
+    }
+
+    # Plausible values after conversion; anything else is a misread
+    LIMITS = {
+        "moisture":   (0, 100),
+        "ph":         (3, 10),
+        "temp":       (-5, 50),
+        "humidity":   (0, 100),
+        "nitrogen":   (0, 2000),
+        "phosphorus": (0, 2000),
+        "potassium":  (0, 2000),
+    }
+
+    # How far after the keyword a value may appear
+    WINDOW = 80
+
+    # Findings for one key further apart than this share of the field's
+    # LIMITS span are treated as disagreeing
+    AGREEMENT = 0.1
+
+    _NUM   = r"(\d+(?:\.\d+)?)"
+    _UNIT  = r"\s*(%|percent|°\s*[CF]\b|º\s*[CF]\b|degrees?\s*(?:celsius|fahrenheit|[CF]\b)|mg\s*/\s*kg|ppm)?"
+    # Words allowed between the keyword and its value ("pH should be kept between …")
+    _LEAD  = (
+        r"(?:\s*(?:[,:(]|(?:levels?|values?|should|must|be|is|are|of|at|in|the|for|range|ranges|ranging|"
+        r"from|between|optimum|optimal|ideal|preferred|best|around|about|approximately|kept|"
+        r"maintained|within|content|requirements?)\b))*\s*"
+    )
+    _RANGE = re.compile(
+        _LEAD + _NUM + _UNIT + r"\s*(?:-|–|—|to|and)\s*" + _NUM + _UNIT,
+        re.IGNORECASE,
+    )
+    _LOWER = re.compile(
+        _LEAD + r"(?:above|over|at\s+least|minimum\s+(?:of\s+)?|not\s+(?:less|lower)\s+than|more\s+than|>=?|≥)\s*"
+        + _NUM + _UNIT,
+        re.IGNORECASE,
+    )
+    _UPPER = re.compile(
+        _LEAD + r"(?:below|under|at\s+most|maximum\s+(?:of\s+)?|not\s+(?:more|higher)\s+than|(?:should\s+)?not\s+exceed|less\s+than|<=?|≤)\s*"
+        + _NUM + _UNIT,
+        re.IGNORECASE,
+    )
+    # A number followed by one of these is a duration, size, count or rate, not a threshold
+    _OTHER_UNIT = re.compile(
+        r"\s*(?:of\s+)?(?:days?|weeks?|months?|years?|yrs?|hours?|hrs?|h|minutes?|mins?|"
+        r"cm|mm|m|meters?|metres?|inches|ft|feet|kg|g|t|tons?|tonnes?|ha|hectares?|acres?|"
+        r"plots?|plants?|seeds?|trees?|rows?|times|cycles?|replicates?|samples?|"
+        r"l|liters?|litres?|ml|DM|dry\s+matter)\b",
+        re.IGNORECASE,
+    )
+    # A one-sided bound is only a target when the sentence says so
+    _TARGET_CUE = re.compile(
+        r"\b(?:optimum|optimal|ideal|best|preferred|recommended|suitable|should|must|keep|kept|"
+        r"maintain(?:ed)?|requires?|needs?|thrives?)\b",
+        re.IGNORECASE,
+    )
+
+    _keyword_patterns = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in KEYWORDS.items()}
+
+    # ─────────────────────── PARSING ───────────────────────
+
+    @staticmethod
+    def _unit(raw):
+        if not raw:
+            return None
+        raw = raw.lower().replace(" ", "")
+        if raw in ("%", "percent"):
+            return "%"
+        if raw in ("mg/kg", "ppm"):
+            return raw
+        if raw.endswith("f") or "fahrenheit" in raw:
+            return "F"
+        return "C"
+
+    @classmethod
+    def _convert(cls, field, value, unit):
+        if field == "temp" and unit == "F":
+            return round((value - 32) * 5 / 9, 1)
+        return value
+
+    @classmethod
+    def _accept(cls, field, unit):
+        return unit in cls.UNITS[field]
+
+    @classmethod
+    def _in_limits(cls, field, *values):
+        low, high = cls.LIMITS[field]
+        return all(low <= v <= high for v in values)
+
+    @classmethod
+    def _scan_field(cls, field, text):
+        """Yield ("range", lo, hi) / ("min", v) / ("max", v) findings for one field."""
+        for keyword in cls._keyword_patterns[field].finditer(text):
+            window = text[keyword.end():keyword.end() + cls.WINDOW]
+            # Don't read past the next sentence or into another field's keyword
+            window = re.split(r"(?<=[.;])\s+[A-Z]|\n\s*\n", window, maxsplit=1)[0]
+
+            found = cls._RANGE.match(window)
+            if found and not cls._OTHER_UNIT.match(window, found.end()):
+                lo, lo_unit, hi, hi_unit = found.groups()
+                unit = cls._unit(hi_unit) or cls._unit(lo_unit)
+                if cls._accept(field, unit):
+                    lo, hi = cls._convert(field, float(lo), unit), cls._convert(field, float(hi), unit)
+                    if cls._in_limits(field, lo, hi):
+                        yield ("range", min(lo, hi), max(lo, hi))
+                        continue
+
+            head = re.split(r"(?<=[.;!?])\s+|\n", text[max(0, keyword.start() - cls.WINDOW):keyword.start()])[-1]
+            if not cls._TARGET_CUE.search(head + keyword.group() + window):
+                continue
+            for kind, pattern in (("min", cls._LOWER), ("max", cls._UPPER)):
+                found = pattern.match(window)
+                if found and not cls._OTHER_UNIT.match(window, found.end()):
+                    unit = cls._unit(found.group(2))
+                    value = cls._convert(field, float(found.group(1)), unit)
+                    if cls._accept(field, unit) and cls._in_limits(field, value):
+                        yield (kind, value)
+
+    # ─────────────────────── PUBLIC ───────────────────────
+
+    @classmethod
+    def extract_with_confidence(cls, text):
+        """
+        ({field_min/field_max: number}, {keys that are uncertain}).
+        Several statements of the same field are merged by median; a key is
+        uncertain when no range backs it or its statements disagree.
+        """
+        result, uncertain = {}, set()
+        for field in cls.KEYWORDS:
+            mins, maxs, ranged = [], [], False
+            for finding in cls._scan_field(field, text):
+                if finding[0] == "range":
+                    mins.append(finding[1])
+                    maxs.append(finding[2])
+                    ranged = True
+                elif finding[0] == "min":
+                    mins.append(finding[1])
+                else:
+                    maxs.append(finding[1])
+            low, high = cls.LIMITS[field]
+            for suffix, values in (("min", mins), ("max", maxs)):
+                if not values:
+                    continue
+                key = f"{field}_{suffix}"
+                result[key] = round(statistics.median(values), 2)
+                if not ranged or max(values) - min(values) > cls.AGREEMENT * (high - low):
+                    uncertain.add(key)
+            if mins and maxs and result[f"{field}_min"] > result[f"{field}_max"]:
+                result[f"{field}_min"], result[f"{field}_max"] = result[f"{field}_max"], result[f"{field}_min"]
+                uncertain.update((f"{field}_min", f"{field}_max"))
+        return result, uncertain
+
+    @classmethod
+    def extract(cls, text):
+        """Return {field_min/field_max: number} for every value found."""
+        return cls.extract_with_confidence(text)[0]
+
+    @classmethod
+    def mentions(cls, text, fields):
+        """The subset of threshold fields whose keyword appears in the text at all."""
+        return [f for f in fields if cls._keyword_patterns[f.rsplit("_", 1)[0]].search(text)]
@@ -12,6 +12,7 @@ from .views import (
     CropProfileDetailView,
     AssignCropToNodeView,
     AIStatusView,
+    HealthView,
     NodeConnectivityCheckView,
     NodeComparisonView,
     DocumentProcessingStatusView
@@ -39,9 +40,11 @@ urlpatterns = [
 
     # ── Utilities ──
     path('ai-status/', AIStatusView.as_view(), name='ai-status'),
+    path('health/', HealthView.as_view(), name='health'),
     path('check-connectivity/', NodeConnectivityCheckView.as_view(), name='check-connectivity'),
     path('compare-nodes/', NodeComparisonView.as_view(), name='compare-nodes'),
     
-    # Document processing status
-    path('document-status/<str:document_name>/', DocumentProcessingStatusView.as_view(), name='processing-status'),
+    # Document processing status / ingestion jobs
+    path('document-status/jobs/<str:job_id>/', DocumentProcessingStatusView.as_view(), name='ingestion-job-status'),
+    path('document-status/<str:crop_type>/', DocumentProcessingStatusView.as_view(), name='processing-status'),
 ]
\ No newline at end of file
@@ -0,0 +1,251 @@
+# api/vector_service.py
+import os
+import json
+import queue
+import socket
+import struct
+import threading
+import socketserver
+from concurrent.futures import Future
+
+
+DEFAULT_SOCKET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vector_service.sock")
+
+_HEADER = struct.Struct(">I")   # 4-byte big-endian body length
+
+
+def _jsonable(value):
+    """Chroma hands back numpy arrays for embeddings; JSON wants lists."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _send(sock, payload):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        part = sock.recv(size - len(data))
+        if not part:
+            raise ConnectionError("vector service connection closed")
+        data.extend(part)
+    return bytes(data)
+
+
+def _recv(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# ─────────────────────── SERVER ───────────────────────
+
+class _EmbedBatcher:
+    """
+    Collects embed requests from all connections for a few milliseconds and
+    runs them through the ONNX model as one batch.
+    """
+
+    WINDOW_SECONDS = float(os.getenv("VECTOR_SERVICE_BATCH_WINDOW_MS", 5)) / 1000
+    MAX_TEXTS      = int(os.getenv("VECTOR_SERVICE_BATCH_MAX", 128))
+
+    def __init__(self, embedding_function):
+        self._ef      = embedding_function
+        self._pending = queue.Queue()
+        self.batches  = 0
+        self.texts    = 0
+        threading.Thread(target=self._loop, name="vector-embed-batcher", daemon=True).start()
+
+    def embed(self, texts):
+        future = Future()
+        self._pending.put((list(texts), future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            requests = [self._pending.get()]
+            count = len(requests[0][0])
+            try:
+                while count < self.MAX_TEXTS:
+                    texts, future = self._pending.get(timeout=self.WINDOW_SECONDS)
+                    requests.append((texts, future))
+                    count += len(texts)
+            except queue.Empty:
+                pass
+
+            try:
+                vectors = self._ef([t for texts, _ in requests for t in texts])
+                vectors = [[float(x) for x in v] for v in vectors]
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts   += count
+            offset = 0
+            for texts, future in requests:
+                future.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+class VectorServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Single process that owns the ChromaDB client and the embedding model.
+    Django workers talk to it through RemoteCollection / RemoteEmbeddingFunction.
+
+    Request:  {"op": str, "partition": str?, "args": {...}}
+    Response: {"ok": true, "result": ...} | {"ok": false, "error": str}
+
+    Reads run concurrently; writes (upsert/update/delete) are serialized.
+    """
+
+    daemon_threads     = True
+    # Every worker thread holds its own connection; the default backlog of 5 refuses bursts
+    request_queue_size = socket.SOMAXCONN
+    READ_OPS  = {"count", "get", "query"}
+    WRITE_OPS = {"upsert", "update", "delete"}
+
+    def __init__(self, socket_path, rag_service):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.socket_path = socket_path
+        self.rag         = rag_service
+        self.write_lock  = threading.Lock()
+        self.batcher     = _EmbedBatcher(rag_service._get_embedding_function())
+        super().__init__(socket_path, _VectorRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def dispatch(self, request):
+        op, args = request.get("op"), request.get("args") or {}
+
+        if op == "ping":
+            return {"pid": os.getpid(), **self.stats()}
+        if op == "embed":
+            return self.batcher.embed(args["texts"])
+        if op == "list_partitions":
+            return self.rag.list_partitions()
+
+        collection = self.rag._get_collection(request.get("partition") or "general")
+        if op in self.READ_OPS:
+            return _jsonable(getattr(collection, op)(**args))
+        if op in self.WRITE_OPS:
+            with self.write_lock:
+                return _jsonable(getattr(collection, op)(**args))
+        raise ValueError(f"Unknown vector service op: {op}")
+
+    def stats(self):
+        return {
+            "embed_batches": self.batcher.batches,
+            "embed_texts":   self.batcher.texts,
+            "partitions":    self.rag.list_partitions(),
+        }
+
+
+class _VectorRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                request = _recv(self.request)
+            except (ConnectionError, OSError):
+                return
+            try:
+                response = {"ok": True, "result": self.server.dispatch(request)}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                _send(self.request, response)
+            except OSError:
+                return
+
+
+# ─────────────────────── CLIENT ───────────────────────
+
+class VectorServiceClient:
+    """One persistent socket per thread; reconnects once if the service restarted."""
+
+    TIMEOUT = float(os.getenv("VECTOR_SERVICE_TIMEOUT", 60))
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._local      = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.TIMEOUT)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise RuntimeError(
+                f"Vector service not reachable at {self.socket_path} ({e}). "
+                f"Start it with: python manage.py run_vector_service"
+            )
+        self._local.sock = sock
+        return sock
+
+    def call(self, op, partition=None, **args):
+        request = {"op": op, "partition": partition, "args": args}
+        for attempt in (1, 2):
+            sock = getattr(self._local, "sock", None) or self._connect()
+            try:
+                _send(sock, request)
+                response = _recv(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt == 2:
+                    raise
+        if not response["ok"]:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+
+class RemoteCollection:
+    """The subset of chromadb's Collection API that RAGService uses, proxied to the service."""
+
+    def __init__(self, client, partition):
+        self._client   = client
+        self.partition = partition
+
+    def _call(self, op, **args):
+        return self._client.call(op, partition=self.partition, **args)
+
+    def count(self):
+        return self._call("count")
+
+    def get(self, **kwargs):
+        return self._call("get", **kwargs)
+
+    def query(self, **kwargs):
+        return self._call("query", **kwargs)
+
+    def upsert(self, **kwargs):
+        return self._call("upsert", **_jsonable(kwargs))
+
+    def update(self, **kwargs):
+        return self._call("update", **kwargs)
+
+    def delete(self, **kwargs):
+        return self._call("delete", **kwargs)
+
+
+class RemoteEmbeddingFunction:
+    def __init__(self, client):
+        self._client = client
+
+    def __call__(self, texts):
+        return self._client.call("embed", texts=list(texts))
@@ -1,16 +1,24 @@
 # api/views.py — Complete file with Knowledge Library endpoints
 
+import os
+import json
+import hashlib
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from config.firebase import db
 from .services import IoTService
 from .ai_service import AIChatService
 from .rag_service import RAGService
-from datetime import datetime, timezone
 from .knowledge_library_service import KnowledgeLibraryService
+from .ingestion_jobs import IngestionJobService
+from .fleet_context import FleetContextService
+from .answer_cache import AnswerCache
+from .intent_router import IntentRouter
+from .node_priority import NodePriorityService
+from .llm_gateway import LLMGateway
 
 # ─────────────────────── EXISTING VIEWS ───────────────────────
 
@@ -33,10 +41,31 @@ class SensorDataReceiver(APIView):
 
 
 class ChatbotView(APIView):
+    def get(self, request):
+        # Context gathering timings (fleet / rag / alerts), answer cache hit rate, routed intents,
+        # cached vs uncached input tokens and LLM gateway stats for this worker
+        return Response({
+            "context_stats": AIChatService.context_stats(),
+            "answer_cache":  AnswerCache.stats(),
+            "intents":       IntentRouter.stats(),
+            "token_usage":   AIChatService.usage_stats(),
+            "llm_gateway":   LLMGateway.stats(),
+        })
+
     def post(self, request):
         question = request.data.get('question')
         if not question:
             return Response({"error": "No question provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if request.data.get('stream'):
+            # Server-sent events: token events as the model writes, then done (with the guardrail verdict) or error
+            def events():
+                for event in AIChatService.stream_agronomist(question):
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+            response = StreamingHttpResponse(events(), content_type="text/event-stream")
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
         try:
             answer = AIChatService.ask_agronomist(question)
             return Response({"question": question, "answer": answer, "model": "gpt-4o-mini (OpenAI)"})
@@ -44,8 +73,28 @@ class ChatbotView(APIView):
             return Response({"error": f"AI service error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+def _save_upload_with_hash(file):
+    """
+    Stream an uploaded file to temp storage, hashing the bytes as they go by.
+    Returns (storage_path, full_path, sha256_hex, size_in_bytes).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    file_path = default_storage.get_available_name(f'temp/{file.name}')
+    full_path = default_storage.path(file_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    with open(full_path, 'wb') as out:
+        for chunk in file.chunks():
+            hasher.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+
+    return file_path, full_path, hasher.hexdigest(), size
+
+
 class UploadDocumentView(APIView):
-    """Upload document → extracts thresholds → saves to crop profile library"""
+    """Upload document → queue ingestion job (extract → chunk → embed → thresholds → profile)"""
 
     def post(self, request):
         if 'file' not in request.FILES:
@@ -59,112 +108,43 @@ class UploadDocumentView(APIView):
         if not crop_type:
             return Response({"error": "crop_type is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # ✨ CHECK IF DOCUMENT ALREADY PROCESSED
-        if RAGService.is_document_processed(document_name, crop_type):
-            print(f"⚠️ Document '{document_name}' already processed - skipping threshold extraction")
-            
-            # Still store in ChromaDB for search updates
-            file_path = default_storage.save(f'temp/{file.name}', ContentFile(file.read()))
-            full_path = default_storage.path(file_path)
-            
-            try:
-                # Extract text
-                file_ext = file.name.split('.')[-1].lower()
-                
-                if file_ext == 'pdf':
-                    text = RAGService.extract_text_from_pdf(full_path)
-                elif file_ext == 'docx':
-                    text = RAGService.extract_text_from_docx(full_path)
-                elif file_ext == 'txt':
-                    text = RAGService.extract_text_from_txt(full_path)
-                else:
-                    raise ValueError(f"Unsupported file type: {file_ext}")
-                
-                # Store in ChromaDB only
-                store_result = RAGService.store_document(text, document_name, crop_type)
-                
-                # Get existing thresholds
-                crop_id = crop_type.lower().replace(" ", "_")
-                existing_profile = db.collection("crop_profiles").document(crop_id).get()
-                existing_thresholds = existing_profile.to_dict().get("thresholds") if existing_profile.exists else None
-                
-                default_storage.delete(file_path)
-                
-                return Response({
-                    "message": f"Document already processed - using existing thresholds",
-                    "document_name": document_name,
-                    "chunks_created": store_result.get("chunks", 0),
-                    "crop_type": crop_type,
-                    "thresholds_extracted": False,
-                    "thresholds": existing_thresholds,
-                    "already_processed": True,
-                    "status": "success"
-                })
-                
-            except Exception as e:
-                if default_storage.exists(file_path):
-                    default_storage.delete(file_path)
-                return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        file_path, full_path, content_hash, file_size = _save_upload_with_hash(file)
+
+        # ✨ CHECK IF THESE EXACT BYTES WERE ALREADY PROCESSED (name-independent)
+        existing = RAGService.find_processed_document(content_hash, crop_type)
+        if existing:
+            default_storage.delete(file_path)
+            return Response({
+                "message": "Document already processed - using existing thresholds",
+                "document_name": existing.get("document_name", document_name),
+                "chunks_created": existing.get("chunks", 0),
+                "crop_type": crop_type,
+                "thresholds_extracted": False,
+                "thresholds": existing.get("thresholds"),
+                "content_hash": content_hash,
+                "already_processed": True,
+                "status": "success"
+            })
 
-        # ✨ DOCUMENT NOT PROCESSED - PROCEED WITH FULL EXTRACTION
-        print(f"🔄 Processing '{document_name}' for the first time...")
-        
-        file_path = default_storage.save(f'temp/{file.name}', ContentFile(file.read()))
-        full_path = default_storage.path(file_path)
+        # ✨ NEW CONTENT - QUEUE FULL EXTRACTION IN THE BACKGROUND
+        print(f"🔄 Queueing '{document_name}' ({content_hash[:12]}) for processing...")
 
         try:
-            # Extract text
-            file_ext = file.name.split('.')[-1].lower()
-            
-            if file_ext == 'pdf':
-                text = RAGService.extract_text_from_pdf(full_path)
-            elif file_ext == 'docx':
-                text = RAGService.extract_text_from_docx(full_path)
-            elif file_ext == 'txt':
-                text = RAGService.extract_text_from_txt(full_path)
-            else:
-                raise ValueError(f"Unsupported file type: {file_ext}")
-            
-            if not text.strip():
-                raise ValueError("No text content found in document")
-            
-            # Store in ChromaDB
-            store_result = RAGService.store_document(text, document_name, crop_type)
-            
-            # ✨ EXTRACT THRESHOLDS (ONLY HAPPENS ONCE)
-            extracted_thresholds = RAGService.extract_thresholds_from_text(text, crop_type)
-            
-            # Save to Knowledge Library with processing status
-            KnowledgeLibraryService.save_crop_profile(
-                crop_type=crop_type,
-                thresholds=extracted_thresholds,
-                document_name=document_name,
-                description=description
+            job = IngestionJobService.submit(
+                file_path, full_path, file.name.split('.')[-1],
+                document_name, crop_type, description,
+                content_hash=content_hash, file_size=file_size,
             )
-            
-            # Also save to crop_config
-            if extracted_thresholds:
-                crop_id = crop_type.lower().replace(" ", "_")
-                threshold_doc = {
-                    **extracted_thresholds,
-                    "source_document": document_name,
-                    "updated_at": datetime.now(),
-                    "is_active": True,
-                }
-                db.collection("crop_config").document(crop_id).set(threshold_doc, merge=True)
-            
-            default_storage.delete(file_path)
-
             return Response({
-                "message": f"Document uploaded and processed for '{crop_type.title()}' crop profile",
+                "message": f"Document queued for processing into '{crop_type.title()}' crop profile",
+                "job_id": job["job_id"],
                 "document_name": document_name,
-                "chunks_created": store_result.get("chunks", 0),
                 "crop_type": crop_type,
-                "thresholds_extracted": extracted_thresholds is not None and len(extracted_thresholds) > 0,
-                "thresholds": extracted_thresholds,
+                "content_hash": content_hash,
                 "already_processed": False,
-                "status": "success"
-            })
+                "status": "queued",
+                "status_url": f"/api/v1/document-status/jobs/{job['job_id']}/"
+            }, status=status.HTTP_202_ACCEPTED)
 
         except Exception as e:
             if default_storage.exists(file_path):
@@ -187,26 +167,47 @@ class DeleteDocumentView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 class SearchKnowledgeView(APIView):
+    MAX_RESULTS = 20
+
+    def get(self, request):
+        """Query-embedding and search-result cache hit rates"""
+        return Response({"cache": RAGService.cache_stats()})
+
     def post(self, request):
         query = request.data.get('query')
         crop_type = request.data.get('crop_type')
-        n_results = request.data.get('n_results', 3)
+        mode = request.data.get('mode', RAGService.SEARCH_MODE)
         if not query:
             return Response({"error": "Query is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if mode not in RAGService.SEARCH_MODES:
+            return Response({"error": f"mode must be one of {', '.join(RAGService.SEARCH_MODES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
         try:
-            filter_metadata = {"crop_type": crop_type.lower()} if crop_type else None
-            results = RAGService.search_knowledge(query, n_results, filter_metadata)
-            return Response({"query": query, "results": results})
+            try:
+                n_results = int(request.data.get('n_results', 3))
+            except (TypeError, ValueError):
+                return Response({"error": "n_results must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+            # Bounded so a client can't pull the whole collection or flood the search cache
+            n_results = max(1, min(n_results, self.MAX_RESULTS))
+            results = RAGService.search_knowledge(query, n_results, crop_type.lower() if crop_type else None, mode=mode)
+            return Response({"query": query, "mode": mode, "results": results})
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 # ─────────────────────── DOCUMENT PROCESSING VIEW ───────────────────────
 class DocumentProcessingStatusView(APIView):
-    """Check which documents have been processed for a crop"""
+    """Check which documents have been processed for a crop, or the status of one ingestion job"""
     
-    def get(self, request, crop_type):
+    def get(self, request, crop_type=None, job_id=None):
         try:
+            if job_id:
+                job = IngestionJobService.get_job(job_id)
+                if not job:
+                    return Response({"error": f"Job '{job_id}' not found"}, status=status.HTTP_404_NOT_FOUND)
+                return Response({"job": job})
+
             crop_id = crop_type.lower().replace(" ", "_")
+            jobs = IngestionJobService.get_jobs_for_crop(crop_type)
             
             # Check crop_config
             config_doc = db.collection("crop_config").document(crop_id).get()
@@ -225,13 +226,15 @@ class DocumentProcessingStatusView(APIView):
                             "thresholds_found": doc_info.get("thresholds_found", False)
                         }
                         for doc_name, doc_info in processed_docs.items()
-                    ]
+                    ],
+                    "jobs": jobs
                 })
             
             return Response({
                 "crop_type": crop_type,
                 "total_documents": 0,
                 "processed_documents": [],
+                "jobs": jobs,
                 "message": "No processed documents found"
             })
             
@@ -300,7 +303,8 @@ class AssignCropToNodeView(APIView):
                 # Update the found document
                 for doc in query:
                     doc.reference.set({"crop_type": crop_type}, merge=True)
-                    
+
+            FleetContextService.update_node(node_id, crop_type=crop_type)
             IoTService.recalculate_alerts_for_node(node_id)
             
             return Response({
@@ -328,6 +332,17 @@ class AIStatusView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class HealthView(APIView):
+    def get(self, request):
+        rag = RAGService.readiness()
+        if rag["status"] in ("cold", "failed"):
+            # Probed before anything loaded (or after a failed warm-up): start
+            # warming so a later probe can pass
+            RAGService.start_warm_up()
+        code = status.HTTP_200_OK if rag["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+        return Response({"status": "ok" if rag["ready"] else rag["status"], "rag": rag}, status=code)
+
+
 class NodeConnectivityCheckView(APIView):
     def post(self, request):
         try:
@@ -340,7 +355,15 @@ class NodeConnectivityCheckView(APIView):
 class NodeComparisonView(APIView):
     def get(self, request):
         try:
-            comparison = AIChatService.get_node_comparison()
-            return Response({"comparison": comparison})
+            # ?phrase=true has GPT reword the computed ranking; ?refresh=true skips its cached wording
+            refresh = request.query_params.get("refresh", "").lower() == "true"
+            phrase  = request.query_params.get("phrase")
+            ranking = NodePriorityService.rank()
+            comparison = AIChatService.get_node_comparison(
+                use_cache=not refresh,
+                phrase=None if phrase is None else phrase.lower() == "true",
+                ranking=ranking,
+            )
+            return Response({"comparison": comparison, "ranking": ranking})
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
@@ -56,16 +56,53 @@ export default function Chatbot() {
       const res = await fetch(`${API_BASE}/chat/`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ question: userMsg.text, language: language })
+        body: JSON.stringify({ question: userMsg.text, language: language, stream: true })
       });
-      
-      const data = await res.json();
-      
-      setMessages(prev => [...prev, { 
-        role: 'assistant', 
-        text: data.answer,
-        model: data.model
-      }]);
+
+      if (!(res.headers.get('Content-Type') || '').includes('text/event-stream')) {
+        const data = await res.json();
+        setMessages(prev => [...prev, { 
+          role: 'assistant', 
+          text: data.answer || data.error,
+          model: data.model
+        }]);
+        return;
+      }
+
+      // Streamed answer: grow the last assistant message as tokens arrive
+      setMessages(prev => [...prev, { role: 'assistant', text: '', model: 'gpt-4o-mini (OpenAI)' }]);
+      const setAnswer = (update) => setMessages(prev => {
+        const next = [...prev];
+        const last = next[next.length - 1];
+        next[next.length - 1] = { ...last, text: update(last.text) };
+        return next;
+      });
+
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const dataLine = raw.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const event = JSON.parse(dataLine.slice(6));
+
+          if (event.type === 'token') {
+            setAnswer(text => text + event.text);
+          } else if (event.type === 'done') {
+            // Guardrail verdict comes last; a failed check replaces what was streamed
+            setAnswer(() => event.answer);
+          } else if (event.type === 'error') {
+            setAnswer(() => event.message);
+          }
+        }
+      }
     } catch (err) {
       const errorMsg = language === 'fil' 
         ? "Error sa pag-connect sa AI. Siguruhing tumatakbo ang server."
@@ -145,7 +182,7 @@ export default function Chatbot() {
 
           {/* Chat Messages */}
           <div className="flex-1 overflow-y-auto p-4 space-y-3 bg-gray-50">
-            {messages.map((msg, idx) => (
+            {messages.map((msg, idx) => msg.text !== '' && (
               <div key={idx} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
                 <div className={`whitespace-pre-wrap max-w-[85%] p-3 rounded-xl text-sm ${
                   msg.role === 'user' 
@@ -161,7 +198,7 @@ export default function Chatbot() {
                 </div>
               </div>
             ))}
-            {loading && (
+            {loading && !(messages[messages.length - 1].role === 'assistant' && messages[messages.length - 1].text) && (
               <div className="flex justify-start">
                 <div className="bg-white border border-gray-200 p-3 rounded-xl text-sm text-gray-500">
                   <div className="flex gap-1">
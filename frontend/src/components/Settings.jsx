@@ -8,6 +8,8 @@ import {
 import { useLanguage } from '../contexts/LanguageContext';
 
 const API_BASE = 'http://127.0.0.1:8000/api/v1';
+const INGESTION_POLL_INTERVAL_MS = 2000;
+const INGESTION_POLL_TIMEOUT_MS = 15 * 60 * 1000; // give up polling after 15 minutes
 
 export default function Settings() {
   const { language, setLanguage, t } = useLanguage();
@@ -70,6 +72,18 @@ export default function Settings() {
     window.pendingFile = file;
   };
 
+  const waitForIngestionJob = async (jobId) => {
+    const deadline = Date.now() + INGESTION_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, INGESTION_POLL_INTERVAL_MS));
+      const res = await fetch(`${API_BASE}/document-status/jobs/${jobId}/`);
+      const data = await res.json();
+      if (!res.ok) throw new Error(data.error || 'Could not read job status');
+      if (data.job.status === 'completed' || data.job.status === 'failed') return data.job;
+    }
+    throw new Error('Document processing is taking too long. Check the Knowledge Library again later.');
+  };
+
   const confirmUpload = async () => {
     const cropType = document.getElementById('crop-type-input').value.trim();
     const description = document.getElementById('description-input').value.trim();
@@ -101,16 +115,30 @@ export default function Settings() {
       });
       const data = await res.json();
 
-      if (res.ok) {
+      if (!res.ok) {
+        showNotification('error', data.error || 'Upload failed');
+        return;
+      }
+
+      if (data.already_processed) {
         showNotification(
           'success',
-          `"${cropType}" - Document already processed. Used existing thresholds. Created ${data.chunks_created} search chunks.`
+          `"${cropType}" - Document already processed. Used existing thresholds (${data.chunks_created} search chunks).`
         );
-        loadCropProfiles(); // Refresh library
-        setActiveTab('library'); // Switch to library view
       } else {
-        showNotification('error', data.error || 'Upload failed');
+        // Processing runs in the background — poll the job until it finishes
+        const job = await waitForIngestionJob(data.job_id);
+        if (job.status === 'failed') {
+          showNotification('error', job.error || 'Document processing failed');
+          return;
+        }
+        showNotification(
+          'success',
+          `"${cropType}" - Document processed. Created ${job.result?.chunks_created ?? 0} search chunks.`
+        );
       }
+      loadCropProfiles(); // Refresh library
+      setActiveTab('library'); // Switch to library view
     } catch (err) {
       showNotification('error', `Upload error: ${err.message}`);
     } finally {